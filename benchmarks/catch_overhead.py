@@ -0,0 +1,115 @@
+"""Measure what @diagnoser.catch and diagnoser.guard() add to calls that don't raise.
+
+Each case is timed decorated and undecorated. The trivial function shows the
+fixed per-call cost; the handler-sized function (about a microsecond of work)
+shows what that cost means for a typical hot request handler.
+
+Usage:
+    python benchmarks/catch_overhead.py --output catch.json
+    python benchmarks/catch_overhead.py --max-overhead-pct 5   # exit 1 if the handler case exceeds 5%
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_catcher import LLMExceptionDiagnoser, Settings  # noqa: E402
+
+
+def trivial(x, y=1):
+    return x + y
+
+
+def handler(request, *, scale=2):
+    return sorted((value * scale for value in request), reverse=True)[:5]
+
+
+def generator(n):
+    yield from range(n)
+
+
+class Service:
+    def method(self, x):
+        return x + 1
+
+
+REQUEST = list(range(40))
+
+
+def _case(plain, decorated, number: int, repeat: int = 9) -> dict:
+    """Time both variants in alternating rounds, so drift affects them equally, keeping the best of each."""
+    plain_s = decorated_s = float("inf")
+    for _ in range(repeat):
+        plain_s = min(plain_s, timeit.timeit(plain, number=number) / number)
+        decorated_s = min(decorated_s, timeit.timeit(decorated, number=number) / number)
+    overhead = decorated_s - plain_s
+    return {
+        "plain_ns": round(plain_s * 1e9, 1),
+        "decorated_ns": round(decorated_s * 1e9, 1),
+        "overhead_ns": round(overhead * 1e9, 1),
+        "overhead_pct": round(overhead / plain_s * 100, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="Calls per timing repeat")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    parser.add_argument("--max-overhead-pct", type=float, help="Fail if the handler case overhead exceeds this")
+    args = parser.parse_args()
+
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(), global_handler=False)
+    from loguru import logger
+    logger.remove()
+    n = args.number
+
+    caught_trivial = diagnoser.catch(trivial)
+    caught_handler = diagnoser.catch(handler)
+    caught_generator = diagnoser.catch(generator)
+
+    class CaughtService:
+        method = diagnoser.catch(Service.method)
+
+    async def coroutine(x):
+        return x + 1
+
+    caught_coroutine = diagnoser.catch(coroutine)
+
+    def guarded(x, y=1):
+        with diagnoser.guard():
+            return x + y
+
+    def drive(coro):
+        try:
+            coro.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+    service, caught_service = Service(), CaughtService()
+    results = {
+        "benchmark": "catch_overhead",
+        "python": sys.version.split()[0],
+        "trivial": _case(lambda: trivial(1), lambda: caught_trivial(1), n),
+        "trivial_kwargs": _case(lambda: trivial(1, y=2), lambda: caught_trivial(1, y=2), n),
+        "handler": _case(lambda: handler(REQUEST), lambda: caught_handler(REQUEST), n // 10),
+        "method": _case(lambda: service.method(1), lambda: caught_service.method(1), n),
+        "generator": _case(lambda: sum(generator(10)), lambda: sum(caught_generator(10)), n // 10),
+        "coroutine": _case(lambda: drive(coroutine(1)), lambda: drive(caught_coroutine(1)), n),
+        "guard": _case(lambda: trivial(1), lambda: guarded(1), n),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.max_overhead_pct is not None and results["handler"]["overhead_pct"] > args.max_overhead_pct:
+        print(f"catch overhead regression: {results['handler']['overhead_pct']}% > {args.max_overhead_pct}%",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Local stand-in for an LLM server speaking the OpenAI and Ollama chat APIs.
+
+Replies are canned, but latency, token rate and failures are configurable, so the
+diagnoser's real clients can be benchmarked and tested without a model.
+
+Usage:
+    python benchmarks/mock_server.py --port 11435 --latency 0.2 --token-rate 50 --failure-rate 0.05
+
+Then point LLM Catcher at it with LLM_CATCHER_BASE_URL=http://127.0.0.1:11435 (Ollama) or
+http://127.0.0.1:11435/v1 (OpenAI).
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+
+REPLY = (
+    "The error occurred in app.py on line 12: a ZeroDivisionError was raised because the divisor was zero. "
+    "Check the input before dividing, or handle the zero case explicitly."
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.requests <= config.fail_first or config.rng.random() < config.failure_rate
+        time.sleep(config.failure_latency if fail and config.failure_latency is not None else config.latency)
+        if fail:
+            return self._send_json(503, {"error": {"message": "injected failure", "type": "server_error"}})
+
+        prompt = "".join(message.get("content", "") for message in request.get("messages", []))
+        words = REPLY.split(" ")
+        usage = (max(1, len(prompt) // 4), len(words))
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._openai(request, words, usage)
+        elif self.path.rstrip("/") == "/api/chat":
+            self._ollama(request, words, usage)
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _generate(self, words):
+        """Yield reply tokens (words) at the configured token rate."""
+        rate = self.server.config.token_rate
+        for index, word in enumerate(words):
+            if rate:
+                time.sleep(1 / rate)
+            yield word if index == 0 else " " + word
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _openai(self, request: dict, words, usage):
+        model = request.get("model", "mock")
+        usage_body = {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)}
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": model}
+        if not request.get("stream"):
+            text = "".join(self._generate(words))
+            return self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage_body,
+            })
+        self._start_stream("text/event-stream")
+        for token in self._generate(words):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage_body}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+    def _ollama(self, request: dict, words, usage):
+        base = {"model": request.get("model", "mock"), "created_at": "2024-01-01T00:00:00Z"}
+        final = {"done": True, "done_reason": "stop", "prompt_eval_count": usage[0], "eval_count": usage[1]}
+        if not request.get("stream", True):
+            text = "".join(self._generate(words))
+            return self._send_json(200, {**base, **final, "message": {"role": "assistant", "content": text}})
+        self._start_stream("application/x-ndjson")
+        for token in self._generate(words):
+            part = {**base, "done": False, "message": {"role": "assistant", "content": token}}
+            self._write_chunk((json.dumps(part) + "\n").encode())
+        part = {**base, **final, "message": {"role": "assistant", "content": ""}}
+        self._write_chunk((json.dumps(part) + "\n").encode())
+        self._end_stream()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections under concurrent benchmarks
+    request_queue_size = 128
+
+
+class _Config:
+    def __init__(self, latency: float, token_rate: float, failure_rate: float, seed: int, fail_first: int = 0,
+                 failure_latency: float | None = None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.fail_first = fail_first
+        self.failure_latency = failure_latency
+        self.rng = random.Random(seed)
+
+
+class MockLLMServer:
+    """A mock OpenAI/Ollama server running on a background thread.
+
+    Args:
+        latency: Seconds to wait before answering each request
+        token_rate: Reply tokens generated per second (0 for instant replies)
+        failure_rate: Fraction of requests answered with a 503
+        port: Port to listen on (default: any free port)
+        fail_first: Answer this many requests with a 503 before applying failure_rate
+        failure_latency: Seconds to wait before a 503 (default: latency)
+
+    Example:
+        with MockLLMServer(latency=0.05) as server:
+            settings = Settings(provider="ollama", base_url=server.url)
+    """
+
+    def __init__(self, latency: float = 0.0, token_rate: float = 0.0, failure_rate: float = 0.0,
+                 port: int = 0, seed: int = 0, fail_first: int = 0, failure_latency: float | None = None):
+        self.config = _Config(latency, token_rate, failure_rate, seed, fail_first, failure_latency)
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.config = self.config
+        self._server.lock = threading.Lock()
+        self._server.requests = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Get the base URL: use it as the Ollama host, or append /v1 for OpenAI."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> int:
+        """Get the number of requests received."""
+        return self._server.requests
+
+    def start(self) -> "MockLLMServer":
+        """Start serving on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each reply")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Reply tokens per second (0: instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests failing with 503")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.latency, args.token_rate, args.failure_rate, port=args.port)
+    print(f"Mock LLM server listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
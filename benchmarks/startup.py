@@ -0,0 +1,76 @@
+"""Measure how long it takes to import llm_catcher and construct a diagnoser.
+
+Each run uses a fresh interpreter so already-imported modules don't hide the cost.
+
+Usage:
+    python benchmarks/startup.py --runs 10 --output startup.json
+    python benchmarks/startup.py --max-import-ms 50   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_CODE = (
+    "import time; start = time.perf_counter(); import llm_catcher; "
+    "print(time.perf_counter() - start)"
+)
+CONSTRUCT_CODE = (
+    "import time; start = time.perf_counter(); from llm_catcher import LLMExceptionDiagnoser; "
+    "LLMExceptionDiagnoser(global_handler=False); print(time.perf_counter() - start)"
+)
+
+
+def measure(code: str, runs: int) -> dict:
+    """Run code in fresh interpreters and summarize the seconds it prints, in milliseconds."""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    samples.sort()
+    return {
+        "min": round(samples[0], 2),
+        "median": round(statistics.median(samples), 2),
+        "max": round(samples[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import time exceeds this")
+    parser.add_argument("--max-construct-ms", type=float, help="Fail if the median construction time exceeds this")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_ms": measure(IMPORT_CODE, args.runs),
+        "construct_ms": measure(CONSTRUCT_CODE, args.runs),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if args.max_import_ms is not None and results["import_ms"]["median"] > args.max_import_ms:
+        print(f"Import time regression: {results['import_ms']['median']}ms > {args.max_import_ms}ms", file=sys.stderr)
+        failed = True
+    if args.max_construct_ms is not None and results["construct_ms"]["median"] > args.max_construct_ms:
+        print(f"Construction time regression: {results['construct_ms']['median']}ms > {args.max_construct_ms}ms",
+              file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Measure diagnoser throughput, latency and overhead against a local mock LLM server.
+
+Covers sync and async throughput with p50/p99 latency, the cost of the catch
+decorator when nothing fails, memory held per pending diagnosis and startup
+time. Results are JSON, tagged with the current commit, so runs can be compared.
+
+Usage:
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --provider openai --latency 0.05 --token-rate 200 --failure-rate 0.01
+    python benchmarks/suite.py --baseline results.json --max-regression 0.2   # exit 1 on regression
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_catcher import LLMExceptionDiagnoser, Settings  # noqa: E402
+from mock_server import MockLLMServer  # noqa: E402
+import startup  # noqa: E402
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED = {
+    ("sync", "throughput_per_s"): True,
+    ("sync", "p50_ms"): False,
+    ("sync", "p99_ms"): False,
+    ("async", "throughput_per_s"): True,
+    ("async", "p50_ms"): False,
+    ("async", "p99_ms"): False,
+    ("catch_overhead_ns",): False,
+    ("memory_per_pending_bytes",): False,
+}
+
+
+def _errors(count: int):
+    """Create distinct exceptions, so no two share a fingerprint and get coalesced."""
+    errors = []
+    for i in range(count):
+        error_type = type(f"BenchError{i}", (Exception,), {})
+        try:
+            raise error_type(f"benchmark failure {i}")
+        except error_type as e:
+            errors.append(e)
+    return errors
+
+
+def _percentile(samples, percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))]
+
+
+def _summary(latencies, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def bench_sync(diagnoser, requests: int, concurrency: int) -> dict:
+    """Diagnose distinct errors from a thread pool."""
+    def timed(error):
+        start = time.perf_counter()
+        diagnoser.diagnose(error)
+        return time.perf_counter() - start
+
+    errors = _errors(requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, errors))
+    return _summary(latencies, time.perf_counter() - start)
+
+
+def bench_async(diagnoser, requests: int, concurrency: int) -> dict:
+    """Diagnose distinct errors concurrently on one event loop."""
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(error):
+            async with semaphore:
+                start = time.perf_counter()
+                await diagnoser.async_diagnose(error)
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(error) for error in _errors(requests)))
+        return _summary(latencies, time.perf_counter() - start)
+
+    return asyncio.run(run())
+
+
+def bench_catch_overhead(diagnoser, calls: int = 200000) -> float:
+    """Get the nanoseconds the catch decorator adds to a call that doesn't raise."""
+    def plain(x):
+        return x + 1
+
+    wrapped = diagnoser.catch(plain)
+    plain_seconds = min(timeit.repeat(lambda: plain(1), number=calls, repeat=5))
+    wrapped_seconds = min(timeit.repeat(lambda: wrapped(1), number=calls, repeat=5))
+    return round(max(0.0, wrapped_seconds - plain_seconds) / calls * 1e9, 1)
+
+
+def bench_memory_per_pending(diagnoser, count: int = 500) -> int:
+    """Get the bytes held by each queued exception snapshot."""
+    errors = _errors(count)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    jobs = [diagnoser._snapshot(error) for error in errors]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert all(jobs)
+    return round((after - before) / count)
+
+
+def _commit() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    """Print how results differ from a baseline and return True if any metric regressed too far."""
+    regressed = False
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:", file=sys.stderr)
+    for path, higher_is_better in COMPARED.items():
+        new, old = results, baseline
+        for key in path:
+            new, old = new.get(key, {}), old.get(key, {})
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > max_regression:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"  {'.'.join(path)}: {old} -> {new} ({change:+.1%}){flag}", file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=("ollama", "openai"), default="ollama")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.01, help="Mock server seconds before each reply")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock server reply tokens per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of mock requests failing")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results from an earlier run")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Fail if a compared metric is this fraction worse than the baseline")
+    args = parser.parse_args()
+
+    with MockLLMServer(args.latency, args.token_rate, args.failure_rate) as server:
+        settings = Settings(
+            provider=args.provider,
+            llm_model="gpt-4o-mini" if args.provider == "openai" else "mock",
+            openai_api_key="mock" if args.provider == "openai" else None,
+            base_url=server.url + "/v1" if args.provider == "openai" else server.url,
+            cache_enabled=False,
+            retry_backoff=0.01,
+            max_connections=max(args.concurrency, 1),
+            max_keepalive_connections=max(args.concurrency, 1),
+        )
+        diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+        from loguru import logger
+        logger.remove()
+
+        results = {
+            "benchmark": "suite",
+            "commit": _commit(),
+            "python": sys.version.split()[0],
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "sync": bench_sync(diagnoser, args.requests, args.concurrency),
+            "async": bench_async(diagnoser, args.requests, args.concurrency),
+            "catch_overhead_ns": bench_catch_overhead(diagnoser),
+            "memory_per_pending_bytes": bench_memory_per_pending(diagnoser),
+            "server_requests": server.requests,
+            "diagnoser": {key: value for key, value in diagnoser.stats()["counters"].items()},
+        }
+    results["startup"] = {
+        "import_ms": startup.measure(startup.IMPORT_CODE, args.startup_runs),
+        "construct_ms": startup.measure(startup.CONSTRUCT_CODE, args.startup_runs),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.max_regression) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 from fastapi import FastAPI
 from llm_catcher import LLMExceptionDiagnoser
+from llm_catcher.asgi import DiagnosisMiddleware
 
 app = FastAPI()
-diagnoser = LLMExceptionDiagnoser()
+diagnoser = LLMExceptionDiagnoser(global_handler=False)
+# Unhandled exceptions get an immediate 500 with a diagnosis id; the diagnosis
+# is served from /diagnoses/{id}, to local clients only, once the LLM has answered
+app.add_middleware(
+    DiagnosisMiddleware,
+    diagnoser=diagnoser,
+    path_prefix="/diagnoses",
+    authorize=lambda scope: (scope.get("client") or ("",))[0] in ("127.0.0.1", "::1"),
+)
 
 
 @app.get("/")
@@ -13,6 +22,12 @@ async def root():
 
 @app.get("/error")
 async def error():
+    """Fails, and is diagnosed in the background"""
+    return {"result": 1/0}
+
+
+@app.get("/inline")
+async def inline():
     try:
         1/0
     except Exception as e:
@@ -1,10 +1,44 @@
-from .diagnoser import LLMExceptionDiagnoser
-from .settings import get_settings, Settings
+"""LLM Catcher: diagnose exceptions with LLMs.
+
+The public names are imported lazily, so ``import llm_catcher`` stays cheap
+and the provider SDKs are only loaded when a diagnosis is first needed.
+"""
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .diagnoser import LLMExceptionDiagnoser
+    from .results import DiagnosisResult
+    from .settings import get_settings, Settings
+    from .snapshot import ExceptionSnapshot
 
 __all__ = [
+    "DiagnosisResult",
+    "ExceptionSnapshot",
     "LLMExceptionDiagnoser",
     "get_settings",
     "Settings"
 ]
 
 __version__ = "0.4.0"
+
+_LAZY_IMPORTS = {
+    "LLMExceptionDiagnoser": ".diagnoser",
+    "DiagnosisResult": ".results",
+    "get_settings": ".settings",
+    "Settings": ".settings",
+    "ExceptionSnapshot": ".snapshot",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
@@ -0,0 +1,335 @@
+"""ASGI middleware that answers failed requests at once and diagnoses them in the background.
+
+Works with any ASGI framework (FastAPI, Starlette, Quart, ...) and needs no
+dependencies of its own:
+
+    app = FastAPI()
+    app.add_middleware(DiagnosisMiddleware)
+
+An unhandled exception gets an immediate 500 response carrying a diagnosis id.
+The diagnosis is streamed from the LLM on the app's event loop and logged when
+done. With a ``path_prefix`` it can also be fetched from ``GET {path_prefix}/{id}``,
+as JSON or, for clients that accept ``text/event-stream`` (e.g. a browser
+``EventSource``), as server-sent events while it is being generated.
+"""
+from collections import OrderedDict
+from loguru import logger
+import asyncio
+import inspect
+import json
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, MutableMapping, Optional, Tuple, Union
+from .limits import DiagnosisSkipped
+from .snapshot import ExceptionSnapshot
+
+Scope = MutableMapping[str, object]
+Message = MutableMapping[str, object]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+Authorize = Callable[[Scope], Union[bool, Awaitable[bool]]]
+
+_shared_diagnoser = None
+_shared_lock = threading.Lock()
+
+
+def shared_diagnoser():
+    """Get the process-wide diagnoser used by middleware created without one, creating it on first use.
+
+    Every app mounted in a server process then shares one cache, rate limiter
+    and pool of LLM client connections.
+    """
+    global _shared_diagnoser
+    with _shared_lock:
+        if _shared_diagnoser is None:
+            from .diagnoser import LLMExceptionDiagnoser
+            # The ASGI server already reports errors outside of requests
+            _shared_diagnoser = LLMExceptionDiagnoser(global_handler=False)
+        return _shared_diagnoser
+
+
+class DeferredDiagnosis:
+    """A diagnosis running (or finished) in the background, and the text generated so far."""
+
+    __slots__ = ("id", "summary", "status", "reason", "chunks", "created", "finished", "_changed")
+
+    def __init__(self, id: str, summary: str):
+        self.id = id
+        self.summary = summary
+        # "pending", then "done", "skipped" (by the rate limits or circuit breakers) or "failed"
+        self.status = "pending"
+        # Why it was skipped or failed
+        self.reason: Optional[str] = None
+        self.chunks: List[str] = []
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def _notify(self):
+        """Wake everyone waiting for more text; later waiters wait on a fresh event."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, status: str, reason: Optional[str] = None):
+        self.status = status
+        self.reason = reason
+        self.finished = time.time()
+        self._notify()
+
+    def wait(self) -> Awaitable[bool]:
+        """Wait until more text arrives or the diagnosis finishes.
+
+        The event is picked when this is called, not when the wait starts, so
+        nothing appended in between is missed.
+        """
+        return self._changed.wait()
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.summary,
+            "diagnosis": self.text if self.status == "done" else None,
+            # Text generated so far, or before the diagnosis failed
+            "partial": self.text if self.status != "done" and self.chunks else None,
+            "reason": self.reason,
+        }
+
+
+class DiagnosisMiddleware:
+    """Return a 500 with a diagnosis id for unhandled exceptions and diagnose them in the background.
+
+    Args:
+        app: The ASGI app to wrap
+        diagnoser: Diagnoser to use (default: the process-wide shared_diagnoser(), created at startup)
+        max_concurrency: Diagnoses streamed from the LLM at once; the rest wait their turn
+        max_pending: Diagnoses waiting or running at once; further errors get a 500 without a diagnosis id
+        max_results: Diagnoses kept for the results endpoint, oldest dropped first
+        path_prefix: Where diagnoses are served, as ``{path_prefix}/{id}`` (default: not served). Diagnoses
+            describe the server's code, so anyone who can reach the endpoint should be allowed to read them
+        authorize: Called with the request scope for each request to the endpoint (sync or async);
+            requests it returns False for get a 403
+        include_locals: Include the failing frame's local variables in the prompt
+        keepalive: Seconds between keep-alive comments on event streams
+        shutdown_timeout: Seconds to wait at shutdown for diagnoses still running
+    """
+
+    def __init__(self, app: ASGIApp, diagnoser=None, max_concurrency: int = 4, max_pending: int = 256,
+                 max_results: int = 1000, path_prefix: Optional[str] = None, authorize: Optional[Authorize] = None,
+                 include_locals: bool = False, keepalive: float = 15.0, shutdown_timeout: float = 10.0):
+        self.app = app
+        self.diagnoser = diagnoser
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_results = max_results
+        self.path_prefix = path_prefix.rstrip("/") if path_prefix else None
+        self.authorize = authorize
+        self.include_locals = include_locals
+        self.keepalive = keepalive
+        self.shutdown_timeout = shutdown_timeout
+        self.results: "OrderedDict[str, DeferredDiagnosis]" = OrderedDict()
+        self._tasks: set = set()
+        # Created on the app's event loop, by the first diagnosis
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, self._lifespan_receive(receive), send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.path_prefix is not None and scope["path"].startswith(self.path_prefix + "/"):
+            await self._serve(scope, receive, send)
+            return
+
+        started = False
+
+        async def tracking_send(message: Message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking_send)
+        except Exception as e:
+            if started:
+                # Too late for our 500: diagnose anyway, and let the server close the connection
+                self.defer(e, release=False)
+                raise
+            logger.opt(exception=e).error(f"Unhandled exception in {scope.get('method')} {scope['path']}")
+            diagnosis = self.defer(e)
+            body: Dict[str, object] = {"detail": "Internal Server Error"}
+            headers = []
+            if diagnosis is not None:
+                body["diagnosis_id"] = diagnosis.id
+                headers.append((b"x-diagnosis-id", diagnosis.id.encode()))
+                if self.path_prefix is not None:
+                    body["diagnosis_url"] = f"{scope.get('root_path', '')}{self.path_prefix}/{diagnosis.id}"
+            await _send_json(send, 500, body, headers)
+
+    def _get_diagnoser(self):
+        if self.diagnoser is None:
+            self.diagnoser = shared_diagnoser()
+        return self.diagnoser
+
+    def _lifespan_receive(self, receive: Receive) -> Receive:
+        """Set up the diagnoser at startup and let running diagnoses finish at shutdown."""
+        async def wrapped() -> Message:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                diagnoser = self._get_diagnoser()
+                try:
+                    # Open the pooled LLM client on the app's loop now rather than during the first error
+                    diagnoser.async_client
+                except Exception as e:
+                    logger.warning(f"Could not create the LLM client at startup: {e}")
+            elif message["type"] == "lifespan.shutdown":
+                await self.drain(self.shutdown_timeout)
+            return message
+        return wrapped
+
+    def defer(self, error: BaseException, release: bool = True) -> Optional[DeferredDiagnosis]:
+        """Start diagnosing an exception on the running loop, returning None if it won't be diagnosed.
+
+        The exception is snapshotted first, so with release=True the request
+        and everything else its frames referenced can be freed right away.
+        """
+        diagnoser = self._get_diagnoser()
+        if not diagnoser._first_report(error):
+            # An inner catch or guard already diagnosed it
+            return None
+        if len(self._tasks) >= self.max_pending:
+            logger.warning("Too many diagnoses pending; not diagnosing this error")
+            diagnoser.metrics.count("skipped")
+            return None
+        snapshot = ExceptionSnapshot.capture(error, include_locals=self.include_locals, release=release)
+        diagnosis = DeferredDiagnosis(uuid.uuid4().hex, snapshot.summary)
+        self.results[diagnosis.id] = diagnosis
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+        task = asyncio.get_running_loop().create_task(self._run(diagnosis, snapshot))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return diagnosis
+
+    async def _run(self, diagnosis: DeferredDiagnosis, snapshot: ExceptionSnapshot):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        diagnoser = self._get_diagnoser()
+        try:
+            async with self._semaphore:
+                async for chunk in diagnoser._astream_text(snapshot):
+                    diagnosis.append(chunk)
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping diagnosis {diagnosis.id}: {e.reason}")
+            diagnoser.metrics.count("skipped")
+            diagnosis.finish("skipped", e.reason)
+        except Exception as e:
+            logger.error(f"Background diagnosis {diagnosis.id} failed: {e}")
+            diagnosis.finish("failed", str(e))
+        else:
+            diagnosis.finish("done")
+            logger.info(f"Diagnosis {diagnosis.id} of {diagnosis.summary}:\n{diagnosis.text}")
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the running diagnoses to finish, returning False if the timeout passed first."""
+        if not self._tasks:
+            return True
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} diagnoses still running at shutdown")
+        return not pending
+
+    async def _serve(self, scope: Scope, receive: Receive, send: Send):
+        """Serve ``{path_prefix}/{id}`` as JSON, or as server-sent events if the client accepts them."""
+        if self.authorize is not None:
+            allowed = self.authorize(scope)
+            if inspect.isawaitable(allowed):
+                allowed = await allowed
+            if not allowed:
+                await _send_json(send, 403, {"detail": "Forbidden"})
+                return
+        diagnosis = self.results.get(scope["path"][len(self.path_prefix) + 1:])
+        if scope["method"] not in ("GET", "HEAD"):
+            await _send_json(send, 405, {"detail": "Method Not Allowed"}, [(b"allow", b"GET, HEAD")])
+        elif diagnosis is None:
+            await _send_json(send, 404, {"detail": "Unknown or expired diagnosis id"})
+        elif b"text/event-stream" in _header(scope, b"accept"):
+            await self._stream(diagnosis, receive, send)
+        else:
+            await _send_json(send, 200, diagnosis.as_dict())
+
+    async def _stream(self, diagnosis: DeferredDiagnosis, receive: Receive, send: Send):
+        """Send the diagnosis as "chunk" events as it is generated, then a "done", "skipped" or "failed" event.
+
+        The last event carries the whole diagnosis, or why there is none.
+        """
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache")],
+        })
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        sent = 0
+        try:
+            while True:
+                if sent < len(diagnosis.chunks):
+                    text = "".join(diagnosis.chunks[sent:])
+                    sent = len(diagnosis.chunks)
+                    await send({"type": "http.response.body", "body": _event("chunk", text), "more_body": True})
+                    continue
+                if diagnosis.status != "pending":
+                    data = diagnosis.text if diagnosis.status == "done" else diagnosis.reason or ""
+                    await send({"type": "http.response.body", "body": _event(diagnosis.status, data)})
+                    return
+                changed = asyncio.ensure_future(diagnosis.wait())
+                done, _ = await asyncio.wait({changed, disconnected}, timeout=self.keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if disconnected in done:
+                    return
+                if not done:
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+        finally:
+            disconnected.cancel()
+
+
+def _header(scope: Scope, name: bytes) -> bytes:
+    for key, value in scope.get("headers", ()):
+        if key.lower() == name:
+            return value
+    return b""
+
+
+async def _wait_for_disconnect(receive: Receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _event(name: str, data: str) -> bytes:
+    """Encode a server-sent event; each line of data gets its own "data:" field."""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {name}\n{lines}\n".encode()
+
+
+async def _send_json(send: Send, status: int, body: Dict[str, object], headers: List[Tuple[bytes, bytes]] = ()):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode()),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,260 @@
+from loguru import logger
+import atexit
+import json
+import queue
+import reprlib
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, TYPE_CHECKING
+from .limits import DiagnosisSkipped
+
+if TYPE_CHECKING:
+    from .diagnoser import LLMExceptionDiagnoser
+
+DROP_POLICIES = ("drop_new", "drop_old", "block")
+
+_STOP = object()
+
+
+class DiagnosisJob:
+    """Snapshot of an exception taken at catch time, queued for background diagnosis.
+
+    Only strings are kept, so the traceback and everything its frames
+    reference can be released as soon as the job is created.
+    """
+
+    __slots__ = ("key", "summary", "prompt", "similarity_text", "enqueued_at")
+
+    def __init__(self, key: str, summary: str, prompt: str, similarity_text: Optional[str] = None):
+        self.key = key
+        self.summary = summary
+        self.prompt = prompt
+        self.similarity_text = similarity_text
+        self.enqueued_at = time.time()
+
+
+Sink = Callable[[DiagnosisJob, str], None]
+
+
+def summarize_locals(tb, max_vars: int = 20, max_repr: int = 120) -> str:
+    """Summarize the local variables of the innermost frame of a traceback.
+
+    Strings, numbers and containers are shortened as they are formatted, so
+    large values aren't rendered in full only to be cut.
+    """
+    if tb is None:
+        return ""
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    # Leave room for the cut below, which keeps the start of the repr rather than both ends
+    short = reprlib.Repr()
+    short.maxstring = short.maxlong = short.maxother = max_repr * 2
+    lines = []
+    for name, value in list(tb.tb_frame.f_locals.items())[:max_vars]:
+        try:
+            text = short.repr(value)
+        except Exception:
+            text = f"<unrepresentable {type(value).__name__}>"
+        if len(text) > max_repr:
+            text = text[:max_repr - 3] + "..."
+        lines.append(f"  {name} = {text}")
+    return "\n".join(lines)
+
+
+def stderr_sink(job: DiagnosisJob, diagnosis: str):
+    """Print the diagnosis to stderr, like the synchronous handlers do."""
+    print(diagnosis, file=sys.stderr)
+
+
+def logger_sink(job: DiagnosisJob, diagnosis: str):
+    """Send the diagnosis to the logger."""
+    logger.error(f"{job.summary}\n{diagnosis}")
+
+
+class FileSink:
+    """Append diagnoses to a file as JSON lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, job: DiagnosisJob, diagnosis: str):
+        record = json.dumps({
+            "time": job.enqueued_at,
+            "exception": job.summary,
+            "key": job.key,
+            "diagnosis": diagnosis,
+        })
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(record + "\n")
+
+
+class DiagnosisQueue:
+    """Bounded queue of exception snapshots drained by a pool of worker threads.
+
+    Submitting never waits on the LLM. When the queue is full the drop
+    policy decides what happens: ``drop_new`` discards the incoming job,
+    ``drop_old`` discards the oldest queued job, and ``block`` waits up to
+    ``put_timeout`` seconds for space before discarding the incoming job.
+    Pending jobs are flushed at interpreter exit, bounded by ``flush_timeout``.
+    """
+
+    def __init__(self, diagnoser: "LLMExceptionDiagnoser", sink: Optional[Sink] = None,
+                 maxsize: int = 1000, workers: int = 2, drop_policy: str = "drop_new",
+                 put_timeout: float = 0.1, flush_timeout: float = 5.0):
+        """Initialize the queue. Worker threads start on the first submission.
+
+        Args:
+            diagnoser: Diagnoser used to diagnose queued jobs
+            sink: Callable receiving each job and its formatted diagnosis (default: print to stderr)
+            maxsize: Maximum number of queued jobs
+            workers: Number of worker threads
+            drop_policy: One of "drop_new", "drop_old" or "block"
+            put_timeout: Seconds to wait for space under the "block" policy
+            flush_timeout: Seconds to spend flushing pending jobs at exit
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unsupported drop policy: {drop_policy}")
+        self.diagnoser = diagnoser
+        self.sink = sink or stderr_sink
+        self.workers = workers
+        self.drop_policy = drop_policy
+        self.put_timeout = put_timeout
+        self.flush_timeout = flush_timeout
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._threads: list[threading.Thread] = []
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads or self._closed:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"llm-catcher-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+
+    def submit(self, job: DiagnosisJob) -> bool:
+        """Queue a job for diagnosis.
+
+        Returns:
+            True if the job was queued, False if it was dropped
+        """
+        if self._closed:
+            return False
+        if not self._threads:
+            self._start()
+        with self._idle:
+            self._pending += 1
+        if self._put(job):
+            with self._idle:
+                self.submitted += 1
+            return True
+        with self._idle:
+            self.dropped += 1
+        self._done()
+        return False
+
+    def _put(self, job: DiagnosisJob) -> bool:
+        if self.drop_policy == "block":
+            try:
+                self._queue.put(job, timeout=self.put_timeout)
+                return True
+            except queue.Full:
+                return False
+        while True:
+            try:
+                self._queue.put_nowait(job)
+                return True
+            except queue.Full:
+                if self.drop_policy == "drop_new":
+                    return False
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            with self._idle:
+                self.dropped += 1
+            self._done()
+
+    def _done(self):
+        with self._idle:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            self.diagnoser.metrics.observe("queue_wait", max(0.0, time.time() - job.enqueued_at))
+            succeeded = True
+            try:
+                try:
+                    diagnosis = self.diagnoser._diagnose_prompt(job.key, lambda: job.prompt, job.similarity_text)
+                    diagnosis = self.diagnoser._format_diagnosis(diagnosis, True)
+                except DiagnosisSkipped as e:
+                    diagnosis = f"LLM diagnosis skipped ({e.reason}).\n\n{job.summary}"
+                except Exception as e:
+                    # Still report the exception, as the synchronous handlers do when the LLM fails
+                    succeeded = False
+                    logger.error(f"Background diagnosis failed: {str(e)}")
+                    diagnosis = f"Failed to contact LLM for diagnosis. Error: {str(e)}\n\n{job.summary}"
+                self.sink(job, diagnosis)
+            except Exception as e:
+                succeeded = False
+                logger.error(f"Background diagnosis sink failed: {str(e)}")
+            with self._idle:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued jobs are diagnosed.
+
+        Returns:
+            True if the queue drained before the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Flush pending jobs (bounded by timeout, default flush_timeout) and stop the workers."""
+        if self._closed:
+            return
+        if not self.flush(self.flush_timeout if timeout is None else timeout):
+            logger.warning(f"Gave up on {self._pending} pending diagnoses at shutdown")
+        self._closed = True
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                break
+
+    def stats(self) -> Dict[str, int]:
+        """Get submission/drop/completion counters and the current queue depth."""
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
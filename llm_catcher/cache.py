@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from typing import Dict, Optional
+
+
+def make_cache_key(fingerprint: str, provider: str, llm_model: str, prompt_version: int | str) -> str:
+    """Build a cache key covering the traceback fingerprint and everything that shapes the answer."""
+    raw = f"{provider}\0{llm_model}\0{prompt_version}\0{fingerprint}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class DiagnosisCache:
+    """Thread-safe, bounded LRU cache of diagnoses with optional TTL expiry."""
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        """Initialize the cache.
+
+        Args:
+            max_size: Maximum number of diagnoses kept before evicting the least recently used
+            ttl: Seconds a diagnosis stays valid, or None to keep it until evicted
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached diagnosis for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, diagnosis = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return diagnosis
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, diagnosis: str):
+        """Store a diagnosis, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), diagnosis)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all cached diagnoses and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
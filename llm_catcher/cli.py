@@ -0,0 +1,66 @@
+"""Command line interface: diagnose the tracebacks found in log files.
+
+Usage:
+    llm-catcher app.log app.log.1.gz --output report.html
+    llm-catcher /var/log/app/*.log --output report.jsonl --checkpoint scan.json --workers 8
+"""
+from loguru import logger
+import argparse
+import sys
+from typing import List, Optional
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="llm-catcher",
+        description="Find Python tracebacks in log files, group repeats and diagnose each distinct one once.",
+    )
+    parser.add_argument("logs", nargs="+", help="Log files to scan (.gz files are decompressed on the fly)")
+    parser.add_argument("-o", "--output", default="llm_catcher_report.jsonl",
+                        help="Report file (default: %(default)s)")
+    parser.add_argument("--format", choices=("jsonl", "html"),
+                        help="Report format (default: from the output file extension, else jsonl)")
+    parser.add_argument("--checkpoint", help="Save progress here and resume from it on the next run")
+    parser.add_argument("--workers", type=int, help="Diagnoses run at once (default: batch_concurrency setting)")
+    parser.add_argument("--no-diagnose", action="store_true", help="Only group tracebacks, without calling the LLM")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress to stderr")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the log scanner CLI, returning the exit status."""
+    args = _parser().parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level="INFO" if args.verbose else "WARNING")
+
+    from .logscan import LogScanner
+    from .settings import get_settings
+
+    settings = get_settings()
+    diagnoser = None
+    if not args.no_diagnose:
+        from .diagnoser import LLMExceptionDiagnoser
+        diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+
+    scanner = LogScanner(diagnoser, checkpoint_path=args.checkpoint,
+                         workers=args.workers or settings.batch_concurrency)
+    try:
+        groups = scanner.scan(args.logs)
+    except OSError as e:
+        print(f"llm-catcher: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("llm-catcher: interrupted; progress saved" if args.checkpoint else "llm-catcher: interrupted",
+              file=sys.stderr)
+        return 130
+    scanner.write_report(args.output, args.format)
+
+    failed = sum(1 for group in groups if diagnoser is not None and group.diagnosis is None)
+    print(f"{scanner.tracebacks} tracebacks, {len(groups)} distinct"
+          + (f", {failed} not diagnosed" if failed else "") + f"; report written to {args.output}",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
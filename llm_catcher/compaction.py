@@ -0,0 +1,229 @@
+from functools import lru_cache
+import os
+import sysconfig
+import threading
+import traceback
+from typing import Dict, List, Optional, Tuple
+from .prompts import estimate_tokens
+from .wrappers import WRAPPER_FILENAME
+
+CAUSE_MESSAGE = "\nThe above exception was the direct cause of the following exception:\n\n"
+CONTEXT_MESSAGE = "\nDuring handling of the above exception, another exception occurred:\n\n"
+# Longest cycle of frames detected as recursion
+_MAX_CYCLE = 4
+# A cycle must occur at least this many times in a row to be collapsed
+_MIN_REPEATS = 3
+
+
+@lru_cache(maxsize=1)
+def _library_roots() -> Tuple[str, ...]:
+    paths = sysconfig.get_paths()
+    roots = {os.path.normcase(os.path.realpath(paths[name])) for name in ("stdlib", "platstdlib") if name in paths}
+    return tuple(root + os.sep for root in roots)
+
+
+@lru_cache(maxsize=4096)
+def is_library_path(filename: str) -> bool:
+    """Check whether a frame's file belongs to an installed package or the standard library."""
+    if filename.startswith("<frozen"):
+        return True
+    if "site-packages" in filename or "dist-packages" in filename:
+        return True
+    path = os.path.normcase(os.path.realpath(filename))
+    return path.startswith(_library_roots())
+
+
+def _package_name(filename: str) -> str:
+    """Get a short package name for a library frame, e.g. 'starlette' or 'asyncio'."""
+    parts = filename.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            rest = parts[parts.index(marker) + 1:]
+            if rest:
+                return rest[0].removesuffix(".py")
+    for root in _library_roots():
+        path = os.path.normcase(os.path.realpath(filename))
+        if path.startswith(root):
+            return path[len(root):].replace("\\", "/").split("/")[0].removesuffix(".py")
+    return parts[-1].strip("<>") or filename
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} characters truncated]"
+
+
+def _format_frame(frame: traceback.FrameSummary, max_repr: int) -> str:
+    line = f'  File "{frame.filename}", line {frame.lineno}, in {frame.name}\n'
+    if frame.line:
+        line += f"    {_truncate(frame.line.strip(), max_repr)}\n"
+    return line
+
+
+def _collapse_recursion(frames: List[traceback.FrameSummary]) -> List[object]:
+    """Replace runs of a repeating cycle of frames with one copy and a count."""
+    keys = [(f.filename, f.lineno, f.name) for f in frames]
+    output: List[object] = []
+    i = 0
+    while i < len(frames):
+        for period in range(1, _MAX_CYCLE + 1):
+            cycle = keys[i:i + period]
+            repeats = 1
+            while keys[i + repeats * period:i + (repeats + 1) * period] == cycle:
+                repeats += 1
+            if repeats >= _MIN_REPEATS:
+                output.extend(frames[i:i + period])
+                output.append(f"  [Previous {period} frame(s) repeated {repeats - 1} more times]\n")
+                i += period * repeats
+                break
+        else:
+            output.append(frames[i])
+            i += 1
+    return output
+
+
+def _format_stack(stack: traceback.StackSummary, collapse_library: bool, max_repr: int) -> str:
+    entries = _collapse_recursion([frame for frame in stack if frame.filename != WRAPPER_FILENAME])
+    lines = []
+    skipped: List[str] = []
+    last = len(entries) - 1
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            # A repeat marker for collapsed library frames would be orphaned
+            if not skipped:
+                lines.append(entry)
+            continue
+        # The innermost frame is always kept, even in a library: it's where the error was raised
+        if collapse_library and index != last and is_library_path(entry.filename):
+            skipped.append(_package_name(entry.filename))
+            continue
+        if skipped:
+            lines.append(_skipped_line(skipped))
+            skipped = []
+        lines.append(_format_frame(entry, max_repr))
+    if skipped:
+        lines.append(_skipped_line(skipped))
+    return "".join(lines)
+
+
+def _skipped_line(packages: List[str]) -> str:
+    names = ", ".join(dict.fromkeys(packages))
+    return f"  [... {len(packages)} library frame(s) omitted: {names} ...]\n"
+
+
+def _format_exception(te: traceback.TracebackException, collapse_library: bool, max_repr: int) -> str:
+    text = ""
+    if te.stack:
+        text += "Traceback (most recent call last):\n" + _format_stack(te.stack, collapse_library, max_repr)
+    message = "".join(te.format_exception_only())
+    return text + _truncate(message.rstrip("\n"), max_repr) + "\n"
+
+
+def fit_tokens(text: str, max_tokens: int) -> str:
+    """Cut the middle out of text so it fits the token budget, keeping the innermost frames."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    head = max_chars // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n[... {len(text) - head - tail} characters truncated ...]\n{text[-tail:]}"
+
+
+def compact_traceback(error: BaseException, collapse_library: bool = True, max_chain_depth: int = 3,
+                      max_repr: int = 500, max_tokens: Optional[int] = None) -> str:
+    """Format an exception's traceback with the noise removed.
+
+    Runs of library frames are collapsed into one line naming the packages,
+    recursive frames are deduplicated, chained exceptions beyond
+    ``max_chain_depth`` are dropped (the exception itself is always kept),
+    long source lines and messages are trimmed to ``max_repr`` characters,
+    and the result is cut down to ``max_tokens`` estimated tokens.
+    """
+    te = traceback.TracebackException(type(error), error, error.__traceback__)
+    chain = []
+    link = ""
+    seen = set()
+    current = te
+    max_chain_depth = max(1, max_chain_depth)
+    while current is not None and len(chain) < max_chain_depth and id(current) not in seen:
+        seen.add(id(current))
+        chain.append((current, link))
+        if current.__cause__ is not None:
+            current, link = current.__cause__, CAUSE_MESSAGE
+        elif current.__context__ is not None and not current.__suppress_context__:
+            current, link = current.__context__, CONTEXT_MESSAGE
+        else:
+            current = None
+    if current is not None:
+        dropped = "[... earlier chained exceptions omitted ...]\n"
+    else:
+        dropped = ""
+
+    # The chain runs newest to oldest; tracebacks are printed oldest first
+    parts = [dropped]
+    for index in range(len(chain) - 1, -1, -1):
+        exc, _ = chain[index]
+        parts.append(_format_exception(exc, collapse_library, max_repr))
+        if index > 0:
+            parts.append(chain[index][1])
+    text = "".join(parts)
+    if max_tokens is not None:
+        text = fit_tokens(text, max_tokens)
+    return text
+
+
+def compact_snapshot(snapshot, collapse_library: bool = True, max_chain_depth: int = 3, max_repr: int = 500,
+                     max_tokens: Optional[int] = None) -> str:
+    """Format an ExceptionSnapshot with the same noise removed as compact_traceback."""
+    chain = snapshot.chain()
+    max_chain_depth = max(1, max_chain_depth)
+    dropped = "[... earlier chained exceptions omitted ...]\n" if len(chain) > max_chain_depth else ""
+    chain = chain[:max_chain_depth]
+
+    parts = [dropped]
+    for index in range(len(chain) - 1, -1, -1):
+        exc = chain[index]
+        if exc.frames:
+            stack = traceback.StackSummary.from_list(exc.frames)
+            parts.append("Traceback (most recent call last):\n" + _format_stack(stack, collapse_library, max_repr))
+        parts.append(_truncate(exc.summary, max_repr) + "\n")
+        if index > 0:
+            parts.append(CAUSE_MESSAGE if chain[index - 1].link == "cause" else CONTEXT_MESSAGE)
+    text = "".join(parts)
+    if max_tokens is not None:
+        text = fit_tokens(text, max_tokens)
+    return text
+
+
+class CompactionStats:
+    """Running totals of prompt tokens before and after compaction."""
+
+    def __init__(self):
+        self.prompts = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, original: str, compacted: str) -> int:
+        """Record one compaction and return the estimated tokens it saved."""
+        before = estimate_tokens(original)
+        after = estimate_tokens(compacted)
+        with self._lock:
+            self.prompts += 1
+            self.tokens_before += before
+            self.tokens_after += after
+            self.last_saved = before - after
+        return before - after
+
+    def stats(self) -> Dict[str, int]:
+        """Get compaction totals."""
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after,
+                "last_saved": self.last_saved,
+            }
@@ -1,27 +1,60 @@
-from .settings import get_settings
+from .background import DiagnosisJob, DiagnosisQueue, Sink, summarize_locals
+from .cache import DiagnosisCache, make_cache_key
+from .compaction import CompactionStats, compact_snapshot, compact_traceback
+from .fingerprint import fingerprint_exception
+from .limits import DiagnosisSkipped, RateLimiter
+from .metrics import Metrics, render_prometheus
+from .prompts import build_batch_prompt, pack_batches, parse_batch_response
+from .providers import Provider, Usage, get_client, providers_from_settings
+from .resilience import backoff_delays, is_transient
+from .results import STRUCTURED_INSTRUCTIONS, DiagnosisResult
+from .similarity import SimilarityIndex, similarity_text
+from .snapshot import ExceptionSnapshot
+from .singleflight import SingleFlight
+from .sources import get_source_cache, source_context
+from .warmup import ModelWarmer
+from .wrappers import wrap
+from .streaming import atrim_stream, awith_deadline, trim_stream, with_deadline
 from loguru import logger
-from openai import AsyncOpenAI, OpenAI
-from ollama import Client, AsyncClient
 import traceback
 import os
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from functools import wraps
-from typing import Callable, TypeVar, ParamSpec
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar, ParamSpec
 import asyncio
 
 P = ParamSpec('P')
 T = TypeVar('T')
+F = TypeVar('F')
+
+# Bump whenever the prompt changes so cached diagnoses from the old prompt are not reused
+PROMPT_VERSION = 2
+# Likewise for the structured (JSON) prompt, whose answers are cached separately
+STRUCTURED_PROMPT_VERSION = "structured-1"
+# Requests that waited at least this long for the model to load count as cold
+COLD_LOAD_SECONDS = 0.5
+
+# Boundaries around formatted diagnoses, shared by the streaming and non-streaming APIs
+DIAGNOSIS_HEADER = "\n" + "="*80 + "\n" + "LLM DIAGNOSIS\n" + "="*80 + "\n"
+DIAGNOSIS_FOOTER = "\n" + "="*80 + "\n"
+
+# Marks diagnoses reused from a similar error rather than generated for this one
+REUSED_MARKER = "[Reused diagnosis of a similar error (similarity {score:.2f})]\n"
 
 
 class LLMExceptionDiagnoser:
     """Diagnoses exceptions using LLM."""
 
-    def __init__(self, settings=None, global_handler: bool = True):
+    def __init__(self, settings=None, global_handler: bool = True, sink: Sink | None = None):
         """Initialize the diagnoser with settings.
 
         Args:
             settings: Optional settings object to override defaults
             global_handler: Whether to install global exception handler (default: True)
+            sink: Where background diagnoses are delivered (default: printed to stderr)
         """
         logger.info("Initializing LLM Exception Diagnoser")
 
@@ -31,23 +64,69 @@ class LLMExceptionDiagnoser:
         else:
             # Log where settings are coming from
             logger.info("Loading settings from environment/config files...")
+            from .settings import get_settings
             self.settings = get_settings()
+        # Shared settings are copied before this diagnoser changes them (see llm_model and temperature)
+        self._shared_settings = not settings
 
-        # Initialize the appropriate client based on the provider
-        if self.settings.provider == "openai":
-            logger.info(f"Using OpenAI provider with model: {self.settings.llm_model}")
-            self.async_client = AsyncOpenAI(api_key=self.settings.openai_api_key)
-            self.sync_client = OpenAI(api_key=self.settings.openai_api_key)
-        elif self.settings.provider == "ollama":
-            logger.info(f"Using Ollama provider with model: {self.settings.llm_model}")
-            try:
-                self.async_client = AsyncClient()
-                self.sync_client = Client()
-            except Exception as e:
-                logger.error(f"Failed to initialize Ollama client: {str(e)}")
-                raise
-        else:
-            raise ValueError(f"Unsupported provider: {self.settings.provider}")
+        # Backends are tried in order; their clients (and SDKs) are created on first use
+        self.providers = providers_from_settings(self.settings)
+        logger.info(f"Using {self.settings.provider} provider with model: {self.settings.llm_model}")
+        if len(self.providers) > 1:
+            logger.info(f"Failover backends: {', '.join(p.name for p in self.providers[1:])}")
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+        self.cache = None
+        if self.settings.cache_enabled:
+            self.cache = DiagnosisCache(
+                max_size=self.settings.cache_max_size,
+                ttl=self.settings.cache_ttl,
+            )
+        self.similarity = SimilarityIndex.from_settings(self.settings, self._embedding_client)
+        self.inflight = SingleFlight()
+        self.metrics = Metrics.from_settings(self.settings)
+        for provider in self.providers:
+            provider.on_model_load = self._record_model_load
+        self.warmer = None
+        if self.settings.warmup or self.settings.warmup_interval:
+            # Local models take a while to load; do it now, off the startup path
+            self.warmer = ModelWarmer(self.providers, self.settings.warmup_interval).start()
+        self._guard = Guard(self)
+        # Read once; checked on every diagnosis
+        self._debug = bool(os.getenv("DEBUG"))
+        self.compaction = CompactionStats()
+        self.limiter = RateLimiter.from_settings(self.settings)
+        self.store = None
+        if self.settings.store_path:
+            logger.info(f"Using persistent diagnosis store at {self.settings.store_path}")
+            from .store import SQLiteDiagnosisStore
+            self.store = SQLiteDiagnosisStore(
+                self.settings.store_path,
+                max_bytes=self.settings.store_max_bytes,
+                ttl=self.settings.cache_ttl,
+            )
+
+        self.background = None
+        if self.settings.background:
+            self.background = DiagnosisQueue(
+                self,
+                sink=sink,
+                maxsize=self.settings.background_queue_size,
+                workers=self.settings.background_workers,
+                drop_policy=self.settings.background_drop_policy,
+                flush_timeout=self.settings.background_flush_timeout,
+            )
+        # Queue for exceptions from threads, event loops and futures when background mode is off
+        self._sink = sink
+        self._hook_queue = None
+        self._hook_lock = threading.Lock()
+
+        self.forwarder = None
+        if self.settings.forward_address:
+            logger.info(f"Forwarding exceptions for diagnosis to {self.settings.forward_address}")
+            from .forwarding import DiagnosisForwarder
+            self.forwarder = DiagnosisForwarder(self.settings.forward_address)
 
         # Log final configuration (excluding sensitive data)
         logger.info(
@@ -59,14 +138,35 @@ class LLMExceptionDiagnoser:
         if global_handler:
             self.install_global_handler()
 
-    def install_global_handler(self):
-        """Install global exception handler using sys.excepthook."""
+    def install_global_handler(self, loop: asyncio.AbstractEventLoop | None = None):
+        """Install global exception handlers for the main thread, worker threads and asyncio.
+
+        Hooks ``sys.excepthook`` and ``threading.excepthook``, and the exception
+        handler of ``loop`` (default: the running event loop, if any). Exceptions
+        from threads and event loops are diagnosed on a bounded background queue
+        so the failing thread isn't held up.
+        """
         original_excepthook = sys.excepthook
 
         @wraps(sys.excepthook)
         def custom_excepthook(exc_type, exc_value, exc_traceback):
             """Custom exception hook that diagnoses before printing."""
+            if getattr(exc_value, "_llm_catcher_reported", False):
+                # Already diagnosed by catch or guard on its way out
+                original_excepthook(exc_type, exc_value, exc_traceback)
+                return
+            if self._deferred:
+                # Print the traceback right away; the diagnosis follows from the queue
+                self.submit(exc_value)
+                original_excepthook(exc_type, exc_value, exc_traceback)
+                return
             try:
+                if self.settings.stream_to_stderr:
+                    for chunk in self.stream_diagnose(exc_value):
+                        sys.stderr.write(chunk)
+                        sys.stderr.flush()
+                    sys.stderr.write("\n")
+                    return
                 diagnosis = self.diagnose(exc_value)
                 # print("\nLLM Diagnosis:", file=sys.stderr)
                 print(diagnosis, file=sys.stderr)
@@ -79,6 +179,94 @@ class LLMExceptionDiagnoser:
 
         sys.excepthook = custom_excepthook
 
+        original_threading_excepthook = threading.excepthook
+
+        @wraps(threading.excepthook)
+        def custom_threading_excepthook(args):
+            """Thread exception hook that queues a diagnosis after printing the traceback."""
+            original_threading_excepthook(args)
+            if isinstance(args.exc_value, Exception):
+                self._dispatch(args.exc_value)
+
+        threading.excepthook = custom_threading_excepthook
+
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+        self.install_loop_handler(loop)
+
+    def install_loop_handler(self, loop: asyncio.AbstractEventLoop):
+        """Diagnose exceptions reported to an event loop's exception handler, e.g. from failed tasks
+        whose exception was never retrieved.
+
+        Call this from application startup when the global handler was installed
+        before the event loop was running.
+        """
+        previous = loop.get_exception_handler()
+
+        def handler(loop: asyncio.AbstractEventLoop, context: dict):
+            if previous is not None:
+                previous(loop, context)
+            else:
+                loop.default_exception_handler(context)
+            error = context.get("exception")
+            if isinstance(error, Exception):
+                self._dispatch(error)
+
+        loop.set_exception_handler(handler)
+
+    def watch(self, future: F) -> F:
+        """Diagnose the exception of a concurrent.futures or asyncio future when it fails.
+
+        Returns the future so it can wrap ``submit`` or ``create_task`` calls.
+
+        Example:
+            future = diagnoser.watch(executor.submit(process, item))
+        """
+        def done(future):
+            if not future.cancelled() and isinstance(future.exception(), Exception):
+                self._dispatch(future.exception())
+
+        future.add_done_callback(done)
+        return future
+
+    def serve(self, address: str | None = None, authkey: bytes | None = None):
+        """Diagnose exceptions forwarded by worker processes, see DiagnosisServer.
+
+        Workers forward snapshots by setting ``forward_address`` to the returned
+        server's address, so only this process holds provider clients and
+        duplicate errors across workers share one LLM call.
+
+        Returns:
+            The running DiagnosisServer; call close() to stop it
+        """
+        from .forwarding import DiagnosisServer
+        server = DiagnosisServer(self._dispatch_queue().submit, address, authkey)
+        logger.info(f"Accepting forwarded exceptions at {server.address}")
+        return server
+
+    @property
+    def sync_client(self):
+        """Get the sync client of the main provider, creating it on first use."""
+        return self.providers[0].sync_client
+
+    @sync_client.setter
+    def sync_client(self, client):
+        """Set the sync client of the main provider."""
+        self.providers[0].sync_client = client
+
+    @property
+    def async_client(self):
+        """Get the async client of the main provider, creating it on first use."""
+        return self.providers[0].async_client
+
+    @async_client.setter
+    def async_client(self, client):
+        """Set the async client of the main provider."""
+        self.providers[0].async_client = client
+
     @property
     def llm_model(self) -> str:
         """Get current LLM model."""
@@ -87,7 +275,7 @@ class LLMExceptionDiagnoser:
     @llm_model.setter
     def llm_model(self, model: str):
         """Set LLM model."""
-        self.settings.llm_model = model
+        self._own_settings().llm_model = model
         logger.debug(f"Model updated to: {model}")
 
     @property
@@ -98,12 +286,113 @@ class LLMExceptionDiagnoser:
     @temperature.setter
     def temperature(self, value: float):
         """Set temperature value."""
-        self.settings.temperature = value
+        self._own_settings().temperature = value
         logger.debug(f"Temperature updated to: {value}")
 
-    def _get_prompt(self, error: Exception) -> str:
-        """Get the diagnosis prompt for an error."""
-        stack_trace = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    def _own_settings(self):
+        """Get settings this diagnoser may change, copying the shared ones so other diagnosers keep theirs.
+
+        A diagnoser with its own copy no longer sees reloaded config files.
+        """
+        if self._shared_settings:
+            shared, self.settings = self.settings, self.settings.model_copy()
+            for provider in self.providers:
+                if provider.config is shared:
+                    provider.config = self.settings
+                provider.settings = self.settings
+            self._shared_settings = False
+        return self.settings
+
+    @staticmethod
+    def _diagnosable(error: Exception | ExceptionSnapshot | str) -> Exception | ExceptionSnapshot:
+        """Parse traceback text into a snapshot; exceptions and snapshots are diagnosed as they are."""
+        if isinstance(error, str):
+            return ExceptionSnapshot.from_text(error)
+        return error
+
+    @staticmethod
+    def _error_type(error: Exception | ExceptionSnapshot) -> str:
+        if isinstance(error, ExceptionSnapshot):
+            return error.exc_type.rsplit(".", 1)[-1] or "traceback"
+        return type(error).__name__
+
+    @staticmethod
+    def _format_exception(error: Exception | ExceptionSnapshot) -> str:
+        """Format an exception or snapshot's full traceback, uncompacted."""
+        if isinstance(error, ExceptionSnapshot):
+            return error.format()
+        return "".join(traceback.format_exception(type(error), error, error.__traceback__))
+
+    def _stack_trace(self, error: Exception | ExceptionSnapshot) -> str:
+        """Get the stack trace of an error as included in prompts, compacted if enabled."""
+        started = time.perf_counter()
+        try:
+            return self._format_stack_trace(error)
+        finally:
+            self.metrics.observe("prompt_build", time.perf_counter() - started)
+
+    def _format_stack_trace(self, error: Exception | ExceptionSnapshot) -> str:
+        stack_trace = self._format_exception(error)
+        if not self.settings.compact_prompts:
+            return stack_trace
+        compact = compact_snapshot if isinstance(error, ExceptionSnapshot) else compact_traceback
+        compacted = compact(
+            error,
+            collapse_library=self.settings.collapse_library_frames,
+            max_chain_depth=self.settings.max_chain_depth,
+            max_repr=self.settings.max_repr_length,
+            max_tokens=self.settings.max_prompt_tokens,
+        )
+        saved = self.compaction.record(stack_trace, compacted)
+        logger.debug(f"Compacted stack trace, saved ~{saved} tokens")
+        return compacted
+
+    def _get_prompt(self, error: Exception | ExceptionSnapshot, local_vars: str | None = None,
+                    structured: bool = False) -> str:
+        """Get the diagnosis prompt for an error, optionally with a summary of local variables.
+
+        Snapshots taken with locals include them unless ``local_vars`` is given.
+        """
+        return self._trace_prompt(self._prompt_trace(error, local_vars), structured)
+
+    def _prompt_trace(self, error: Exception | ExceptionSnapshot, local_vars: str | None = None) -> str:
+        """Get the stack trace of an error with its locals and source context, as single and batch prompts include it."""
+        if local_vars is None and isinstance(error, ExceptionSnapshot):
+            local_vars = error.locals
+        stack_trace = self._stack_trace(error)
+        if local_vars:
+            stack_trace += f"\nLocal variables in the failing frame:\n{local_vars}\n"
+        if self.settings.source_context:
+            context = self._source_context(error)
+            if context:
+                stack_trace += f"\n{context}"
+        return stack_trace
+
+    def _source_context(self, error: Exception | ExceptionSnapshot) -> str:
+        """Get the source around the innermost project frames, or "" if none of their files can be read."""
+        try:
+            return source_context(
+                error,
+                get_source_cache(self.settings.source_cache_max_bytes),
+                lines=self.settings.source_context_lines,
+                max_frames=self.settings.source_context_max_frames,
+                max_chain_depth=self.settings.max_chain_depth,
+                max_line=self.settings.max_repr_length,
+            )
+        except Exception as e:
+            logger.warning(f"Could not add source context: {str(e)}")
+            return ""
+
+    def _trace_prompt(self, stack_trace: str, structured: bool = False) -> str:
+        """Get the diagnosis prompt for an already formatted stack trace, asking for JSON if structured."""
+        if structured:
+            return (
+                "I received the following stack trace from a Python application. "
+                "Find the specific file and line number where the error occurred, "
+                "explain what went wrong and suggest a fix.\n\n"
+                f"Stack Trace:\n{stack_trace}\n"
+                + STRUCTURED_INSTRUCTIONS
+            )
         return (
             "I received the following stack trace from a Python application. "
             "Please analyze the error and provide a diagnosis that includes:\n"
@@ -115,110 +404,1107 @@ class LLMExceptionDiagnoser:
             "explanation, and fix. If file and line information is available, always reference it."
         )
 
-    def _log_debug_info(self, error: Exception):
-        """Log debug information if DEBUG environment variable is set."""
-        if os.getenv("DEBUG"):
+    def _cache_key(self, error: Exception | ExceptionSnapshot, prompt_version: int | str = PROMPT_VERSION) -> str:
+        """Get the cache key for an error under the current provider, model and prompt."""
+        if isinstance(error, ExceptionSnapshot):
+            return self._fingerprint_key(error.fingerprint, prompt_version)
+        return self._fingerprint_key(fingerprint_exception(error), prompt_version)
+
+    def _fingerprint_key(self, fingerprint: str, prompt_version: int | str = PROMPT_VERSION) -> str:
+        """Get the cache key for a traceback fingerprint under the current provider, model and prompt."""
+        return make_cache_key(
+            fingerprint,
+            self.settings.provider,
+            self.settings.llm_model,
+            prompt_version,
+        )
+
+    def _lookup(self, key: str) -> str | None:
+        """Look up a diagnosis in the in-memory cache, then the persistent store."""
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None and self.store is not None:
+            cached = self._lookup_store(key)
+        self.metrics.count("cache_misses" if cached is None else "cache_hits")
+        return cached
+
+    async def _alookup(self, key: str) -> str | None:
+        """Async version of _lookup; the persistent store is read in a worker thread."""
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None and self.store is not None:
+            cached = await asyncio.to_thread(self._lookup_store, key)
+        self.metrics.count("cache_misses" if cached is None else "cache_hits")
+        return cached
+
+    def _lookup_store(self, key: str) -> str | None:
+        """Look up a diagnosis in the persistent store, copying a hit to the in-memory cache."""
+        try:
+            stored = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"Diagnosis store lookup failed: {str(e)}")
+            return None
+        if stored is not None and self.cache is not None:
+            self.cache.set(key, stored)
+        return stored
+
+    def _remember(self, key: str, diagnosis: str, text: str | None = None):
+        """Save a fresh diagnosis to the in-memory cache and the persistent store.
+
+        When ``text`` (the error's similarity text) is given, the diagnosis is also
+        added to the similarity index.
+        """
+        if self.cache is not None:
+            self.cache.set(key, diagnosis)
+        if self.store is not None:
+            try:
+                self.store.set(key, diagnosis)
+            except Exception as e:
+                logger.warning(f"Diagnosis store write failed: {str(e)}")
+        if text is not None and self.similarity is not None:
+            try:
+                self.similarity.add(text, diagnosis)
+            except Exception as e:
+                logger.warning(f"Similarity index update failed: {str(e)}")
+
+    async def _aremember(self, key: str, diagnosis: str, text: str | None = None):
+        """Async version of _remember; writes to the persistent store and embedding with a model run in a worker thread."""
+        if self.store is not None or (text is not None and self._embeds_blocking):
+            await asyncio.to_thread(self._remember, key, diagnosis, text)
+        else:
+            self._remember(key, diagnosis, text)
+
+    def _embedding_client(self):
+        """Get the Ollama client used for embeddings: the first Ollama backend's, or a default one."""
+        provider = next((p for p in self.providers if p.kind == "ollama"), None)
+        if provider is not None:
+            return provider.sync_client
+        pool = (self.settings.max_connections, self.settings.max_keepalive_connections,
+                self.settings.keepalive_expiry)
+        return get_client("ollama", None, None, self.settings.timeout, pool, False)
+
+    @property
+    def _embeds_blocking(self) -> bool:
+        """Whether the similarity index embeds with a model, which blocks on a request."""
+        return self.similarity is not None and self.similarity.embedder.blocking
+
+    def _similarity_text(self, error: Exception | ExceptionSnapshot) -> str | None:
+        """Get an error's similarity text, or None when the similarity index is off."""
+        if self.similarity is None:
+            return None
+        return similarity_text(error)
+
+    def _reuse_similar(self, key: str, text: str | None) -> str | None:
+        """Get the marked diagnosis of a similar, already diagnosed error, caching it under ``key``."""
+        if text is None or self.similarity is None:
+            return None
+        try:
+            match = self.similarity.lookup(text)
+        except Exception as e:
+            logger.warning(f"Similarity lookup failed: {str(e)}")
+            return None
+        if match is None:
+            return None
+        logger.info(f"Reusing diagnosis of a similar error (similarity {match.score:.2f})")
+        self.metrics.count("similar_hits")
+        diagnosis = REUSED_MARKER.format(score=match.score) + match.diagnosis
+        self._remember(key, diagnosis)
+        return diagnosis
+
+    async def _areuse_similar(self, key: str, text: str | None) -> str | None:
+        """Async version of _reuse_similar; embedding with a model and storing the match run in a worker thread."""
+        if text is None or self.similarity is None:
+            return None
+        if self._embeds_blocking or self.store is not None:
+            return await asyncio.to_thread(self._reuse_similar, key, text)
+        return self._reuse_similar(key, text)
+
+    def _format_diagnosis(self, diagnosis: str, formatted: bool) -> str:
+        """Wrap a diagnosis in clear boundaries if formatting is requested."""
+        if formatted:
+            return DIAGNOSIS_HEADER + diagnosis + DIAGNOSIS_FOOTER
+        return diagnosis
+
+    def _skipped_diagnosis(self, error: Exception | ExceptionSnapshot, reason: str) -> str:
+        """Get the cheap fallback returned when a limit prevents an LLM call: the raw traceback."""
+        stack_trace = self._format_exception(error)
+        return f"LLM diagnosis skipped ({reason}).\n\n{stack_trace}"
+
+    def _log_debug_info(self, error: Exception | ExceptionSnapshot):
+        """Log debug information if DEBUG environment variable was set at startup."""
+        if self._debug:
             logger.debug(f"Provider: {self.settings.provider}")
             logger.debug(f"Diagnosing error: {error}")
             logger.debug(f"Using model: {self.settings.llm_model}")
 
-    async def async_diagnose(self, error: Exception, formatted: bool = True) -> str:
-        """Diagnose an exception using LLM (async version)."""
+    def _record_usage(self, usage: Usage):
+        """Record the tokens a provider reports using against the daily budget and in the metrics."""
+        prompt_tokens, completion_tokens = usage
+        self.limiter.record_usage(prompt_tokens + completion_tokens)
+        self.metrics.count("prompt_tokens", prompt_tokens)
+        self.metrics.count("completion_tokens", completion_tokens)
+
+    def _record_model_load(self, seconds: float):
+        """Record how long a request waited for the model to load, counting it as cold or warm."""
+        self.metrics.observe("model_load", seconds)
+        self.metrics.count("cold_model_requests" if seconds >= COLD_LOAD_SECONDS else "warm_model_requests")
+
+    def _record_provider_error(self, error: Exception, elapsed: float):
+        """Record a failed provider request attempt in the metrics."""
+        self.metrics.observe("provider", elapsed)
+        self.metrics.count("provider_errors")
+        if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+            self.metrics.count("provider_timeouts")
+
+    def _available_providers(self) -> Iterator[Provider]:
+        """Yield the backends in failover order, skipping those whose circuit is open."""
+        for provider in self.providers:
+            if provider.breaker().allow():
+                yield provider
+            else:
+                logger.debug(f"Skipping {provider.name}: circuit open")
+
+    def _hedge_delay(self, provider: Provider) -> float | None:
+        """Get how long to wait for a backend before hedging, or None if hedging is off or not yet calibrated."""
+        if self.settings.hedge_percentile is None or len(self.providers) < 2:
+            return None
+        return provider.latency.percentile(self.settings.hedge_percentile, self.settings.hedge_min_samples)
+
+    def _hedge_pool(self) -> ThreadPoolExecutor:
+        """Get the thread pool sync hedged requests run on, creating it on first use."""
+        if self._hedge_executor is None:
+            with self._hedge_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=2 * len(self.providers), thread_name_prefix="llm-catcher-hedge"
+                    )
+        return self._hedge_executor
+
+    async def _acall(self, provider: Provider, prompt: str, deadline: float | None, json_mode: bool = False,
+                     answers: int = 1) -> str:
+        """Call one backend within the deadline, retrying transient errors (async version)."""
+        breaker = provider.breaker()
+        delays = backoff_delays(self.settings.retry_backoff, self.settings.retry_backoff_max)
+        attempt = 0
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            started = time.monotonic()
+            self.metrics.count("provider_requests")
+            try:
+                with self.metrics.span("provider", provider=provider.name, attempt=attempt):
+                    diagnosis, usage = await asyncio.wait_for(
+                        provider.acomplete(prompt, remaining, json_mode=json_mode, answers=answers), remaining
+                    )
+            except Exception as e:
+                self._record_provider_error(e, time.monotonic() - started)
+                delay = next(delays)
+                if (attempt >= self.settings.max_retries or not is_transient(e)
+                        or (deadline is not None and time.monotonic() + delay >= deadline)):
+                    breaker.record_failure()
+                    raise
+                attempt += 1
+                logger.warning(f"Retrying diagnosis in {delay:.2f}s after error: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            elapsed = time.monotonic() - started
+            provider.latency.record(elapsed)
+            self.metrics.observe("provider", elapsed)
+            self._record_usage(usage)
+            breaker.record_success()
+            return diagnosis
+
+    def _call(self, provider: Provider, prompt: str, deadline: float | None, json_mode: bool = False,
+              answers: int = 1) -> str:
+        """Call one backend within the deadline, retrying transient errors (sync version)."""
+        breaker = provider.breaker()
+        delays = backoff_delays(self.settings.retry_backoff, self.settings.retry_backoff_max)
+        attempt = 0
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            started = time.monotonic()
+            self.metrics.count("provider_requests")
+            try:
+                with self.metrics.span("provider", provider=provider.name, attempt=attempt):
+                    diagnosis, usage = provider.complete(prompt, remaining, json_mode=json_mode, answers=answers)
+            except Exception as e:
+                self._record_provider_error(e, time.monotonic() - started)
+                delay = next(delays)
+                if (attempt >= self.settings.max_retries or not is_transient(e)
+                        or (deadline is not None and time.monotonic() + delay >= deadline)):
+                    breaker.record_failure()
+                    raise
+                attempt += 1
+                logger.warning(f"Retrying diagnosis in {delay:.2f}s after error: {str(e)}")
+                time.sleep(delay)
+                continue
+            elapsed = time.monotonic() - started
+            provider.latency.record(elapsed)
+            self.metrics.observe("provider", elapsed)
+            self._record_usage(usage)
+            breaker.record_success()
+            return diagnosis
+
+    async def _ahedged_call(self, provider: Provider, fallbacks: Iterator[Provider], prompt: str,
+                            deadline: float | None, delay: float, json_mode: bool = False, answers: int = 1) -> str:
+        """Call a backend, also sending the prompt to the next one if it's slower than usual (async version).
+
+        The first successful answer wins and the other request is cancelled.
+        """
+        pending = {asyncio.ensure_future(self._acall(provider, prompt, deadline, json_mode, answers))}
+        hedged = False
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if hedged else delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    hedge = next(fallbacks, None)
+                    if hedge is not None:
+                        logger.info(f"No answer from {provider.name} after {delay:.2f}s, hedging with {hedge.name}")
+                        pending.add(asyncio.ensure_future(self._acall(hedge, prompt, deadline, json_mode, answers)))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def _hedged_call(self, provider: Provider, fallbacks: Iterator[Provider], prompt: str,
+                     deadline: float | None, delay: float, json_mode: bool = False, answers: int = 1) -> str:
+        """Call a backend, also sending the prompt to the next one if it's slower than usual (sync version).
+
+        The first successful answer wins; the other request is left to finish in the background.
+        """
+        executor = self._hedge_pool()
+        pending = {executor.submit(self._call, provider, prompt, deadline, json_mode, answers)}
+        hedged = False
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else delay, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                hedge = next(fallbacks, None)
+                if hedge is not None:
+                    logger.info(f"No answer from {provider.name} after {delay:.2f}s, hedging with {hedge.name}")
+                    pending.add(executor.submit(self._call, hedge, prompt, deadline, json_mode, answers))
+                continue
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _acomplete_with_retries(self, prompt: str, json_mode: bool = False, answers: int = 1) -> str:
+        """Get a diagnosis from the first backend that answers within the deadline (async version).
+
+        Backends are tried in order, skipping those whose circuit is open. Transient
+        errors are retried on each backend before failing over to the next one.
+        ``answers`` is how many diagnoses the prompt asks for; the token limit is
+        multiplied by it.
+        """
+        timeout = self.settings.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        available = self._available_providers()
+        error = None
+        for provider in available:
+            try:
+                delay = self._hedge_delay(provider)
+                if delay is None:
+                    return await self._acall(provider, prompt, deadline, json_mode, answers)
+                return await self._ahedged_call(provider, available, prompt, deadline, delay, json_mode, answers)
+            except Exception as e:
+                error = e
+                logger.warning(f"Diagnosis with {provider.name} failed: {str(e)}")
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        if error is None:
+            raise DiagnosisSkipped("circuit open")
+        raise error
+
+    def _complete_with_retries(self, prompt: str, json_mode: bool = False, answers: int = 1) -> str:
+        """Get a diagnosis from the first backend that answers within the deadline (sync version).
+
+        Backends are tried in order, skipping those whose circuit is open. Transient
+        errors are retried on each backend before failing over to the next one.
+        ``answers`` is how many diagnoses the prompt asks for; the token limit is
+        multiplied by it.
+        """
+        timeout = self.settings.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        available = self._available_providers()
+        error = None
+        for provider in available:
+            try:
+                delay = self._hedge_delay(provider)
+                if delay is None:
+                    return self._call(provider, prompt, deadline, json_mode, answers)
+                return self._hedged_call(provider, available, prompt, deadline, delay, json_mode, answers)
+            except Exception as e:
+                error = e
+                logger.warning(f"Diagnosis with {provider.name} failed: {str(e)}")
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        if error is None:
+            raise DiagnosisSkipped("circuit open")
+        raise error
+
+    async def _adiagnose_prompt(self, key: str, build_prompt: Callable[[], str],
+                                similarity_text: str | None = None, json_mode: bool = False) -> str:
+        """Get the unformatted diagnosis for a cache key, building the prompt only on a miss.
+
+        On a miss, a similar error's diagnosis is reused if ``similarity_text`` is given
+        and the similarity index has a close enough match. With ``json_mode`` the
+        backends are asked for a JSON object.
+        """
+        cached = await self._alookup(key)
+        if cached is not None:
+            logger.info("Using cached diagnosis")
+            return cached
+
+        async def request() -> str:
+            reused = await self._areuse_similar(key, similarity_text)
+            if reused is not None:
+                return reused
+            self.limiter.acquire(key)
+            try:
+                diagnosis = await self._acomplete_with_retries(build_prompt(), json_mode)
+            finally:
+                self.limiter.release()
+            await self._aremember(key, diagnosis, similarity_text)
+            return diagnosis
+
+        # Concurrent callers with the same fingerprint share one LLM request
+        return await self.inflight.ado(key, request)
+
+    def _diagnose_prompt(self, key: str, build_prompt: Callable[[], str],
+                         similarity_text: str | None = None, json_mode: bool = False) -> str:
+        """Get the unformatted diagnosis for a cache key, building the prompt only on a miss.
+
+        On a miss, a similar error's diagnosis is reused if ``similarity_text`` is given
+        and the similarity index has a close enough match. With ``json_mode`` the
+        backends are asked for a JSON object.
+        """
+        cached = self._lookup(key)
+        if cached is not None:
+            logger.info("Using cached diagnosis")
+            return cached
+
+        def request() -> str:
+            reused = self._reuse_similar(key, similarity_text)
+            if reused is not None:
+                return reused
+            self.limiter.acquire(key)
+            try:
+                diagnosis = self._complete_with_retries(build_prompt(), json_mode)
+            finally:
+                self.limiter.release()
+            self._remember(key, diagnosis, similarity_text)
+            return diagnosis
+
+        # Concurrent callers with the same fingerprint share one LLM request
+        return self.inflight.do(key, request)
+
+    async def async_diagnose(self, error: Exception | ExceptionSnapshot | str, formatted: bool = True) -> str:
+        """Diagnose an exception using LLM (async version).
+
+        Besides live exceptions, accepts an ExceptionSnapshot or formatted traceback
+        text, so diagnosis can happen after the traceback is gone.
+        """
+        started = time.monotonic()
+        self.metrics.count("diagnoses")
+        error = self._diagnosable(error)
+        try:
+            with self.metrics.span("diagnose", error_type=self._error_type(error)):
+                return await self._adiagnose_error(error, formatted)
+        finally:
+            self.metrics.observe("diagnosis", time.monotonic() - started)
+
+    async def _adiagnose_error(self, error: Exception | ExceptionSnapshot, formatted: bool) -> str:
         try:
             logger.info(f"Diagnosing error with {self.settings.provider}")
             self._log_debug_info(error)
-            message = {"role": "user", "content": self._get_prompt(error)}
-
-            if self.settings.provider == "openai":
-                response = await self.async_client.chat.completions.create(
-                    model=self.settings.llm_model,
-                    messages=[message],
-                    temperature=self.settings.temperature,
-                )
-                diagnosis = response.choices[0].message.content.strip()
-            elif self.settings.provider == "ollama":
-                response = await self.async_client.chat(
-                    model=self.settings.llm_model,
-                    messages=[message]
-                )
-                diagnosis = response.message.content.strip()
-
-            if formatted:
-                # Format the diagnosis with clear boundaries
-                return "\n" + \
-                    "="*80 + "\n" + \
-                    "LLM DIAGNOSIS\n" + \
-                    "="*80 + "\n" + \
-                    f"{diagnosis}\n" + \
-                    "="*80 + "\n"
-            else:
-                return diagnosis
+            diagnosis = await self._adiagnose_prompt(self._cache_key(error), lambda: self._get_prompt(error),
+                                                     self._similarity_text(error))
+            return self._format_diagnosis(diagnosis, formatted)
 
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            return self._skipped_diagnosis(error, e.reason)
         except Exception as e:
             logger.error(f"Error during diagnosis: {str(e)}")
             return f"Failed to contact LLM for diagnosis. Error: {str(e)}"
 
-    def diagnose(self, error: Exception, formatted: bool = True) -> str:
-        """Diagnose an exception using LLM (sync version)."""
+    def diagnose(self, error: Exception | ExceptionSnapshot | str, formatted: bool = True) -> str:
+        """Diagnose an exception using LLM (sync version).
+
+        Besides live exceptions, accepts an ExceptionSnapshot or formatted traceback
+        text, so diagnosis can happen after the traceback is gone.
+        """
+        started = time.monotonic()
+        self.metrics.count("diagnoses")
+        error = self._diagnosable(error)
+        try:
+            with self.metrics.span("diagnose", error_type=self._error_type(error)):
+                return self._diagnose_error(error, formatted)
+        finally:
+            self.metrics.observe("diagnosis", time.monotonic() - started)
+
+    def _diagnose_error(self, error: Exception | ExceptionSnapshot, formatted: bool) -> str:
         try:
             logger.info(f"Diagnosing error with {self.settings.provider}")
             self._log_debug_info(error)
-            message = {"role": "user", "content": self._get_prompt(error)}
+            diagnosis = self._diagnose_prompt(self._cache_key(error), lambda: self._get_prompt(error),
+                                              self._similarity_text(error))
+            return self._format_diagnosis(diagnosis, formatted)
 
-            if self.settings.provider == "openai":
-                response = self.sync_client.chat.completions.create(
-                    model=self.settings.llm_model,
-                    messages=[message],
-                    temperature=self.settings.temperature,
-                )
-                diagnosis = response.choices[0].message.content.strip()
-            elif self.settings.provider == "ollama":
-                response = self.sync_client.chat(
-                    model=self.settings.llm_model,
-                    messages=[message]
-                )
-                diagnosis = response.message.content.strip()
-
-            if formatted:
-                # Format the diagnosis with clear boundaries
-                return "\n" + \
-                    "="*80 + "\n" + \
-                    "LLM DIAGNOSIS\n" + \
-                    "="*80 + "\n" + \
-                    f"{diagnosis}\n" + \
-                    "="*80 + "\n"
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            return self._skipped_diagnosis(error, e.reason)
+        except Exception as e:
+            logger.error(f"Error during diagnosis: {str(e)}")
+            return f"Failed to contact LLM for diagnosis. Error: {str(e)}"
+
+    async def async_diagnose_result(self, error: Exception | ExceptionSnapshot | str) -> DiagnosisResult:
+        """Diagnose an exception, returning the file, line, explanation and fix as fields (async version).
+
+        The model is asked for a JSON object, in the JSON mode of backends that
+        support one. Answers are cached separately from free-text diagnoses and
+        don't use the similarity index. Never raises: ``source`` is "skipped" or
+        "failed" when no diagnosis could be made.
+        """
+        started = time.monotonic()
+        self.metrics.count("diagnoses")
+        error = self._diagnosable(error)
+        requested = []
+
+        def build_prompt() -> str:
+            requested.append(True)
+            return self._get_prompt(error, structured=True)
+
+        try:
+            with self.metrics.span("diagnose", error_type=self._error_type(error)):
+                logger.info(f"Diagnosing error with {self.settings.provider}")
+                self._log_debug_info(error)
+                answer = await self._adiagnose_prompt(self._cache_key(error, STRUCTURED_PROMPT_VERSION),
+                                                      build_prompt, json_mode=True)
+            return DiagnosisResult.parse(answer, self._error_summary(error), "llm" if requested else "cache",
+                                         time.monotonic() - started)
+        except Exception as e:
+            return self._failed_result(error, e, started)
+        finally:
+            self.metrics.observe("diagnosis", time.monotonic() - started)
+
+    def diagnose_result(self, error: Exception | ExceptionSnapshot | str) -> DiagnosisResult:
+        """Diagnose an exception, returning the file, line, explanation and fix as fields (sync version).
+
+        Example:
+            result = diagnoser.diagnose_result(e)
+            print(f"{result.file}:{result.line}: {result.fix}")
+        """
+        started = time.monotonic()
+        self.metrics.count("diagnoses")
+        error = self._diagnosable(error)
+        requested = []
+
+        def build_prompt() -> str:
+            requested.append(True)
+            return self._get_prompt(error, structured=True)
+
+        try:
+            with self.metrics.span("diagnose", error_type=self._error_type(error)):
+                logger.info(f"Diagnosing error with {self.settings.provider}")
+                self._log_debug_info(error)
+                answer = self._diagnose_prompt(self._cache_key(error, STRUCTURED_PROMPT_VERSION),
+                                               build_prompt, json_mode=True)
+            return DiagnosisResult.parse(answer, self._error_summary(error), "llm" if requested else "cache",
+                                         time.monotonic() - started)
+        except Exception as e:
+            return self._failed_result(error, e, started)
+        finally:
+            self.metrics.observe("diagnosis", time.monotonic() - started)
+
+    @staticmethod
+    def _error_summary(error: Exception | ExceptionSnapshot) -> str:
+        """Get the last line of an error's traceback, e.g. "KeyError: 'user'"."""
+        if isinstance(error, ExceptionSnapshot):
+            return error.summary
+        return "".join(traceback.format_exception_only(type(error), error)).strip()
+
+    def _failed_result(self, error: Exception | ExceptionSnapshot, failure: Exception,
+                       started: float) -> DiagnosisResult:
+        """Get the result standing in for a diagnosis that was skipped or failed."""
+        if isinstance(failure, DiagnosisSkipped):
+            logger.warning(f"Skipping LLM diagnosis: {failure.reason}")
+            self.metrics.count("skipped")
+            source, explanation = "skipped", f"LLM diagnosis skipped ({failure.reason})."
+        else:
+            logger.error(f"Error during diagnosis: {str(failure)}")
+            source, explanation = "failed", f"Failed to contact LLM for diagnosis. Error: {str(failure)}"
+        return DiagnosisResult(self._error_summary(error), explanation, source=source,
+                               elapsed=time.monotonic() - started)
+
+    def _plan_batches(self, errors: List[Exception], formatted: bool) -> Tuple[
+            List[str], Dict[str, str], Dict[str, Exception], List[List[Tuple[str, str]]]]:
+        """Deduplicate errors by fingerprint, answer cached ones and pack the rest into batches.
+
+        Returns:
+            The key of each error, results for cached keys, the first error seen per
+            uncached key, and batches of (key, stack trace) to send
+        """
+        keys = [self._cache_key(error) for error in errors]
+        results: Dict[str, str] = {}
+        pending: Dict[str, Exception] = {}
+        for key, error in zip(keys, errors):
+            if key in results or key in pending:
+                continue
+            cached = self._lookup(key)
+            if cached is None:
+                cached = self._reuse_similar(key, self._similarity_text(error))
+            if cached is not None:
+                results[key] = self._format_diagnosis(cached, formatted)
             else:
-                return diagnosis
+                pending[key] = error
+        batches = pack_batches(
+            [(key, self._prompt_trace(error)) for key, error in pending.items()],
+            max_tokens=self.settings.batch_max_tokens,
+            max_items=self.settings.batch_max_items,
+        )
+        logger.info(f"Diagnosing {len(errors)} errors: {len(results)} cached, {len(pending)} unique "
+                    f"uncached in {len(batches)} batches")
+        return keys, results, pending, batches
+
+    async def _adiagnose_batch(self, batch: List[Tuple[str, str]], errors: Dict[str, Exception],
+                               formatted: bool) -> Dict[str, str]:
+        """Diagnose a batch of distinct errors with a single LLM request (async version)."""
+        if len(batch) == 1:
+            key = batch[0][0]
+            return {key: await self.async_diagnose(errors[key], formatted)}
+        try:
+            self.limiter.acquire(None)
+            try:
+                response = await self._acomplete_with_retries(build_batch_prompt([trace for _, trace in batch]),
+                                                              answers=len(batch))
+            finally:
+                self.limiter.release()
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            return {key: self._skipped_diagnosis(errors[key], e.reason) for key, _ in batch}
+        except Exception as e:
+            logger.error(f"Error during batch diagnosis: {str(e)}")
+            return {key: f"Failed to contact LLM for diagnosis. Error: {str(e)}" for key, _ in batch}
+
+        results = {}
+        for (key, _), diagnosis in zip(batch, parse_batch_response(response, len(batch))):
+            if diagnosis is None:
+                # The model left this one out; ask about it on its own
+                results[key] = await self.async_diagnose(errors[key], formatted)
+            else:
+                await self._aremember(key, diagnosis, self._similarity_text(errors[key]))
+                results[key] = self._format_diagnosis(diagnosis, formatted)
+        return results
+
+    def _diagnose_batch(self, batch: List[Tuple[str, str]], errors: Dict[str, Exception],
+                        formatted: bool) -> Dict[str, str]:
+        """Diagnose a batch of distinct errors with a single LLM request (sync version)."""
+        if len(batch) == 1:
+            key = batch[0][0]
+            return {key: self.diagnose(errors[key], formatted)}
+        try:
+            self.limiter.acquire(None)
+            try:
+                response = self._complete_with_retries(build_batch_prompt([trace for _, trace in batch]), answers=len(batch))
+            finally:
+                self.limiter.release()
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            return {key: self._skipped_diagnosis(errors[key], e.reason) for key, _ in batch}
+        except Exception as e:
+            logger.error(f"Error during batch diagnosis: {str(e)}")
+            return {key: f"Failed to contact LLM for diagnosis. Error: {str(e)}" for key, _ in batch}
+
+        results = {}
+        for (key, _), diagnosis in zip(batch, parse_batch_response(response, len(batch))):
+            if diagnosis is None:
+                # The model left this one out; ask about it on its own
+                results[key] = self.diagnose(errors[key], formatted)
+            else:
+                self._remember(key, diagnosis, self._similarity_text(errors[key]))
+                results[key] = self._format_diagnosis(diagnosis, formatted)
+        return results
+
+    async def adiagnose_many(self, errors: Iterable[Exception | ExceptionSnapshot | str],
+                             formatted: bool = True) -> List[str]:
+        """Diagnose many exceptions, grouping distinct ones into batched LLM requests (async version).
+
+        Errors sharing a fingerprint are diagnosed once. Batches run concurrently,
+        up to ``batch_concurrency`` at a time.
+
+        Returns:
+            One diagnosis per error, in input order
+        """
+        errors = [self._diagnosable(error) for error in errors]
+        if self.store is not None or self._embeds_blocking or self.settings.source_context:
+            # Lookups read the persistent store or embed with a model, and source context reads files
+            keys, results, pending, batches = await asyncio.to_thread(self._plan_batches, errors, formatted)
+        else:
+            keys, results, pending, batches = self._plan_batches(errors, formatted)
+        semaphore = asyncio.Semaphore(self.settings.batch_concurrency)
+
+        async def run(batch: List[Tuple[str, str]]) -> Dict[str, str]:
+            async with semaphore:
+                return await self._adiagnose_batch(batch, pending, formatted)
+
+        for batch_results in await asyncio.gather(*(run(batch) for batch in batches)):
+            results.update(batch_results)
+        return [results[key] for key in keys]
+
+    def diagnose_many(self, errors: Iterable[Exception | ExceptionSnapshot | str], formatted: bool = True) -> List[str]:
+        """Diagnose many exceptions, grouping distinct ones into batched LLM requests (sync version).
+
+        Errors sharing a fingerprint are diagnosed once. Batches run concurrently,
+        up to ``batch_concurrency`` at a time.
+
+        Example:
+            diagnoses = diagnoser.diagnose_many(errors)
+
+        Returns:
+            One diagnosis per error, in input order
+        """
+        errors = [self._diagnosable(error) for error in errors]
+        keys, results, pending, batches = self._plan_batches(errors, formatted)
+        if len(batches) == 1:
+            results.update(self._diagnose_batch(batches[0], pending, formatted))
+        elif batches:
+            workers = min(self.settings.batch_concurrency, len(batches))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-catcher-batch") as executor:
+                for batch_results in executor.map(lambda batch: self._diagnose_batch(batch, pending, formatted), batches):
+                    results.update(batch_results)
+        return [results[key] for key in keys]
+
+    async def _astream_with_retries(self, prompt: str) -> AsyncIterator[str]:
+        """Stream a diagnosis from the first backend that starts answering within the deadline (async version).
+
+        Like _acomplete_with_retries, but only failures before the first chunk are
+        retried or failed over: text already yielded can't be taken back.
+        """
+        timeout = self.settings.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        error = None
+        for provider in self._available_providers():
+            breaker = provider.breaker()
+            delays = backoff_delays(self.settings.retry_backoff, self.settings.retry_backoff_max)
+            attempt = 0
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                started = time.monotonic()
+                self.metrics.count("provider_requests")
+                streaming = False
+                try:
+                    async for chunk in atrim_stream(awith_deadline(provider.astream(prompt, self._record_usage),
+                                                                   remaining)):
+                        streaming = True
+                        yield chunk
+                except Exception as e:
+                    self._record_provider_error(e, time.monotonic() - started)
+                    delay = next(delays)
+                    if streaming:
+                        breaker.record_failure()
+                        raise
+                    if (attempt < self.settings.max_retries and is_transient(e)
+                            and (deadline is None or time.monotonic() + delay < deadline)):
+                        attempt += 1
+                        logger.warning(f"Retrying diagnosis in {delay:.2f}s after error: {str(e)}")
+                        await asyncio.sleep(delay)
+                        continue
+                    breaker.record_failure()
+                    error = e
+                    logger.warning(f"Diagnosis with {provider.name} failed: {str(e)}")
+                    break
+                elapsed = time.monotonic() - started
+                provider.latency.record(elapsed)
+                self.metrics.observe("provider", elapsed)
+                breaker.record_success()
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if error is None:
+            raise DiagnosisSkipped("circuit open")
+        raise error
 
+    def _stream_with_retries(self, prompt: str) -> Iterator[str]:
+        """Stream a diagnosis from the first backend that starts answering within the deadline (sync version).
+
+        Like _complete_with_retries, but only failures before the first chunk are
+        retried or failed over: text already yielded can't be taken back.
+        """
+        timeout = self.settings.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        error = None
+        for provider in self._available_providers():
+            breaker = provider.breaker()
+            delays = backoff_delays(self.settings.retry_backoff, self.settings.retry_backoff_max)
+            attempt = 0
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                started = time.monotonic()
+                self.metrics.count("provider_requests")
+                streaming = False
+                try:
+                    for chunk in trim_stream(with_deadline(provider.stream(prompt, self._record_usage), remaining)):
+                        streaming = True
+                        yield chunk
+                except Exception as e:
+                    self._record_provider_error(e, time.monotonic() - started)
+                    delay = next(delays)
+                    if streaming:
+                        breaker.record_failure()
+                        raise
+                    if (attempt < self.settings.max_retries and is_transient(e)
+                            and (deadline is None or time.monotonic() + delay < deadline)):
+                        attempt += 1
+                        logger.warning(f"Retrying diagnosis in {delay:.2f}s after error: {str(e)}")
+                        time.sleep(delay)
+                        continue
+                    breaker.record_failure()
+                    error = e
+                    logger.warning(f"Diagnosis with {provider.name} failed: {str(e)}")
+                    break
+                elapsed = time.monotonic() - started
+                provider.latency.record(elapsed)
+                self.metrics.observe("provider", elapsed)
+                breaker.record_success()
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if error is None:
+            raise DiagnosisSkipped("circuit open")
+        raise error
+
+    async def astream_diagnose(self, error: Exception | ExceptionSnapshot | str,
+                               formatted: bool = True) -> AsyncIterator[str]:
+        """Diagnose an exception using LLM, yielding text as it is generated (async version).
+
+        Works as the body of a FastAPI/Starlette ``StreamingResponse``. Cached
+        diagnoses are yielded in one piece.
+
+        Example:
+            return StreamingResponse(diagnoser.astream_diagnose(e), media_type="text/plain")
+        """
+        logger.info(f"Streaming diagnosis with {self.settings.provider}")
+        error = self._diagnosable(error)
+        self._log_debug_info(error)
+        started = False
+        try:
+            async for chunk in self._astream_text(error):
+                if formatted and not started:
+                    yield DIAGNOSIS_HEADER
+                started = True
+                yield chunk
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            yield self._skipped_diagnosis(error, e.reason)
+            return
         except Exception as e:
             logger.error(f"Error during diagnosis: {str(e)}")
-            return f"Failed to contact LLM for diagnosis. Error: {str(e)}"
+            failure = f"Failed to contact LLM for diagnosis. Error: {str(e)}"
+            yield f"\n{failure}" + (DIAGNOSIS_FOOTER if formatted else "") if started else failure
+            return
+        if formatted:
+            yield DIAGNOSIS_FOOTER if started else DIAGNOSIS_HEADER + DIAGNOSIS_FOOTER
+
+    async def _astream_text(self, error: Exception | ExceptionSnapshot) -> AsyncIterator[str]:
+        """Yield the unformatted diagnosis of an error as it is generated.
+
+        Unlike astream_diagnose, failures are raised rather than yielded as text:
+        DiagnosisSkipped when the limits or circuit breakers refuse the request,
+        or the backend's error.
+        """
+        self.metrics.count("diagnoses")
+        key = self._cache_key(error)
+        cached = await self._alookup(key)
+        if cached is not None:
+            logger.info("Using cached diagnosis")
+            yield cached
+            return
+        # Concurrent streams and diagnoses of the same fingerprint share one LLM request;
+        # the others get its whole text when it finishes
+        async for chunk in self.inflight.astream(key, lambda: self._astream_request(error, key)):
+            yield chunk
+
+    async def _astream_request(self, error: Exception | ExceptionSnapshot, key: str) -> AsyncIterator[str]:
+        """Stream a fresh diagnosis, or yield a similar error's, and remember it."""
+        text = self._similarity_text(error)
+        reused = await self._areuse_similar(key, text)
+        if reused is not None:
+            yield reused
+            return
+        self.limiter.acquire(key)
+        chunks = []
+        try:
+            async for chunk in self._astream_with_retries(self._get_prompt(error)):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            self.limiter.release()
+        await self._aremember(key, "".join(chunks), text)
+
+    def stream_diagnose(self, error: Exception | ExceptionSnapshot | str, formatted: bool = True) -> Iterator[str]:
+        """Diagnose an exception using LLM, yielding text as it is generated (sync version).
+
+        Example:
+            for chunk in diagnoser.stream_diagnose(e):
+                print(chunk, end="", flush=True)
+        """
+        logger.info(f"Streaming diagnosis with {self.settings.provider}")
+        error = self._diagnosable(error)
+        self._log_debug_info(error)
+        started = False
+        try:
+            for chunk in self._stream_text(error):
+                if formatted and not started:
+                    yield DIAGNOSIS_HEADER
+                started = True
+                yield chunk
+        except DiagnosisSkipped as e:
+            logger.warning(f"Skipping LLM diagnosis: {e.reason}")
+            self.metrics.count("skipped")
+            yield self._skipped_diagnosis(error, e.reason)
+            return
+        except Exception as e:
+            logger.error(f"Error during diagnosis: {str(e)}")
+            failure = f"Failed to contact LLM for diagnosis. Error: {str(e)}"
+            yield f"\n{failure}" + (DIAGNOSIS_FOOTER if formatted else "") if started else failure
+            return
+        if formatted:
+            yield DIAGNOSIS_FOOTER if started else DIAGNOSIS_HEADER + DIAGNOSIS_FOOTER
+
+    def _stream_text(self, error: Exception | ExceptionSnapshot) -> Iterator[str]:
+        """Sync version of _astream_text: yield the unformatted diagnosis, raising failures."""
+        self.metrics.count("diagnoses")
+        key = self._cache_key(error)
+        cached = self._lookup(key)
+        if cached is not None:
+            logger.info("Using cached diagnosis")
+            yield cached
+            return
+        yield from self.inflight.stream(key, lambda: self._stream_request(error, key))
+
+    def _stream_request(self, error: Exception | ExceptionSnapshot, key: str) -> Iterator[str]:
+        """Sync version of _astream_request."""
+        text = self._similarity_text(error)
+        reused = self._reuse_similar(key, text)
+        if reused is not None:
+            yield reused
+            return
+        self.limiter.acquire(key)
+        chunks = []
+        try:
+            for chunk in self._stream_with_retries(self._get_prompt(error)):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            self.limiter.release()
+        self._remember(key, "".join(chunks), text)
+
+    @property
+    def _deferred(self) -> bool:
+        """Whether caught exceptions are handed off (queued or forwarded) instead of diagnosed inline."""
+        return self.background is not None or self.forwarder is not None
+
+    def _make_job(self, error: Exception | ExceptionSnapshot | str) -> DiagnosisJob | None:
+        """Snapshot an exception as a job for deferred diagnosis, or None if that fails."""
+        try:
+            error = self._diagnosable(error)
+            if isinstance(error, ExceptionSnapshot):
+                summary, local_vars = error.summary, None
+            else:
+                summary = "".join(traceback.format_exception_only(type(error), error)).strip()
+                local_vars = None
+                if self.settings.include_locals:
+                    local_vars = summarize_locals(error.__traceback__, max_repr=self.settings.max_repr_length)
+            return DiagnosisJob(
+                key=self._cache_key(error),
+                summary=summary,
+                prompt=self._get_prompt(error, local_vars),
+                similarity_text=self._similarity_text(error),
+            )
+        except Exception as e:
+            logger.error(f"Failed to snapshot exception: {str(e)}")
+            return None
+
+    def _dispatch_queue(self) -> DiagnosisQueue:
+        """Get the queue for deferred diagnoses: the background queue, or one created on first use."""
+        if self.background is not None:
+            return self.background
+        if self._hook_queue is None:
+            with self._hook_lock:
+                if self._hook_queue is None:
+                    self._hook_queue = DiagnosisQueue(
+                        self,
+                        sink=self._sink,
+                        maxsize=self.settings.background_queue_size,
+                        workers=self.settings.background_workers,
+                        drop_policy=self.settings.background_drop_policy,
+                        flush_timeout=self.settings.background_flush_timeout,
+                    )
+        return self._hook_queue
+
+    def _dispatch(self, error: Exception) -> bool:
+        """Hand an exception from a thread, event loop or future to the forwarder or a bounded queue."""
+        if self._deferred:
+            return self.submit(error)
+        job = self._make_job(error)
+        return job is not None and self._dispatch_queue().submit(job)
+
+    def submit(self, error: Exception | ExceptionSnapshot | str) -> bool:
+        """Snapshot an exception (or take a snapshot or traceback text) and queue it for background diagnosis.
+
+        Returns immediately; the diagnosis is delivered to the queue's sink, or
+        by the diagnosing process when ``forward_address`` is set.
+
+        Returns:
+            True if the exception was queued, False if it was dropped or background mode is off
+        """
+        if not self._deferred:
+            return False
+        job = self._make_job(error)
+        if job is None:
+            return False
+        if self.forwarder is not None:
+            return self.forwarder.send(job)
+        return self.background.submit(job)
+
+    def stats(self) -> Dict[str, object]:
+        """Get a snapshot of diagnosis latencies, token usage, errors and cache/coalescing rates.
+
+        Example:
+            diagnoser.stats()["latency"]["provider"]["mean"]
+        """
+        stats = self.metrics.snapshot()
+        counters = stats["counters"]
+        lookups = counters["cache_hits"] + counters["cache_misses"]
+        stats["cache_hit_rate"] = counters["cache_hits"] / lookups if lookups else 0.0
+        coalescing = self.inflight.stats()
+        requests = coalescing["leaders"] + coalescing["coalesced"]
+        stats["coalesced_rate"] = coalescing["coalesced"] / requests if requests else 0.0
+        stats["coalescing"] = coalescing
+        stats["cache"] = self.cache.stats() if self.cache is not None else None
+        stats["similarity"] = self.similarity.stats() if self.similarity is not None else None
+        stats["limits"] = self.limiter.stats()
+        stats["compaction"] = self.compaction.stats()
+        stats["sources"] = (get_source_cache(self.settings.source_cache_max_bytes).stats()
+                            if self.settings.source_context else None)
+        stats["breakers"] = {provider.name: provider.breaker().stats() for provider in self.providers}
+        stats["warmup"] = self.warmer.stats() if self.warmer is not None else None
+        queue = self.background or self._hook_queue
+        stats["queue"] = queue.stats() if queue is not None else None
+        return stats
+
+    def prometheus_metrics(self) -> str:
+        """Get the diagnoser's metrics in the Prometheus text exposition format, e.g. for a /metrics endpoint."""
+        stats = self.stats()
+        gauges = {
+            "cache_hit_ratio": stats["cache_hit_rate"],
+            "coalesced_ratio": stats["coalesced_rate"],
+            "inflight_requests": stats["coalescing"]["in_flight"],
+            "tokens_saved_by_compaction": stats["compaction"]["tokens_saved"],
+        }
+        if stats["cache"] is not None:
+            gauges["cache_entries"] = len(self.cache)
+        if stats["similarity"] is not None:
+            gauges["similarity_index_entries"] = stats["similarity"]["size"]
+        if stats["queue"] is not None:
+            gauges["queue_depth"] = stats["queue"]["queued"]
+            gauges["queue_dropped"] = stats["queue"]["dropped"]
+        return render_prometheus(self.metrics, gauges)
+
+    @staticmethod
+    def _first_report(error: Exception) -> bool:
+        """Mark an exception as reported, returning False if an inner catch or guard already reported it."""
+        try:
+            if getattr(error, "_llm_catcher_reported", False):
+                return False
+            error._llm_catcher_reported = True
+        except Exception:
+            pass
+        return True
+
+    def _report(self, error: Exception):
+        """Diagnose an exception caught by catch or guard and print it, or hand it off in deferred mode."""
+        if not self._first_report(error):
+            return
+        if self._deferred:
+            self.submit(error)
+        else:
+            print(self.diagnose(error), file=sys.stderr)
+
+    async def _areport(self, error: Exception):
+        """Diagnose an exception caught by catch or guard and print it, or hand it off in deferred mode (async)."""
+        if not self._first_report(error):
+            return
+        if self._deferred:
+            self.submit(error)
+        else:
+            print(await self.async_diagnose(error), file=sys.stderr)
 
     def catch(self, func: Callable[P, T]) -> Callable[P, T]:
         """Decorator to catch and diagnose exceptions in a function.
 
+        Works on functions, coroutine functions, generators, async generators,
+        methods, classmethods and staticmethods. Exceptions are re-raised after
+        diagnosis. The wrapper keeps the function's own signature, so calls that
+        don't raise cost about as much as an undecorated call.
+
         Example:
             @diagnoser.catch
             def my_function():
                 # This function's exceptions will be diagnosed
                 result = 1 / 0
         """
-        @wraps(func)
-        def sync_wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                diagnosis = self.diagnose(e)
-                print(diagnosis, file=sys.stderr)
-                raise  # Re-raise the exception after diagnosis
+        if isinstance(func, (classmethod, staticmethod)):
+            return type(func)(self.catch(func.__func__))
+        return wrap(func, self._report, self._areport)
 
-        @wraps(func)
-        async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-            try:
-                return await func(*args, **kwargs)
-            except Exception as e:
-                diagnosis = await self.async_diagnose(e)
-                print(diagnosis, file=sys.stderr)
-                raise  # Re-raise the exception after diagnosis
+    def guard(self) -> "Guard":
+        """Context manager that diagnoses exceptions raised in its block, then re-raises them.
+
+        Works with both ``with`` and ``async with``.
+
+        Example:
+            with diagnoser.guard():
+                process(item)
+        """
+        return self._guard
+
+
+class Guard:
+    """Context manager returned by LLMExceptionDiagnoser.guard(). It holds no state, so one instance is reused."""
+
+    __slots__ = ("_diagnoser",)
+
+    def __init__(self, diagnoser: LLMExceptionDiagnoser):
+        self._diagnoser = diagnoser
+
+    def __enter__(self) -> "Guard":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if isinstance(exc_value, Exception):
+            self._diagnoser._report(exc_value)
+        return False
+
+    async def __aenter__(self) -> "Guard":
+        return self
 
-        return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+    async def __aexit__(self, exc_type, exc_value, traceback) -> bool:
+        if isinstance(exc_value, Exception):
+            await self._diagnoser._areport(exc_value)
+        return False
@@ -0,0 +1,105 @@
+import hashlib
+import re
+from typing import Iterable, Tuple
+from .wrappers import WRAPPER_FILENAME
+
+Frame = Tuple[str, str, int | None]
+
+# Parts of exception messages that change between otherwise identical errors
+_VOLATILE_PATTERNS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<addr>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b[0-9a-fA-F]{16,}\b"), "<hex>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+]
+
+
+def normalize_message(message: str) -> str:
+    """Strip volatile values (addresses, ids, numbers) from an exception message."""
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message.strip()
+
+
+def exception_type_name(error: BaseException) -> str:
+    """Get an exception's type name as tracebacks print it, e.g. 'KeyError' or 'app.errors.DatabaseError'."""
+    cls = type(error)
+    if cls.__module__ in ("builtins", "__main__"):
+        return cls.__qualname__
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def fingerprint_frames(exc_type: str, message: str, frames: Iterable[Frame]) -> str:
+    """Fingerprint an exception from its type, message and (file, function, line) frames."""
+    digest = hashlib.sha256()
+    digest.update(exc_type.encode())
+    digest.update(b"\0")
+    digest.update(normalize_message(message).encode())
+    for filename, name, lineno in frames:
+        digest.update(f"\0{filename}:{name}:{lineno}".encode())
+    return digest.hexdigest()
+
+
+def _walk_frames(tb) -> Iterable[Frame]:
+    """Yield (file, function, line) for each traceback entry without touching source files."""
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        # The catch decorator's own frame is the same for every error it reports
+        if code.co_filename != WRAPPER_FILENAME:
+            yield code.co_filename, code.co_name, tb.tb_lineno
+        tb = tb.tb_next
+
+
+def fingerprint_exception(error: BaseException) -> str:
+    """Fingerprint a live exception, including its chained causes.
+
+    Two exceptions raised from the same place with messages that differ only
+    in volatile values share a fingerprint.
+    """
+    parts = []
+    seen = set()
+    current = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        parts.append(fingerprint_frames(
+            exception_type_name(current),
+            str(current),
+            _walk_frames(current.__traceback__),
+        ))
+        current = current.__cause__ or (None if current.__suppress_context__ else current.__context__)
+    if len(parts) == 1:
+        return parts[0]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+_TEXT_FRAME = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+), in (?P<name>.+?)\s*$')
+_TEXT_EXCEPTION = re.compile(r"^(?P<type>[A-Za-z_][\w.]*)(?::\s?(?P<message>.*))?$")
+_TEXT_TRACEBACK = "Traceback (most recent call last):"
+
+
+def fingerprint_traceback_text(text: str) -> str:
+    """Fingerprint a formatted traceback, e.g. one found in a log file, including chained exceptions.
+
+    Uses the same scheme as fingerprint_exception, so repeats of a logged error
+    share a fingerprint whatever their volatile values.
+    """
+    parts = []
+    for segment in text.split(_TEXT_TRACEBACK):
+        frames = []
+        exc_type, message = "", ""
+        for line in segment.splitlines():
+            frame = _TEXT_FRAME.match(line)
+            if frame:
+                if frame["file"] != WRAPPER_FILENAME:
+                    frames.append((frame["file"], frame["name"], int(frame["line"])))
+                continue
+            exception = _TEXT_EXCEPTION.match(line)
+            if exception and not exc_type:
+                exc_type, message = exception["type"], exception["message"] or ""
+        if frames or exc_type:
+            parts.append(fingerprint_frames(exc_type, message, frames))
+    # Tracebacks print the oldest exception first; fingerprint_exception starts from the newest
+    parts.reverse()
+    if len(parts) == 1:
+        return parts[0]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
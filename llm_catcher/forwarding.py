@@ -0,0 +1,144 @@
+from loguru import logger
+from multiprocessing import current_process
+from multiprocessing.connection import Client, Connection, Listener
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from .background import DiagnosisJob
+
+Address = Union[str, Tuple[str, int]]
+
+
+def parse_address(address: str) -> Address:
+    """Parse a forwarding address: 'host:port' for TCP, anything else is a Unix socket path or pipe name."""
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class DiagnosisServer:
+    """Receives exception snapshots from worker processes and hands them to one diagnosing process.
+
+    Workers connect with a DiagnosisForwarder. Connections are authenticated
+    with ``authkey``, which defaults to the multiprocessing authkey that child
+    processes inherit from their parent.
+    """
+
+    def __init__(self, submit: Callable[[DiagnosisJob], bool], address: Optional[str] = None,
+                 authkey: Optional[bytes] = None):
+        self._submit = submit
+        # Snapshots are unpickled, so connections are always authenticated
+        self._listener = Listener(parse_address(address) if address else None,
+                                  authkey=authkey or current_process().authkey)
+        self._connections: List[Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.received = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._accept, name="llm-catcher-server", daemon=True)
+        self._thread.start()
+
+    @property
+    def address(self) -> Address:
+        """Get the address workers should forward to."""
+        return self._listener.address
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except Exception as e:
+                if not self._closed:
+                    logger.warning(f"Rejected diagnosis forwarding connection: {str(e)}")
+                    continue
+                return
+            with self._lock:
+                self._connections.append(connection)
+            threading.Thread(target=self._receive, args=(connection,), name="llm-catcher-server-conn",
+                             daemon=True).start()
+
+    def _receive(self, connection: Connection):
+        try:
+            while True:
+                job = connection.recv()
+                if not isinstance(job, DiagnosisJob):
+                    logger.warning(f"Ignoring unexpected forwarded message: {type(job).__name__}")
+                    continue
+                with self._lock:
+                    self.received += 1
+                if not self._submit(job):
+                    with self._lock:
+                        self.rejected += 1
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+
+    def close(self):
+        """Stop accepting snapshots and close all worker connections."""
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Get counts of snapshots received and rejected by the local queue."""
+        with self._lock:
+            return {"connections": len(self._connections), "received": self.received, "rejected": self.rejected}
+
+
+class DiagnosisForwarder:
+    """Sends exception snapshots from a worker process to a DiagnosisServer.
+
+    Connects on first use and reconnects after errors. Sending never raises:
+    a snapshot that can't be delivered is dropped and logged.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = parse_address(address)
+        self.authkey = authkey or current_process().authkey
+        self._connection: Optional[Connection] = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, job: DiagnosisJob) -> bool:
+        """Forward a snapshot, returning False if it couldn't be delivered."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None:
+                        self._connection = Client(self.address, authkey=self.authkey)
+                    self._connection.send(job)
+                    self.sent += 1
+                    return True
+                except Exception as e:
+                    self._close()
+                    # Retry once on a fresh connection in case the server restarted
+                    if attempt:
+                        logger.warning(f"Failed to forward exception for diagnosis: {str(e)}")
+            self.dropped += 1
+            return False
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except OSError:
+                pass
+            self._connection = None
+
+    def close(self):
+        """Close the connection to the server."""
+        with self._lock:
+            self._close()
+
+    def stats(self) -> Dict[str, int]:
+        """Get counts of snapshots sent and dropped."""
+        with self._lock:
+            return {"sent": self.sent, "dropped": self.dropped}
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+import datetime
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Token buckets are shared by every diagnoser in the process, one per provider and limit
+_buckets: Dict[Tuple[str, float, int], "TokenBucket"] = {}
+_buckets_lock = threading.Lock()
+
+
+class DiagnosisSkipped(Exception):
+    """Raised when a limit prevents an LLM call; callers fall back to the raw traceback."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available, without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def get_bucket(provider: str, per_minute: float, burst: int) -> TokenBucket:
+    """Get the process-wide token bucket for a provider and limit.
+
+    Diagnosers with the same provider and limit share a bucket; a different
+    limit gets its own rather than resetting theirs.
+    """
+    key = (provider, per_minute, burst)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(per_minute / 60, burst)
+        return bucket
+
+
+class FingerprintSampler:
+    """Samples the first `first_n` occurrences of each fingerprint, then one in every `one_in`."""
+
+    def __init__(self, first_n: int, one_in: int, max_tracked: int = 10000):
+        self.first_n = first_n
+        self.one_in = max(1, one_in)
+        self.max_tracked = max_tracked
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sample(self, key: str) -> bool:
+        """Count an occurrence of key and decide whether it should be diagnosed."""
+        with self._lock:
+            count = self._counts.pop(key, 0) + 1
+            self._counts[key] = count
+            if len(self._counts) > self.max_tracked:
+                self._counts.popitem(last=False)
+        if count <= self.first_n:
+            return True
+        return (count - self.first_n) % self.one_in == 0
+
+
+class DailyBudget:
+    """Daily token and cost budget, reset at midnight UTC."""
+
+    def __init__(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None,
+                 cost_per_1k_tokens: float = 0.0):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.tokens = 0
+        self._day = self._today()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> datetime.date:
+        return datetime.datetime.now(datetime.timezone.utc).date()
+
+    def _roll(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.tokens = 0
+
+    @property
+    def cost(self) -> float:
+        """Get the estimated cost spent today."""
+        return self.tokens / 1000 * self.cost_per_1k_tokens
+
+    def exhausted(self) -> bool:
+        """Check whether today's token or cost budget is used up."""
+        with self._lock:
+            self._roll()
+            if self.max_tokens is not None and self.tokens >= self.max_tokens:
+                return True
+            return self.max_cost is not None and self.cost >= self.max_cost
+
+    def record(self, tokens: int):
+        """Record tokens spent by a completed request."""
+        with self._lock:
+            self._roll()
+            self.tokens += tokens
+
+
+class RateLimiter:
+    """Sampling, rate, budget and concurrency controls applied before each LLM call.
+
+    Every check is non-blocking: when a limit is hit, `acquire` raises
+    DiagnosisSkipped so the caller can fall back immediately.
+    """
+
+    def __init__(self, bucket: Optional[TokenBucket] = None, sampler: Optional[FingerprintSampler] = None,
+                 budget: Optional[DailyBudget] = None, max_concurrent: Optional[int] = None):
+        self.bucket = bucket
+        self.sampler = sampler
+        self.budget = budget
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.skipped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "RateLimiter":
+        """Build the limiter described by settings; unset limits are not checked."""
+        bucket = None
+        if settings.rate_limit_per_minute:
+            bucket = get_bucket(settings.provider, settings.rate_limit_per_minute, settings.rate_limit_burst)
+        sampler = None
+        if settings.sample_first_n is not None:
+            sampler = FingerprintSampler(settings.sample_first_n, settings.sample_one_in)
+        budget = None
+        if settings.daily_token_budget is not None or settings.daily_cost_budget is not None:
+            budget = DailyBudget(settings.daily_token_budget, settings.daily_cost_budget, settings.cost_per_1k_tokens)
+        return cls(bucket, sampler, budget, settings.max_concurrent_requests)
+
+    def _skip(self, reason: str):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        raise DiagnosisSkipped(reason)
+
+    def acquire(self, key: Optional[str]):
+        """Admit an LLM call for key or raise DiagnosisSkipped. Admitted calls must call release().
+
+        Sampling only applies to single fingerprints; pass key=None to skip it (e.g. for batches).
+        """
+        if key is not None and self.sampler is not None and not self.sampler.sample(key):
+            self._skip("not sampled")
+        if self.budget is not None and self.budget.exhausted():
+            self._skip("daily budget exhausted")
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self._skip("rate limited")
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            self._skip("too many concurrent diagnoses")
+
+    def release(self):
+        """Release the concurrency slot taken by acquire()."""
+        if self._slots is not None:
+            self._slots.release()
+
+    def record_usage(self, tokens: int):
+        """Record tokens spent against the daily budget."""
+        if self.budget is not None:
+            self.budget.record(tokens)
+
+    def stats(self) -> Dict[str, object]:
+        """Get skip counters by reason and today's budget usage."""
+        with self._lock:
+            stats: Dict[str, object] = {"skipped": dict(self.skipped)}
+        if self.budget is not None:
+            stats["tokens_today"] = self.budget.tokens
+            stats["cost_today"] = self.budget.cost
+        return stats
@@ -0,0 +1,453 @@
+"""Find Python tracebacks in log files and diagnose each distinct one once.
+
+Files are read line by line (gzip files are decompressed as a stream, large
+plain files are memory-mapped), so logs of any size are scanned in constant
+memory. Tracebacks are grouped by fingerprint and each new group is diagnosed
+as soon as it is found, a bounded number at a time. Progress is saved to a
+checkpoint so an interrupted or repeated run picks up where the last one left
+off.
+"""
+from loguru import logger
+import gzip
+import html
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from .compaction import CAUSE_MESSAGE, CONTEXT_MESSAGE, fit_tokens
+from .fingerprint import fingerprint_traceback_text
+from .limits import DiagnosisSkipped
+
+if TYPE_CHECKING:
+    from .diagnoser import LLMExceptionDiagnoser
+
+TRACEBACK_START = "Traceback (most recent call last):"
+_CHAIN_MARKERS = (CAUSE_MESSAGE.strip(), CONTEXT_MESSAGE.strip())
+# Plain files at least this large are memory-mapped instead of read through a buffer
+MMAP_THRESHOLD = 64 * 1024 * 1024
+CHECKPOINT_VERSION = 1
+
+
+class LogTraceback(NamedTuple):
+    """A traceback found in a log file."""
+
+    text: str
+    # Line number (1-based) where the traceback starts
+    line: int
+    # Byte offset just past the traceback's last line (in the decompressed stream for gzip files)
+    end: int
+
+
+def read_lines(path: str, offset: int = 0, mmap_threshold: int = MMAP_THRESHOLD) -> Iterator[Tuple[int, str]]:
+    """Yield (offset just past the line, line) for each line of a log file, starting at a byte offset."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                offset += len(raw)
+                yield offset, raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        return
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= mmap_threshold and size > offset:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                mapped.seek(offset)
+                for raw in iter(mapped.readline, b""):
+                    offset += len(raw)
+                    yield offset, raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            return
+        f.seek(offset)
+        for raw in f:
+            offset += len(raw)
+            yield offset, raw.decode("utf-8", errors="replace").rstrip("\r\n")
+
+
+def _is_exception_line(line: str) -> bool:
+    """Check whether a line looks like the final 'module.Type: message' line of a traceback."""
+    name = line.split(":", 1)[0]
+    return bool(name) and not line[0].isspace() and all(part.isidentifier() for part in name.split("."))
+
+
+class TracebackExtractor:
+    """Extract traceback blocks from log lines as they are read.
+
+    A log record prefix in front of ``Traceback (most recent call last):`` is
+    dropped, and stripped from the following lines too when they repeat it.
+    Chained exceptions and indented continuation lines of the exception message
+    are kept with their traceback.
+    """
+
+    def __init__(self, offset: int = 0, line: int = 1):
+        """Start extracting at a byte offset, which is at the given (1-based) line number."""
+        self._block: Optional[List[str]] = None
+        self._held: List[str] = []
+        self._prefix = ""
+        # "frames": inside a traceback, "message": after its exception line, "chain": after a chain marker
+        self._state = ""
+        self._start = self._end = 0
+        self._number = line - 1
+        # Everything before this offset (and line) has been fully processed; safe to resume from
+        self.safe_offset = offset
+        self.safe_line = line
+        self._line_start = offset
+
+    def _flush(self) -> Sequence[LogTraceback]:
+        block, self._block, self._held = self._block, None, []
+        if block is None or self._state == "frames":
+            return ()
+        return [LogTraceback("\n".join(block).rstrip() + "\n", self._start, self._end)]
+
+    def feed(self, offset: int, line: str) -> Sequence[LogTraceback]:
+        """Process the line ending at ``offset``, returning any tracebacks it completes."""
+        self._number += 1
+        line_start, self._line_start = self._line_start, offset
+        found: Sequence[LogTraceback] = ()
+        if self._block is not None:
+            if self._prefix and line.startswith(self._prefix):
+                line = line[len(self._prefix):]
+            if self._continue(line, offset):
+                return found
+            found = self._flush()
+            self.safe_offset, self.safe_line = line_start, self._number
+
+        index = line.find(TRACEBACK_START)
+        if index >= 0:
+            self._prefix = line[:index]
+            self._block = [TRACEBACK_START]
+            self._start, self._state = self._number, "frames"
+        else:
+            self.safe_offset, self.safe_line = offset, self._number + 1
+        return found
+
+    def _continue(self, line: str, offset: int) -> bool:
+        """Add a line to the open traceback, returning False if the line isn't part of it."""
+        block, state = self._block, self._state
+        if state == "frames":
+            if line.startswith((" ", "\t")):
+                block.append(line)
+                return True
+            if _is_exception_line(line):
+                block.append(line)
+                self._state, self._end = "message", offset
+                return True
+            return False
+        if not line.strip():
+            self._held.append(line)
+            return True
+        if state == "message" and line[0].isspace() and not self._held:
+            block.append(line)
+            self._end = offset
+            return True
+        if state == "message" and line.strip() in _CHAIN_MARKERS:
+            block.extend(self._held + [line])
+            self._held, self._state = [], "chain"
+            return True
+        if state == "chain" and line.startswith(TRACEBACK_START):
+            block.extend(self._held + [line])
+            self._held, self._state = [], "frames"
+            return True
+        return False
+
+    def finish(self, offset: int) -> Sequence[LogTraceback]:
+        """Return the traceback still open at the end of the input, if it is complete.
+
+        A traceback cut off before its exception line (e.g. a log still being
+        written) is left for the next run to read again.
+        """
+        complete = self._block is None or self._state != "frames"
+        found = self._flush()
+        if complete:
+            self.safe_offset, self.safe_line = offset, self._number + 1
+        return found
+
+
+def extract_tracebacks(lines: Iterable[Tuple[int, str]]) -> Iterator[LogTraceback]:
+    """Extract tracebacks from (end offset, line) pairs, e.g. from read_lines."""
+    extractor = TracebackExtractor()
+    offset = 0
+    for offset, line in lines:
+        yield from extractor.feed(offset, line)
+    yield from extractor.finish(offset)
+
+
+class TracebackGroup:
+    """Occurrences of one traceback fingerprint across the scanned logs."""
+
+    __slots__ = ("fingerprint", "summary", "sample", "count", "first_seen", "last_seen", "diagnosis", "error")
+
+    def __init__(self, fingerprint: str, summary: str, sample: str, first_seen: str, count: int = 0,
+                 last_seen: Optional[str] = None, diagnosis: Optional[str] = None, error: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.summary = summary
+        self.sample = sample
+        self.count = count
+        self.first_seen = first_seen
+        self.last_seen = last_seen or first_seen
+        self.diagnosis = diagnosis
+        self.error = error
+
+    def as_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _summary(text: str) -> str:
+    """Get the exception line of the newest exception in a traceback."""
+    for line in reversed(text.splitlines()):
+        if _is_exception_line(line):
+            return line
+    return text.strip().splitlines()[-1]
+
+
+def _file_identity(path: str) -> Dict[str, object]:
+    stat = os.stat(path)
+    return {"inode": stat.st_ino, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class LogScanner:
+    """Scan log files for tracebacks, group them by fingerprint and diagnose each group once.
+
+    Example:
+        scanner = LogScanner(diagnoser, checkpoint_path="scan.checkpoint.json")
+        scanner.scan(["app.log", "app.log.1.gz"])
+        scanner.write_report("report.html")
+    """
+
+    def __init__(self, diagnoser: Optional["LLMExceptionDiagnoser"], checkpoint_path: Optional[str] = None,
+                 workers: int = 4, checkpoint_every: int = 1000, mmap_threshold: int = MMAP_THRESHOLD):
+        """Create a scanner.
+
+        Args:
+            diagnoser: Diagnoser used for new groups, or None to only group tracebacks
+            checkpoint_path: JSON file where progress is saved and resumed from
+            workers: Maximum number of diagnoses running at once
+            checkpoint_every: Save the checkpoint after this many tracebacks
+            mmap_threshold: Plain files at least this many bytes are memory-mapped
+        """
+        self.diagnoser = diagnoser
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+        self.mmap_threshold = mmap_threshold
+        self.groups: Dict[str, TracebackGroup] = {}
+        self.files: Dict[str, Dict[str, object]] = {}
+        self.tracebacks = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Bounds diagnoses queued or running, so a log full of distinct errors doesn't pile up futures
+        self._slots = threading.BoundedSemaphore(max(1, workers) * 2)
+        self._futures: List[Future] = []
+        # Logs repeat the same traceback text verbatim, so most fingerprints are computed once
+        self._fingerprint = lru_cache(maxsize=4096)(fingerprint_traceback_text)
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {str(e)}")
+            return
+        if state.get("version") != CHECKPOINT_VERSION:
+            logger.warning(f"Ignoring checkpoint {self.checkpoint_path} from another version")
+            return
+        self.files = state["files"]
+        self.groups = {group["fingerprint"]: TracebackGroup(**group) for group in state["groups"]}
+        self.tracebacks = state.get("tracebacks", 0)
+        logger.info(f"Resuming from checkpoint: {len(self.files)} files, {len(self.groups)} groups")
+
+    def save_checkpoint(self):
+        """Write progress to the checkpoint file, replacing it atomically."""
+        if not self.checkpoint_path:
+            return
+        with self._lock:
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "tracebacks": self.tracebacks,
+                "files": self.files,
+                "groups": [group.as_dict() for group in self.groups.values()],
+            }
+            temporary = f"{self.checkpoint_path}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(state, f)
+            os.replace(temporary, self.checkpoint_path)
+
+    def _resume_offset(self, path: str, identity: Dict[str, object]) -> int:
+        """Get where to resume reading a file: 0 if it is new, was rotated or has shrunk."""
+        saved = self.files.get(path)
+        if saved is None or saved["inode"] != identity["inode"] or saved["offset"] > identity["size"]:
+            return 0
+        if path.endswith(".gz") and (saved["size"], saved["mtime"]) != (identity["size"], identity["mtime"]):
+            return 0
+        return saved["offset"]
+
+    def scan_file(self, path: str):
+        """Scan one log file from where the checkpoint left off."""
+        path = os.path.abspath(path)
+        identity = _file_identity(path)
+        offset = self._resume_offset(path, identity)
+        line = self.files[path]["line"] if offset else 1
+        if offset:
+            logger.info(f"Resuming {path} at line {line}")
+        progress = {**identity, "offset": offset, "line": line}
+        with self._lock:
+            self.files[path] = progress
+
+        extractor = TracebackExtractor(offset, line)
+        found = 0
+        for offset, text in read_lines(path, offset, self.mmap_threshold):
+            tracebacks = extractor.feed(offset, text)
+            for traceback_ in tracebacks:
+                self._add(traceback_, f"{path}:{traceback_.line}")
+            if tracebacks:
+                with self._lock:
+                    progress["offset"], progress["line"] = extractor.safe_offset, extractor.safe_line
+                found += len(tracebacks)
+                if found % self.checkpoint_every < len(tracebacks):
+                    self.save_checkpoint()
+        for traceback_ in extractor.finish(offset):
+            self._add(traceback_, f"{path}:{traceback_.line}")
+            found += 1
+        with self._lock:
+            progress["offset"], progress["line"] = extractor.safe_offset, extractor.safe_line
+        logger.info(f"Found {found} tracebacks in {path}")
+        self.save_checkpoint()
+
+    def _add(self, traceback_: LogTraceback, location: str):
+        """Count a traceback in its group, diagnosing the group if it is new."""
+        fingerprint = self._fingerprint(traceback_.text)
+        with self._lock:
+            self.tracebacks += 1
+            group = self.groups.get(fingerprint)
+            if group is None:
+                group = self.groups[fingerprint] = TracebackGroup(
+                    fingerprint, _summary(traceback_.text), traceback_.text, location)
+                new = True
+            else:
+                new = False
+            group.count += 1
+            group.last_seen = location
+        if new:
+            self._submit(group)
+
+    def _submit(self, group: TracebackGroup):
+        if self.diagnoser is None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="llm-catcher-scan")
+        self._slots.acquire()
+        future = self._executor.submit(self._diagnose, group)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _diagnose(self, group: TracebackGroup):
+        diagnoser = self.diagnoser
+        trace = group.sample
+        if diagnoser.settings.max_prompt_tokens is not None:
+            trace = fit_tokens(trace, diagnoser.settings.max_prompt_tokens)
+        try:
+            diagnosis = diagnoser._diagnose_prompt(diagnoser._fingerprint_key(group.fingerprint),
+                                                   lambda: diagnoser._trace_prompt(trace))
+            error = None
+        except DiagnosisSkipped as e:
+            diagnosis, error = None, f"LLM diagnosis skipped ({e.reason})"
+        except Exception as e:
+            diagnosis, error = None, f"Failed to contact LLM for diagnosis. Error: {str(e)}"
+        with self._lock:
+            group.diagnosis, group.error = diagnosis, error
+        if error:
+            logger.warning(f"{group.summary}: {error}")
+
+    def scan(self, paths: Iterable[str]) -> List[TracebackGroup]:
+        """Scan log files, wait for their diagnoses and return the groups, most frequent first."""
+        started = time.monotonic()
+        # Groups left undiagnosed by an interrupted or failed run are retried
+        for group in list(self.groups.values()):
+            if group.diagnosis is None:
+                self._submit(group)
+        try:
+            for path in paths:
+                self.scan_file(path)
+            for future in self._futures:
+                future.result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            self._futures = []
+            self.save_checkpoint()
+        logger.info(f"Scanned {self.tracebacks} tracebacks into {len(self.groups)} groups "
+                    f"in {time.monotonic() - started:.1f}s")
+        return self.report()
+
+    def report(self) -> List[TracebackGroup]:
+        """Get the groups, most frequent first."""
+        with self._lock:
+            return sorted(self.groups.values(), key=lambda group: (-group.count, group.first_seen))
+
+    def write_report(self, path: str, format: Optional[str] = None):
+        """Write the groups as JSON Lines or HTML (chosen from the file extension unless given)."""
+        if format is None:
+            format = "html" if path.endswith((".html", ".htm")) else "jsonl"
+        groups = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            if format == "html":
+                f.write(render_html(groups))
+            else:
+                for group in groups:
+                    f.write(json.dumps(group.as_dict()) + "\n")
+
+
+_HTML_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>LLM Catcher log report</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border: 1px solid #ccc; padding: 0.5em; text-align: left; vertical-align: top; }}
+pre {{ white-space: pre-wrap; margin: 0; font-size: 0.85em; }}
+details {{ margin-top: 0.5em; }}
+</style>
+</head>
+<body>
+<h1>LLM Catcher log report</h1>
+<p>{total} tracebacks, {unique} distinct.</p>
+<table>
+<tr><th>Count</th><th>Exception</th><th>Diagnosis</th></tr>
+{rows}
+</table>
+</body>
+</html>
+"""
+
+_HTML_ROW = """<tr>
+<td>{count}</td>
+<td><code>{summary}</code><br><small>first seen {first_seen}<br>last seen {last_seen}</small>
+<details><summary>Traceback</summary><pre>{sample}</pre></details></td>
+<td><pre>{diagnosis}</pre></td>
+</tr>"""
+
+
+def render_html(groups: List[TracebackGroup]) -> str:
+    """Render groups as a standalone HTML page."""
+    rows = "\n".join(
+        _HTML_ROW.format(
+            count=group.count,
+            summary=html.escape(group.summary),
+            first_seen=html.escape(group.first_seen),
+            last_seen=html.escape(group.last_seen),
+            sample=html.escape(group.sample),
+            diagnosis=html.escape(group.diagnosis or group.error or "Not diagnosed"),
+        )
+        for group in groups
+    )
+    return _HTML_PAGE.format(total=sum(group.count for group in groups), unique=len(groups), rows=rows)
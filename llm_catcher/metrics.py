@@ -0,0 +1,161 @@
+from contextlib import contextmanager, nullcontext
+from loguru import logger
+import bisect
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Latency bucket upper bounds in seconds, from prompt building (sub-millisecond) to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Latencies recorded by the diagnoser
+LATENCIES = {
+    "queue_wait": "Time background jobs wait in the queue before a worker picks them up",
+    "prompt_build": "Time spent formatting and compacting tracebacks into prompts",
+    "provider": "Provider round-trip time per request attempt",
+    "diagnosis": "End-to-end diagnose/async_diagnose time, including cache hits",
+    "model_load": "Time requests waited for the model to be loaded (Ollama)",
+}
+
+# Counters recorded by the diagnoser
+COUNTERS = {
+    "diagnoses": "Diagnoses requested",
+    "cache_hits": "Diagnoses answered from the cache or persistent store",
+    "cache_misses": "Diagnoses that needed an LLM call",
+    "similar_hits": "Diagnoses reused from a similar, previously diagnosed error",
+    "provider_requests": "Provider request attempts",
+    "provider_errors": "Provider request attempts that failed",
+    "provider_timeouts": "Provider request attempts that timed out",
+    "skipped": "Diagnoses skipped by a limit or open circuit",
+    "cold_model_requests": "Requests that waited for the model to be loaded (Ollama)",
+    "warm_model_requests": "Requests answered by an already loaded model (Ollama)",
+    "prompt_tokens": "Prompt tokens reported by providers",
+    "completion_tokens": "Completion tokens reported by providers",
+}
+
+
+class Histogram:
+    """Latency histogram with fixed buckets."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """Record one measurement."""
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def snapshot(self) -> Dict[str, object]:
+        """Get the count, sum, mean and cumulative bucket counts keyed by upper bound."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        count = sum(counts)
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, n in zip([*map(str, self.bounds), "+Inf"], counts):
+            running += n
+            cumulative[bound] = running
+        return {"count": count, "sum": total, "mean": total / count if count else 0.0, "buckets": cumulative}
+
+
+class Metrics:
+    """Latency histograms and counters for one diagnoser, with optional OpenTelemetry spans.
+
+    When disabled, recording is a no-op so instrumented code paths cost a
+    single attribute check.
+    """
+
+    def __init__(self, enabled: bool = True, tracer=None):
+        self.enabled = enabled
+        self.tracer = tracer
+        self.latencies = {name: Histogram() for name in LATENCIES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "Metrics":
+        """Build the metrics described by settings, creating an OpenTelemetry tracer if enabled."""
+        tracer = None
+        if settings.otel_tracing:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logger.warning("otel_tracing is enabled but opentelemetry-api is not installed")
+            else:
+                tracer = trace.get_tracer("llm_catcher")
+        return cls(enabled=settings.metrics_enabled, tracer=tracer)
+
+    def observe(self, name: str, seconds: float):
+        """Record a latency in seconds."""
+        if self.enabled:
+            self.latencies[name].observe(seconds)
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter."""
+        if self.enabled and n:
+            with self._lock:
+                self.counters[name] += n
+
+    def span(self, name: str, **attributes):
+        """Get a context manager tracing an OpenTelemetry span, or doing nothing without a tracer."""
+        if self.tracer is None:
+            return nullcontext()
+        return self._span(name, attributes)
+
+    @contextmanager
+    def _span(self, name: str, attributes: Dict[str, object]) -> Iterator[object]:
+        with self.tracer.start_as_current_span(f"llm_catcher.{name}") as span:
+            for key, value in attributes.items():
+                if value is not None:
+                    span.set_attribute(f"llm_catcher.{key}", value)
+            yield span
+
+    def snapshot(self) -> Dict[str, object]:
+        """Get the latency histograms and counters."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "enabled": self.enabled,
+            "latency": {name: histogram.snapshot() for name, histogram in self.latencies.items()},
+            "counters": counters,
+        }
+
+
+def _prometheus_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(metrics: Metrics, gauges: Optional[Dict[str, float]] = None,
+                      prefix: str = "llm_catcher") -> str:
+    """Render metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics: The histograms and counters to render
+        gauges: Extra point-in-time values, e.g. cache size or queue depth
+        prefix: Metric name prefix
+    """
+    lines: List[str] = []
+    snapshot = metrics.snapshot()
+    for name, histogram in snapshot["latency"].items():
+        metric = f"{prefix}_{name}_seconds"
+        lines.append(f"# HELP {metric} {LATENCIES[name]}")
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{metric}_sum {_prometheus_number(histogram['sum'])}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    for name, value in snapshot["counters"].items():
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# HELP {metric} {COUNTERS[name]}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    for name, value in (gauges or {}).items():
+        metric = f"{prefix}_{name}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {_prometheus_number(value)}")
+    return "\n".join(lines) + "\n"
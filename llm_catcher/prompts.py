@@ -0,0 +1,63 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+# Section marker the model is asked to start each answer of a batch with
+_ITEM_MARKER = re.compile(r"^\s*#{1,4}\s*ERROR\s+(\d+)\s*:?\s*$", re.MULTILINE | re.IGNORECASE)
+# Tokens added per batch item for its marker and separators
+_ITEM_OVERHEAD = 8
+
+BATCH_INSTRUCTIONS = (
+    "I received the following {count} stack traces from a Python application. "
+    "For each one, analyze the error and provide a diagnosis that includes:\n"
+    "1. The specific file and line number where the error occurred\n"
+    "2. A clear explanation of what went wrong\n"
+    "3. Suggestions for fixing the issue\n\n"
+    "Answer every stack trace in its own section. Start each section with a line containing only "
+    "\"### ERROR <number>\", using the number of the stack trace it answers, followed by a concise "
+    "paragraph that includes the pertinent file name (do not include the full path), explanation, and fix.\n\n"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def build_batch_prompt(stack_traces: Sequence[str]) -> str:
+    """Build one prompt asking for a diagnosis of each of several stack traces."""
+    sections = [f"### ERROR {i}\n{trace.rstrip()}\n" for i, trace in enumerate(stack_traces, start=1)]
+    return BATCH_INSTRUCTIONS.format(count=len(stack_traces)) + "\n".join(sections)
+
+
+def parse_batch_response(text: str, count: int) -> List[Optional[str]]:
+    """Split a batch answer into per-item diagnoses; items the model skipped are None."""
+    results: List[Optional[str]] = [None] * count
+    matches = list(_ITEM_MARKER.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        end = following.start() if following is not None else len(text)
+        body = text[match.end():end].strip()
+        if 0 <= index < count and body and results[index] is None:
+            results[index] = body
+    return results
+
+
+def pack_batches(items: Sequence[Tuple[str, str]], max_tokens: int, max_items: int) -> List[List[Tuple[str, str]]]:
+    """Greedily pack (key, stack trace) items into batches that fit the token budget.
+
+    An item too large for the budget on its own gets a batch to itself.
+    """
+    budget = max_tokens - estimate_tokens(BATCH_INSTRUCTIONS)
+    batches: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(item[1]) + _ITEM_OVERHEAD
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
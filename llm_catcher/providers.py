@@ -0,0 +1,426 @@
+from loguru import logger
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import math
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
+from .resilience import CircuitBreaker, get_breaker
+
+# Clients are shared by every diagnoser in the process so they share HTTP connection pools.
+# Async clients are bound to the event loop they were created on, so they're kept per loop.
+_clients: Dict[tuple, object] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, object]]" = \
+    weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+# Time left for the request being sent from this thread or task, applied by the Ollama clients' transports
+_request_timeout: ContextVar[Optional[float]] = ContextVar("llm_catcher_request_timeout", default=None)
+
+# (prompt tokens, completion tokens) as reported by the provider, zero if unknown
+Usage = Tuple[int, int]
+UsageCallback = Callable[[Usage], None]
+
+
+# OpenAI reasoning models: their completion token limit also covers the hidden reasoning
+_REASONING_MODELS = ("o1", "o3", "o4")
+
+
+class Backend(BaseModel):
+    """An extra LLM backend tried, in order, when the ones before it fail."""
+
+    provider: Literal["openai", "ollama"]
+    llm_model: str
+    temperature: float | None = Field(default=None)
+    openai_api_key: str | None = Field(default=None)
+    # OpenAI-compatible API base URL or Ollama host
+    base_url: str | None = Field(default=None)
+
+
+@contextmanager
+def request_timeout(timeout: Optional[float]) -> Iterator[None]:
+    """Cap the HTTP timeouts of Ollama requests sent in this context, for SDK calls without a timeout argument."""
+    token = _request_timeout.set(timeout)
+    try:
+        yield
+    finally:
+        _request_timeout.reset(token)
+
+
+def _cap_timeout(request):
+    """Lower an httpx request's timeouts to the time left in the current request_timeout context."""
+    timeout = _request_timeout.get()
+    if timeout is not None:
+        timeout = max(timeout, 0.001)
+        request.extensions["timeout"] = {
+            name: timeout if value is None else min(value, timeout)
+            for name, value in request.extensions.get("timeout", {}).items()
+        } or dict.fromkeys(("connect", "read", "write", "pool"), timeout)
+
+
+def _timeout_transport(limits, asynchronous: bool):
+    """Create an httpx transport with the connection pool limits that honors request_timeout."""
+    import httpx
+    if asynchronous:
+        class AsyncTimeoutTransport(httpx.AsyncHTTPTransport):
+            async def handle_async_request(self, request):
+                _cap_timeout(request)
+                return await super().handle_async_request(request)
+        return AsyncTimeoutTransport(limits=limits)
+
+    class TimeoutTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            _cap_timeout(request)
+            return super().handle_request(request)
+    return TimeoutTransport(limits=limits)
+
+
+def _create_client(kind: str, base_url: Optional[str], api_key: Optional[str], timeout: Optional[float],
+                   pool: Tuple[int, int, float], asynchronous: bool):
+    """Import the provider SDK and create a client with a tuned HTTP connection pool."""
+    import httpx
+    max_connections, max_keepalive, keepalive_expiry = pool
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+    if kind == "openai":
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+        client_class = AsyncOpenAI if asynchronous else OpenAI
+        http_client = (DefaultAsyncHttpxClient if asynchronous else DefaultHttpxClient)(limits=limits)
+        # Retries are handled by the diagnoser so they respect the overall deadline
+        return client_class(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                            http_client=http_client)
+    elif kind == "ollama":
+        from ollama import AsyncClient, Client
+        client_class = AsyncClient if asynchronous else Client
+        # The SDK's chat() takes no timeout, so the deadline is applied by the transport
+        return client_class(host=base_url, timeout=timeout, transport=_timeout_transport(limits, asynchronous))
+    raise ValueError(f"Unsupported provider: {kind}")
+
+
+def get_client(kind: str, base_url: Optional[str], api_key: Optional[str], timeout: Optional[float],
+               pool: Tuple[int, int, float], asynchronous: bool):
+    """Get the process-wide client for a backend, creating it on first use.
+
+    Async clients must be requested from inside a running event loop.
+    """
+    key = (kind, base_url, api_key, timeout, pool)
+    with _clients_lock:
+        if asynchronous:
+            clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        else:
+            clients = _clients
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = _create_client(kind, base_url, api_key, timeout, pool, asynchronous)
+        return client
+
+
+class LatencyTracker:
+    """Recent successful request latencies, used to decide when to hedge."""
+
+    def __init__(self, window: int = 256):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Record the latency of a successful request."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """Get a latency percentile, or None if there are fewer than min_samples samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(percent / 100 * len(samples)) - 1))
+        return samples[index]
+
+
+class Provider:
+    """One LLM backend: how to send it a prompt and read back the diagnosis.
+
+    The model, temperature, API key and base URL are read from ``config`` on
+    every call (the diagnoser's Settings for the primary backend, a Backend for
+    the others), so changes to the settings take effect immediately.
+    """
+
+    kind = ""
+    # Whether warm_up can load the model ahead of the first request
+    can_warm_up = False
+
+    def __init__(self, config, settings):
+        self.config = config
+        self.settings = settings
+        self.latency = LatencyTracker()
+        # Called with the seconds a request waited for the model to load, where the backend reports it
+        self.on_model_load: Optional[Callable[[float], None]] = None
+        # When a request or warm-up was last sent (time.monotonic())
+        self.last_used = 0.0
+        # Clients set explicitly (e.g. in tests) take precedence over the shared ones
+        self._sync_client = None
+        self._async_client = None
+
+    @property
+    def name(self) -> str:
+        """Get a readable name for logs, e.g. 'ollama/qwen2.5-coder'."""
+        return f"{self.kind}/{self.config.llm_model}"
+
+    @property
+    def temperature(self) -> Optional[float]:
+        """Get the temperature for this backend, falling back to the main setting."""
+        if self.config.temperature is not None:
+            return self.config.temperature
+        return self.settings.temperature
+
+    def _get_client(self, asynchronous: bool):
+        return get_client(
+            self.kind,
+            getattr(self.config, "base_url", None),
+            self.config.openai_api_key,
+            self.settings.timeout,
+            (self.settings.max_connections, self.settings.max_keepalive_connections,
+             self.settings.keepalive_expiry),
+            asynchronous,
+        )
+
+    @property
+    def sync_client(self):
+        """Get the sync client, creating the shared one on first use."""
+        return self._sync_client if self._sync_client is not None else self._get_client(asynchronous=False)
+
+    @sync_client.setter
+    def sync_client(self, client):
+        """Set the sync client."""
+        self._sync_client = client
+
+    @property
+    def async_client(self):
+        """Get the async client for the running event loop, creating the shared one on first use."""
+        return self._async_client if self._async_client is not None else self._get_client(asynchronous=True)
+
+    @async_client.setter
+    def async_client(self, client):
+        """Set the async client."""
+        self._async_client = client
+
+    def breaker(self) -> CircuitBreaker:
+        """Get the circuit breaker for this backend and model."""
+        return get_breaker(
+            self.kind,
+            self.config.llm_model,
+            self.settings.breaker_failure_threshold,
+            self.settings.breaker_reset_timeout,
+        )
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                 answers: int = 1) -> Tuple[str, Usage]:
+        """Send a prompt and return the diagnosis text and token usage (sync version).
+
+        With json_mode, the backend is asked to answer with a JSON object if it supports that.
+        A prompt asking for several diagnoses (a batch) gets ``answers`` times the token limit.
+        """
+        raise NotImplementedError
+
+    async def acomplete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                        answers: int = 1) -> Tuple[str, Usage]:
+        """Send a prompt and return the diagnosis text and token usage (async version)."""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, on_usage: UsageCallback) -> Iterator[str]:
+        """Stream diagnosis text as it is generated, reporting token usage to on_usage (sync version)."""
+        raise NotImplementedError
+
+    def astream(self, prompt: str, on_usage: UsageCallback) -> AsyncIterator[str]:
+        """Stream diagnosis text as it is generated, reporting token usage to on_usage (async version)."""
+        raise NotImplementedError
+
+    def warm_up(self) -> float:
+        """Load the model without generating anything, returning the seconds loading took."""
+        raise NotImplementedError
+
+
+class OpenAIProvider(Provider):
+    """OpenAI chat completions, or any OpenAI-compatible API via base_url."""
+
+    kind = "openai"
+    # Cleared when the model rejects response_format, so it's only tried once
+    json_mode = True
+
+    @staticmethod
+    def _usage(response) -> Usage:
+        usage = getattr(response, "usage", None)
+        counts = (getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+        return tuple(n if isinstance(n, int) else 0 for n in counts)
+
+    def _request(self, prompt: str, json_mode: bool = False, answers: int = 1, **kwargs) -> dict:
+        self.last_used = time.monotonic()
+        request = dict(
+            model=self.config.llm_model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            **kwargs,
+        )
+        if self.config.llm_model.startswith(_REASONING_MODELS):
+            # A limit sized for the answer alone would be used up by reasoning, leaving the answer empty
+            if self.settings.reasoning_max_tokens is not None:
+                request["max_completion_tokens"] = self.settings.reasoning_max_tokens * answers
+        elif self.settings.max_tokens is not None:
+            request["max_tokens"] = self.settings.max_tokens * answers
+        if self.settings.stop:
+            request["stop"] = list(self.settings.stop)
+        if json_mode and self.json_mode:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def _without_json_mode(self, request: dict, error: Exception, started: float) -> dict:
+        """Get the request again without JSON mode if that's what the API rejected, else re-raise the error."""
+        if getattr(error, "status_code", None) != 400 or "response_format" not in request:
+            raise error
+        # Other bad requests (context length, invalid parameters) would fail again without it
+        details = f"{error} {getattr(error, 'body', None) or ''}"
+        if "response_format" not in details and "json_object" not in details:
+            raise error
+        logger.info(f"{self.config.llm_model} rejected JSON mode; asking for plain text instead")
+        self.json_mode = False
+        request = {name: value for name, value in request.items() if name != "response_format"}
+        if request.get("timeout") is not None:
+            request["timeout"] = max(request["timeout"] - (time.monotonic() - started), 0.0)
+        return request
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                 answers: int = 1) -> Tuple[str, Usage]:
+        started = time.monotonic()
+        request = self._request(prompt, json_mode, answers, timeout=timeout)
+        try:
+            response = self.sync_client.chat.completions.create(**request)
+        except Exception as e:
+            response = self.sync_client.chat.completions.create(**self._without_json_mode(request, e, started))
+        return response.choices[0].message.content.strip(), self._usage(response)
+
+    async def acomplete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                        answers: int = 1) -> Tuple[str, Usage]:
+        started = time.monotonic()
+        request = self._request(prompt, json_mode, answers, timeout=timeout)
+        try:
+            response = await self.async_client.chat.completions.create(**request)
+        except Exception as e:
+            response = await self.async_client.chat.completions.create(**self._without_json_mode(request, e, started))
+        return response.choices[0].message.content.strip(), self._usage(response)
+
+    def stream(self, prompt: str, on_usage: UsageCallback) -> Iterator[str]:
+        stream = self.sync_client.chat.completions.create(
+            **self._request(prompt, stream=True, stream_options={"include_usage": True})
+        )
+        for chunk in stream:
+            on_usage(self._usage(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def astream(self, prompt: str, on_usage: UsageCallback) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            **self._request(prompt, stream=True, stream_options={"include_usage": True})
+        )
+        async for chunk in stream:
+            on_usage(self._usage(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OllamaProvider(Provider):
+    """A local or remote Ollama server."""
+
+    kind = "ollama"
+
+    @staticmethod
+    def _usage(response) -> Usage:
+        counts = (getattr(response, "prompt_eval_count", None), getattr(response, "eval_count", None))
+        return tuple(n if isinstance(n, int) else 0 for n in counts)
+
+    can_warm_up = True
+
+    def _observe_load(self, response):
+        """Report how long the response waited for the model to load (only the last part of a stream says)."""
+        nanoseconds = getattr(response, "load_duration", None)
+        if isinstance(nanoseconds, int) and self.on_model_load is not None:
+            self.on_model_load(nanoseconds / 1e9)
+
+    def _request(self, prompt: str, json_mode: bool = False, answers: int = 1, **kwargs) -> dict:
+        self.last_used = time.monotonic()
+        request = dict(model=self.config.llm_model, messages=[{"role": "user", "content": prompt}], **kwargs)
+        if self.settings.keep_alive is not None:
+            request["keep_alive"] = self.settings.keep_alive
+        options = {}
+        if self.settings.max_tokens is not None:
+            options["num_predict"] = self.settings.max_tokens * answers
+        if self.settings.stop:
+            options["stop"] = list(self.settings.stop)
+        if options:
+            request["options"] = options
+        if json_mode:
+            request["format"] = "json"
+        return request
+
+    def complete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                 answers: int = 1) -> Tuple[str, Usage]:
+        with request_timeout(timeout):
+            response = self.sync_client.chat(**self._request(prompt, json_mode, answers))
+        self._observe_load(response)
+        return response.message.content.strip(), self._usage(response)
+
+    async def acomplete(self, prompt: str, timeout: Optional[float] = None, json_mode: bool = False,
+                        answers: int = 1) -> Tuple[str, Usage]:
+        with request_timeout(timeout):
+            response = await self.async_client.chat(**self._request(prompt, json_mode, answers))
+        self._observe_load(response)
+        return response.message.content.strip(), self._usage(response)
+
+    def stream(self, prompt: str, on_usage: UsageCallback) -> Iterator[str]:
+        for part in self.sync_client.chat(**self._request(prompt, stream=True)):
+            on_usage(self._usage(part))
+            self._observe_load(part)
+            if part.message.content:
+                yield part.message.content
+
+    async def astream(self, prompt: str, on_usage: UsageCallback) -> AsyncIterator[str]:
+        async for part in await self.async_client.chat(**self._request(prompt, stream=True)):
+            on_usage(self._usage(part))
+            self._observe_load(part)
+            if part.message.content:
+                yield part.message.content
+
+    def warm_up(self) -> float:
+        # A chat without messages only loads the model (and restarts its keep-alive timer)
+        self.last_used = started = time.monotonic()
+        request = dict(model=self.config.llm_model, messages=[])
+        if self.settings.keep_alive is not None:
+            request["keep_alive"] = self.settings.keep_alive
+        response = self.sync_client.chat(**request)
+        nanoseconds = getattr(response, "load_duration", None)
+        return nanoseconds / 1e9 if isinstance(nanoseconds, int) else time.monotonic() - started
+
+
+PROVIDERS: Dict[str, type] = {
+    "openai": OpenAIProvider,
+    "ollama": OllamaProvider,
+}
+
+
+def create_provider(config, settings) -> Provider:
+    """Create the provider for a backend config (Settings or Backend)."""
+    provider_class = PROVIDERS.get(config.provider)
+    if provider_class is None:
+        raise ValueError(f"Unsupported provider: {config.provider}")
+    return provider_class(config, settings)
+
+
+def providers_from_settings(settings) -> List[Provider]:
+    """Create the ordered backends described by settings: the main provider, then any extra backends."""
+    return [create_provider(config, settings) for config in [settings, *settings.backends]]
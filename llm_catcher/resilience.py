@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from typing import Dict, Iterator, Tuple
+
+# Exception class names (anywhere in the MRO) that indicate a transient provider failure.
+# Matched by name so this module doesn't have to import the provider SDKs.
+_TRANSIENT_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "RateLimitError",
+    "TimeoutException",
+    "NetworkError",
+    "RemoteProtocolError",
+}
+_TRANSIENT_STATUS = {408, 409, 425, 429}
+
+# Circuit breakers are shared by every diagnoser in the process, one per provider/model
+_breakers: Dict[Tuple[str, str], "CircuitBreaker"] = {}
+_breakers_lock = threading.Lock()
+
+
+def is_transient(error: BaseException) -> bool:
+    """Check whether an error from a provider call is worth retrying."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and (status in _TRANSIENT_STATUS or status >= 500):
+        return True
+    return any(cls.__name__ in _TRANSIENT_NAMES for cls in type(error).__mro__)
+
+
+def backoff_delays(base: float, cap: float) -> Iterator[float]:
+    """Yield exponential backoff delays with full jitter: uniform(0, min(cap, base * 2**n))."""
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider after consecutive failures.
+
+    After ``failure_threshold`` consecutive failed calls the breaker opens
+    and rejects calls outright. Once ``reset_timeout`` seconds have passed
+    it lets a single probe call through (half-open); the probe's outcome
+    closes the breaker again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check whether a call may go through, claiming the probe slot when half-open."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # A half-open probe that never reported back (e.g. cancelled) is replaced after reset_timeout
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Record a successful call, closing the breaker."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Record a failed call, opening the breaker at the threshold or after a failed probe."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        """Get the breaker state and counters."""
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+def get_breaker(provider: str, llm_model: str, failure_threshold: int, reset_timeout: float) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for a provider and model."""
+    with _breakers_lock:
+        breaker = _breakers.get((provider, llm_model))
+        if breaker is None:
+            breaker = _breakers[(provider, llm_model)] = CircuitBreaker(failure_threshold, reset_timeout)
+        breaker.failure_threshold = failure_threshold
+        breaker.reset_timeout = reset_timeout
+        return breaker
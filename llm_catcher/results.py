@@ -0,0 +1,93 @@
+"""Structured diagnoses: the file, line, explanation and fix as separate fields."""
+import json
+import re
+from typing import Dict, Optional
+
+STRUCTURED_INSTRUCTIONS = (
+    "Respond with only a JSON object with these keys:\n"
+    '"file": the file name where the error occurred, without its path (null if unknown)\n'
+    '"line": the line number, as an integer (null if unknown)\n'
+    '"explanation": one or two sentences on what went wrong\n'
+    '"fix": one or two sentences on how to fix it\n'
+)
+
+# Where a free-text answer mentions the failing file, e.g. 'File "app.py", line 12' or 'app.py at line 12'
+_FILE_LINE = re.compile(r'([\w.-]+\.py)"?,?\s+(?:at\s+|on\s+)?line\s+(\d+)', re.IGNORECASE)
+
+
+class DiagnosisResult:
+    """A diagnosis split into fields, with where it came from and how long it took.
+
+    ``source`` is "llm" for a fresh answer, "cache" for a cached one (or one
+    shared with a concurrent caller), and "skipped" or "failed" when no
+    diagnosis was made, in which case ``explanation`` says why.
+    """
+
+    __slots__ = ("error", "file", "line", "explanation", "fix", "source", "elapsed")
+
+    def __init__(self, error: str, explanation: str, file: Optional[str] = None, line: Optional[int] = None,
+                 fix: Optional[str] = None, source: str = "llm", elapsed: float = 0.0):
+        # Summary of the diagnosed exception, e.g. "KeyError: 'user_17'"
+        self.error = error
+        self.file = file
+        self.line = line
+        self.explanation = explanation
+        self.fix = fix
+        self.source = source
+        self.elapsed = elapsed
+
+    @classmethod
+    def parse(cls, answer: str, error: str, source: str = "llm", elapsed: float = 0.0) -> "DiagnosisResult":
+        """Read the model's answer: a JSON object if it gave one, else free text with the file and line searched for."""
+        fields = _json_object(answer)
+        if fields is None:
+            match = _FILE_LINE.search(answer)
+            file, line = (match.group(1), int(match.group(2))) if match else (None, None)
+            return cls(error, answer.strip(), file, line, None, source, elapsed)
+        line = fields.get("line")
+        try:
+            line = int(line) if line is not None else None
+        except (TypeError, ValueError):
+            line = None
+        return cls(
+            error,
+            str(fields.get("explanation") or "").strip(),
+            _text(fields.get("file")),
+            line,
+            _text(fields.get("fix")),
+            source,
+            elapsed,
+        )
+
+    @property
+    def text(self) -> str:
+        """Get the diagnosis as one paragraph, like the free-text diagnoses."""
+        location = ""
+        if self.file:
+            location = f"In {self.file}" + (f" (line {self.line})" if self.line is not None else "") + ": "
+        return location + self.explanation + (f" Fix: {self.fix}" if self.fix else "")
+
+    def as_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"DiagnosisResult({self.error!r}, file={self.file!r}, line={self.line!r}, source={self.source!r})"
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _json_object(answer: str) -> Optional[dict]:
+    """Get the JSON object in an answer, allowing for code fences or text around it."""
+    start, end = answer.find("{"), answer.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        fields = json.loads(answer[start:end + 1])
+    except ValueError:
+        return None
+    return fields if isinstance(fields, dict) else None
@@ -3,7 +3,9 @@ from loguru import logger
 from pydantic import Field, field_validator, model_validator, ValidationInfo, ConfigDict
 import json
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Iterator, List, Literal, Tuple
+from .providers import Backend
 
 
 class Settings(BaseSettings):
@@ -18,6 +20,113 @@ class Settings(BaseSettings):
     llm_model: str = Field(default="qwen2.5-coder")
     temperature: float | None = Field(default=None)
     provider: str = Field(default="ollama")
+    # OpenAI-compatible API base URL or Ollama host (default: the provider's own default)
+    base_url: str | None = Field(default=None)
+
+    # Extra backends tried in order when the main provider fails, e.g. OpenAI after a local Ollama
+    backends: List[Backend] = Field(default_factory=list)
+    # Send a hedged request to the next backend when the first hasn't answered within this
+    # percentile of its recent latencies (disabled unless set, e.g. 95)
+    hedge_percentile: float | None = Field(default=None)
+    hedge_min_samples: int = Field(default=20)
+
+    # Ollama: how long the model stays loaded after a request, e.g. "30m", or -1 for always
+    # (default: the server's OLLAMA_KEEP_ALIVE, 5 minutes unless changed)
+    keep_alive: float | str | None = Field(default=None)
+    # Ollama: load the model in the background when a diagnoser is created, and ping it after
+    # warmup_interval seconds without requests so it stays loaded
+    warmup: bool = Field(default=False)
+    warmup_interval: float | None = Field(default=None)
+
+    # HTTP connection pools, shared by every diagnoser using the same backend
+    max_connections: int = Field(default=20)
+    max_keepalive_connections: int = Field(default=10)
+    keepalive_expiry: float = Field(default=30.0)
+
+    # Provider call deadline (seconds, covering retries), retries and circuit breaker
+    timeout: float | None = Field(default=60.0)
+    max_retries: int = Field(default=2)
+    retry_backoff: float = Field(default=0.5)
+    retry_backoff_max: float = Field(default=8.0)
+    breaker_failure_threshold: int = Field(default=5)
+    breaker_reset_timeout: float = Field(default=30.0)
+
+    # Limits on generated diagnoses: tokens (OpenAI max_tokens, Ollama num_predict) and stop sequences
+    max_tokens: int | None = Field(default=512)
+    # Limit for OpenAI reasoning models (o1, o3, o4), whose completion tokens include their hidden
+    # reasoning; unset sends no limit
+    reasoning_max_tokens: int | None = Field(default=None)
+    stop: List[str] = Field(default_factory=list)
+
+    # Prompt compaction
+    compact_prompts: bool = Field(default=True)
+    collapse_library_frames: bool = Field(default=True)
+    max_chain_depth: int = Field(default=3)
+    max_repr_length: int = Field(default=500)
+    max_prompt_tokens: int | None = Field(default=4000)
+
+    # Add the source code around the innermost project (non-library) frames to prompts
+    source_context: bool = Field(default=False)
+    source_context_lines: int = Field(default=5)
+    source_context_max_frames: int = Field(default=3)
+    # Memory for the process-wide cache of source files read for context
+    source_cache_max_bytes: int = Field(default=32 * 1024 * 1024)
+
+    # Diagnosis cache
+    cache_enabled: bool = Field(default=True)
+    cache_max_size: int = Field(default=256)
+    cache_ttl: float | None = Field(default=3600.0)
+
+    # Reuse diagnoses of near-duplicate errors (requires numpy; "ollama" embeds with embedding_model)
+    similarity_enabled: bool = Field(default=False)
+    similarity_method: Literal["minhash", "ollama"] = Field(default="minhash")
+    similarity_threshold: float = Field(default=0.6)
+    similarity_max_entries: int = Field(default=5000)
+    embedding_model: str = Field(default="nomic-embed-text")
+
+    # Persistent diagnosis store shared across processes (disabled unless a path is set)
+    store_path: str | None = Field(default=None)
+    store_max_bytes: int = Field(default=64 * 1024 * 1024)
+
+    # Background diagnosis for the catch decorator and global handler
+    background: bool = Field(default=False)
+    background_workers: int = Field(default=2)
+    background_queue_size: int = Field(default=1000)
+    background_drop_policy: Literal["drop_new", "drop_old", "block"] = Field(default="drop_new")
+    background_flush_timeout: float = Field(default=5.0)
+    # Add the failing frame's local variables to deferred diagnoses (background, forwarded, and
+    # thread or event loop exceptions); their values are sent to the LLM
+    include_locals: bool = Field(default=False)
+
+    # Forward exceptions to a diagnosing process (see LLMExceptionDiagnoser.serve) instead of
+    # calling the LLM from this process: a Unix socket path or host:port
+    forward_address: str | None = Field(default=None)
+
+    # Batch diagnosis (diagnose_many/adiagnose_many)
+    batch_max_tokens: int = Field(default=6000)
+    batch_max_items: int = Field(default=10)
+    batch_concurrency: int = Field(default=4)
+
+    # Metrics (see LLMExceptionDiagnoser.stats) and OpenTelemetry spans (needs opentelemetry-api)
+    metrics_enabled: bool = Field(default=True)
+    otel_tracing: bool = Field(default=False)
+
+    # Stream diagnoses to stderr as they are generated from the global handler
+    stream_to_stderr: bool = Field(default=False)
+
+    # Limits on outbound LLM calls (unset limits are not enforced)
+    rate_limit_per_minute: float | None = Field(default=None)
+    rate_limit_burst: int = Field(default=10)
+    sample_first_n: int | None = Field(default=None)
+    sample_one_in: int = Field(default=10)
+    daily_token_budget: int | None = Field(default=None)
+    daily_cost_budget: float | None = Field(default=None)
+    cost_per_1k_tokens: float = Field(default=0.0)
+    max_concurrent_requests: int | None = Field(default=None)
+
+    # Check config files for changes this often (seconds) and apply them to the shared settings
+    # returned by get_settings (disabled unless set)
+    config_reload_interval: float | None = Field(default=None)
 
     @field_validator('temperature')
     @classmethod
@@ -62,65 +171,140 @@ class Settings(BaseSettings):
         return values
 
 
+# Config files in order of precedence: the working directory, then the home directory
+CONFIG_PATHS = (
+    "llm_catcher_config.json",
+    "config.json",
+    "~/.llm_catcher_config.json",
+)
+
+_settings: Settings | None = None
+_signature: Tuple | None = None
+_lock = threading.Lock()
+_watcher: threading.Thread | None = None
+_stop_watching = threading.Event()
+
+
+def _config_files() -> Iterator[Tuple[str, Dict[Any, Any]]]:
+    """Yield the path and contents of each readable config file, in order of precedence."""
+    for path in CONFIG_PATHS:
+        path = os.path.expanduser(path)
+        try:
+            with open(path, 'r') as f:
+                yield path, json.load(f)
+        except FileNotFoundError:
+            continue
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse config file: {path}")
+        except Exception as e:
+            logger.warning(f"Error reading config file {path}: {str(e)}")
+
+
+def _config_signature() -> Tuple:
+    """Get the modification time and size of every file settings can come from, to detect changes."""
+    signature = []
+    for path in (*CONFIG_PATHS, ".env"):
+        try:
+            stat = os.stat(os.path.expanduser(path))
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
 def load_config_file() -> Dict[Any, Any]:
     """Load configuration from JSON file."""
-    config_paths = [
-        "llm_catcher_config.json",
-        "config.json",
-        os.path.expanduser("~/.llm_catcher_config.json"),
-    ]
-
-    for path in config_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse config file: {path}")
-            except Exception as e:
-                logger.warning(f"Error reading config file {path}: {str(e)}")
-    return {}
-
-
-def get_settings() -> Settings:
-    """Get settings with precedence order."""
-    # First check local directory config files
-    local_paths = [
-        "llm_catcher_config.json",
-        "config.json",
-    ]
-
-    # Then check home directory
-    home_paths = [
-        os.path.expanduser("~/.llm_catcher_config.json"),
-    ]
-
-    # Try local configs first
-    for path in local_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'r') as f:
-                    config = json.load(f)
-                    logger.debug(f"Loaded configuration from {path}")
-                    return Settings(**config)
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse config file: {path}")
-            except Exception as e:
-                logger.warning(f"Error reading config file {path}: {str(e)}")
+    return next((config for _, config in _config_files()), {})
 
-    # Try home directory config
-    for path in home_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'r') as f:
-                    config = json.load(f)
-                    logger.debug(f"Loaded configuration from {path}")
-                    return Settings(**config)
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse config file: {path}")
-            except Exception as e:
-                logger.warning(f"Error reading config file {path}: {str(e)}")
 
-    # Finally, fall back to environment variables and defaults
+def _load_settings() -> Settings:
+    """Build settings from the first valid config file, falling back to environment variables and defaults."""
+    for path, config in _config_files():
+        try:
+            settings = Settings(**config)
+        except Exception as e:
+            logger.warning(f"Error reading config file {path}: {str(e)}")
+            continue
+        logger.debug(f"Loaded configuration from {path}")
+        return settings
+
     logger.debug("Using environment variables and defaults")
     return Settings()
+
+
+def get_settings(reload: bool = False) -> Settings:
+    """Get settings with precedence order: config files, then environment variables and defaults.
+
+    The settings are loaded once and shared by every caller (and every
+    diagnoser created without explicit settings). Pass reload=True, or call
+    reload_settings(), to pick up changes; with config_reload_interval set,
+    changed config files are applied automatically.
+    """
+    global _settings, _signature
+    with _lock:
+        if _settings is None or reload:
+            signature = _config_signature()
+            settings = _load_settings()
+            if _settings is None:
+                _settings = settings
+            else:
+                _update(_settings, settings)
+            _signature = signature
+        if _settings.config_reload_interval and _watcher is None:
+            _watch(_settings.config_reload_interval)
+        return _settings
+
+
+def reload_settings() -> bool:
+    """Apply config file changes to the shared settings, returning True if anything changed.
+
+    The shared Settings object is updated in place, so diagnosers using it see
+    new values for the settings read on each call (model, temperature, base
+    URL, timeouts, limits). Settings used when a diagnoser is created, such as
+    the cache size or backends, apply to diagnosers created afterwards.
+    """
+    global _signature
+    with _lock:
+        if _settings is None:
+            return False
+        signature = _config_signature()
+        if signature == _signature:
+            return False
+        _signature = signature
+        return _update(_settings, _load_settings())
+
+
+def clear_settings_cache():
+    """Forget the shared settings (and stop watching for changes), so the next get_settings() loads them anew."""
+    global _settings, _signature, _watcher
+    with _lock:
+        _settings = _signature = None
+        if _watcher is not None:
+            _stop_watching.set()
+            _watcher = None
+
+
+def _update(current: Settings, new: Settings) -> bool:
+    """Copy changed values from new onto current, returning True if there were any."""
+    changed = [name for name in Settings.model_fields if getattr(current, name) != getattr(new, name)]
+    for name in changed:
+        setattr(current, name, getattr(new, name))
+    if changed:
+        logger.info(f"Reloaded settings: {', '.join(changed)} changed")
+    return bool(changed)
+
+
+def _watch(interval: float):
+    """Start a daemon thread applying config file changes every interval seconds."""
+    global _watcher, _stop_watching
+    stop = _stop_watching = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                reload_settings()
+            except Exception as e:
+                logger.warning(f"Failed to reload settings: {e}")
+
+    _watcher = threading.Thread(target=run, name="llm-catcher-settings", daemon=True)
+    _watcher.start()
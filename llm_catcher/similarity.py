@@ -0,0 +1,211 @@
+from loguru import logger
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from .fingerprint import normalize_message
+from .snapshot import ExceptionSnapshot
+from .wrappers import WRAPPER_FILENAME
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Mersenne prime used for MinHash permutations; hashes are reduced below it
+_PRIME = (1 << 61) - 1
+
+
+def _chain(error: BaseException) -> Iterator[Tuple[str, str, List[Tuple[str, str]]]]:
+    """Yield (type name, message, [(file, function)]) for an exception and its chained causes."""
+    seen = set()
+    current = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        frames = []
+        tb = current.__traceback__
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename != WRAPPER_FILENAME:
+                frames.append((tb.tb_frame.f_code.co_filename, tb.tb_frame.f_code.co_name))
+            tb = tb.tb_next
+        yield type(current).__qualname__, str(current), frames
+        current = current.__cause__ or (None if current.__suppress_context__ else current.__context__)
+
+
+def similarity_text(error: Union[BaseException, ExceptionSnapshot]) -> str:
+    """Describe an exception or snapshot for similarity matching: types, normalized messages and call path.
+
+    Each frame becomes one ``Type@file:function`` word, so errors of different
+    types share nothing. Line numbers, directories and volatile values are left
+    out, so the same error raised from a moved line or a different deploy path
+    still matches.
+    """
+    if isinstance(error, ExceptionSnapshot):
+        chain = ((snapshot.exc_type.rsplit(".", 1)[-1], snapshot.message,
+                  [(filename, name) for filename, _, name, _ in snapshot.frames if filename != WRAPPER_FILENAME])
+                 for snapshot in error.chain())
+    else:
+        chain = _chain(error)
+    parts = []
+    for name, message, frames in chain:
+        parts.append(f"{name}: {normalize_message(message)}")
+        parts.extend(f"{name}@{os.path.basename(filename)}:{function}" for filename, function in frames)
+    return "\n".join(parts)
+
+
+class Match(NamedTuple):
+    """A previously diagnosed error similar to the one being looked up."""
+
+    score: float
+    diagnosis: str
+
+
+class MinHashEmbedder:
+    """MinHash signatures over word n-grams; signature agreement estimates Jaccard similarity.
+
+    Shingles never span lines, so each frame line of a similarity text is one
+    shingle.
+    """
+
+    metric = "jaccard"
+    blocking = False
+
+    def __init__(self, num_perm: int = 128, ngram: int = 2, seed: int = 1):
+        import numpy as np
+        self._np = np
+        self.ngram = ngram
+        rng = np.random.default_rng(seed)
+        # a * x + b wraps around uint64 before the modulo, as in the usual NumPy MinHash implementations
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> List[int]:
+        grams = set()
+        for line in text.splitlines():
+            words = line.split()
+            if len(words) <= self.ngram:
+                grams.add(" ".join(words))
+            else:
+                grams.update(" ".join(words[i:i + self.ngram]) for i in range(len(words) - self.ngram + 1))
+        return [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little")
+                for gram in grams]
+
+    def embed(self, text: str) -> "np.ndarray":
+        """Get the MinHash signature of a text."""
+        np = self._np
+        hashes = np.array(self._shingles(text), dtype=np.uint64)[:, None]
+        return ((self._a * hashes + self._b) % np.uint64(_PRIME)).min(axis=0)
+
+
+class OllamaEmbedder:
+    """Embedding vectors from a local Ollama embedding model, compared by cosine similarity."""
+
+    metric = "cosine"
+    blocking = True
+
+    def __init__(self, get_client: Callable[[], object], model: str):
+        import numpy as np
+        self._np = np
+        self._get_client = get_client
+        self.model = model
+
+    def embed(self, text: str) -> "np.ndarray":
+        """Get the normalized embedding of a text."""
+        response = self._get_client().embed(model=self.model, input=text)
+        vector = self._np.asarray(response.embeddings[0], dtype=self._np.float32)
+        norm = self._np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SimilarityIndex:
+    """In-memory index of diagnosed errors with top-k nearest-neighbour lookup.
+
+    Vectors are kept in one NumPy array, so a lookup is a single vectorized
+    comparison against every stored error. Once ``max_entries`` is reached the
+    oldest entries are overwritten.
+    """
+
+    def __init__(self, embedder, threshold: float = 0.6, max_entries: int = 5000):
+        import numpy as np
+        self._np = np
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._vectors: Optional["np.ndarray"] = None
+        self._diagnoses: List[str] = []
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, get_ollama_client: Callable[[], object]) -> Optional["SimilarityIndex"]:
+        """Build the index described by settings, or None if disabled or NumPy isn't installed."""
+        if not settings.similarity_enabled:
+            return None
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            logger.warning("similarity_enabled is set but numpy is not installed; similarity index disabled")
+            return None
+        if settings.similarity_method == "ollama":
+            embedder = OllamaEmbedder(get_ollama_client, settings.embedding_model)
+        else:
+            embedder = MinHashEmbedder()
+        return cls(embedder, settings.similarity_threshold, settings.similarity_max_entries)
+
+    def __len__(self) -> int:
+        return len(self._diagnoses)
+
+    def _scores(self, vector: "np.ndarray") -> "np.ndarray":
+        vectors = self._vectors[:len(self._diagnoses)]
+        if self.embedder.metric == "jaccard":
+            return (vectors == vector).mean(axis=1)
+        return vectors @ vector
+
+    def query(self, text: str, k: int = 1) -> List[Match]:
+        """Get the k most similar stored diagnoses, best first, whatever their score."""
+        vector = self.embedder.embed(text)
+        with self._lock:
+            if not self._diagnoses:
+                return []
+            scores = self._scores(vector)
+            k = min(k, len(scores))
+            top = self._np.argpartition(-scores, k - 1)[:k]
+            top = top[self._np.argsort(-scores[top])]
+            return [Match(float(scores[i]), self._diagnoses[i]) for i in top]
+
+    def lookup(self, text: str) -> Optional[Match]:
+        """Get the most similar stored diagnosis if it clears the similarity threshold."""
+        matches = self.query(text)
+        match = matches[0] if matches and matches[0].score >= self.threshold else None
+        with self._lock:
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return match
+
+    def add(self, text: str, diagnosis: str):
+        """Index a freshly diagnosed error."""
+        vector = self.embedder.embed(text)
+        np = self._np
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.empty((min(64, self.max_entries), len(vector)), dtype=vector.dtype)
+            size = len(self._diagnoses)
+            if size < self.max_entries:
+                if size == len(self._vectors):
+                    grown = np.empty((min(2 * size, self.max_entries), len(vector)), dtype=vector.dtype)
+                    grown[:size] = self._vectors
+                    self._vectors = grown
+                slot = size
+                self._diagnoses.append(diagnosis)
+            else:
+                slot = self._next
+                self._next = (self._next + 1) % self.max_entries
+                self._diagnoses[slot] = diagnosis
+            self._vectors[slot] = vector
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of indexed errors and lookup hit/miss counters."""
+        with self._lock:
+            return {"size": len(self._diagnoses), "hits": self.hits, "misses": self.misses}
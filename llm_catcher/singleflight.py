@@ -0,0 +1,178 @@
+from concurrent.futures import Future
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+class _Abandoned(Exception):
+    """Set on a call whose leader was cancelled or interrupted, so its followers run the call again."""
+
+
+class _Call:
+    """A pending call that followers wait on."""
+
+    __slots__ = ("future", "thread_id")
+
+    def __init__(self):
+        self.future: Future = Future()
+        # Mark as running so a cancelled follower can't cancel the shared result
+        self.future.set_running_or_notify_cancel()
+        self.thread_id = threading.get_ident()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single in-flight call.
+
+    The first caller for a key (the leader) runs the call; later callers,
+    whether sync threads or async tasks, wait for the leader's result
+    instead of starting their own. Streamed calls share the text they
+    stream: followers of a stream, and callers of do/ado joining one, get
+    the leader's chunks joined once it finishes.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> tuple[_Call, bool]:
+        """Get the pending call for key and whether the caller leads it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _finish(self, key: str, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def _abandon(self, key: str, call: _Call):
+        # Clear the entry first, so woken followers start a new call rather than join this one
+        self._finish(key, call)
+        call.future.set_exception(_Abandoned())
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run fn unless a call for key is already in flight, in which case wait for its result."""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            if call.thread_id == threading.get_ident():
+                # The leader is an async task on this thread's event loop; blocking would deadlock it
+                return fn()
+            try:
+                return call.future.result()
+            except _Abandoned:
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            call.future.set_exception(e)
+            raise
+        except BaseException:
+            # Cancellation and interrupts belong to the leader only; followers retry without it
+            self._abandon(key, call)
+            raise
+        else:
+            call.future.set_result(result)
+            return result
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn() unless a call for key is already in flight, in which case await its result."""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(call.future)
+            except _Abandoned:
+                continue
+        try:
+            result = await fn()
+        except Exception as e:
+            call.future.set_exception(e)
+            raise
+        except BaseException:
+            self._abandon(key, call)
+            raise
+        else:
+            call.future.set_result(result)
+            return result
+        finally:
+            self._finish(key, call)
+
+    def stream(self, key: str, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Stream fn() unless a call for key is already in flight, in which case yield its result in one piece."""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            if call.thread_id == threading.get_ident():
+                # As in do: the leader is an async task this thread's event loop is waiting on
+                yield from fn()
+                return
+            try:
+                result = call.future.result()
+            except _Abandoned:
+                continue
+            yield result
+            return
+        chunks = []
+        try:
+            for chunk in fn():
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            call.future.set_exception(e)
+            raise
+        except BaseException:
+            # Includes the consumer closing the stream early
+            self._abandon(key, call)
+            raise
+        else:
+            call.future.set_result("".join(chunks))
+        finally:
+            self._finish(key, call)
+
+    async def astream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Stream fn() unless a call for key is already in flight, in which case yield its result in one piece."""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            try:
+                result = await asyncio.wrap_future(call.future)
+            except _Abandoned:
+                continue
+            yield result
+            return
+        chunks = []
+        try:
+            async for chunk in fn():
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            call.future.set_exception(e)
+            raise
+        except BaseException:
+            self._abandon(key, call)
+            raise
+        else:
+            call.future.set_result("".join(chunks))
+        finally:
+            self._finish(key, call)
+
+    def stats(self) -> Dict[str, int]:
+        """Get leader/coalesced counters and the number of calls in flight."""
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
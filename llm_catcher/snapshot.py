@@ -0,0 +1,216 @@
+import json
+import traceback
+from typing import Dict, List, Optional, Tuple
+from .background import summarize_locals
+from .compaction import CAUSE_MESSAGE, CONTEXT_MESSAGE
+from .fingerprint import exception_type_name, fingerprint_exception, fingerprint_traceback_text
+
+# (filename, line number, function name, source line), the tuple form traceback.StackSummary.from_list takes
+Frame = Tuple[str, int, str, str]
+
+_LINKS = {CAUSE_MESSAGE.strip(): "cause", CONTEXT_MESSAGE.strip(): "context"}
+_TRACEBACK_START = "Traceback (most recent call last):"
+
+
+class ExceptionSnapshot:
+    """Compact, picklable and JSON-serializable copy of an exception and its traceback.
+
+    Only strings and numbers are kept, so the traceback, its frames and every
+    object they reference can be released once the snapshot is taken. Snapshots
+    can be diagnosed later, in another thread or on another machine, and share
+    cache keys with the live exception they were taken from.
+
+    Example:
+        snapshot = ExceptionSnapshot.capture(e, include_locals=True)
+        payload = snapshot.to_json()
+        ...
+        diagnoser.diagnose(ExceptionSnapshot.from_json(payload))
+    """
+
+    __slots__ = ("exc_type", "message", "frames", "locals", "cause", "link", "fingerprint")
+
+    def __init__(self, exc_type: str, message: str, frames: List[Frame], fingerprint: str,
+                 locals: Optional[str] = None, cause: Optional["ExceptionSnapshot"] = None,
+                 link: Optional[str] = None):
+        self.exc_type = exc_type
+        self.message = message
+        self.frames = frames
+        self.fingerprint = fingerprint
+        # Summary of the innermost frame's local variables, if captured
+        self.locals = locals
+        # The exception this one was raised from ("cause") or while handling ("context")
+        self.cause = cause
+        self.link = link
+
+    @classmethod
+    def capture(cls, error: BaseException, include_locals: bool = False, max_chain_depth: int = 10,
+                max_vars: int = 20, max_repr: int = 120, release: bool = False) -> "ExceptionSnapshot":
+        """Snapshot a live exception and its chained causes.
+
+        Args:
+            error: The exception to snapshot
+            include_locals: Also summarize the local variables of the innermost frame
+            max_chain_depth: Chained exceptions kept, counting this one
+            max_vars: Local variables summarized, at most
+            max_repr: Characters kept of each local variable's repr
+            release: Clear the traceback's frames and drop it from the exception, freeing the objects they
+                reference. Only use this when the exception won't be re-raised.
+        """
+        snapshot = cls._capture(error, include_locals, max_chain_depth, max_vars, max_repr, set())
+        snapshot.fingerprint = fingerprint_exception(error)
+        if release:
+            current, seen = error, set()
+            while current is not None and id(current) not in seen:
+                seen.add(id(current))
+                if current.__traceback__ is not None:
+                    traceback.clear_frames(current.__traceback__)
+                    current.__traceback__ = None
+                current = current.__cause__ or current.__context__
+        return snapshot
+
+    @classmethod
+    def _capture(cls, error: BaseException, include_locals: bool, depth: int, max_vars: int, max_repr: int,
+                 seen: set) -> "ExceptionSnapshot":
+        seen.add(id(error))
+        frames = [(frame.filename, frame.lineno, frame.name, frame.line or "")
+                  for frame in traceback.extract_tb(error.__traceback__)]
+        try:
+            message = str(error)
+        except Exception:
+            message = f"<unprintable {type(error).__name__}>"
+        locals = summarize_locals(error.__traceback__, max_vars, max_repr) if include_locals else None
+        snapshot = cls(exception_type_name(error), message, frames, "", locals)
+        if error.__cause__ is not None:
+            chained, link = error.__cause__, "cause"
+        elif error.__context__ is not None and not error.__suppress_context__:
+            chained, link = error.__context__, "context"
+        else:
+            chained = None
+        if chained is not None and depth > 1 and id(chained) not in seen:
+            snapshot.cause = cls._capture(chained, False, depth - 1, max_vars, max_repr, seen)
+            snapshot.link = link
+        return snapshot
+
+    @classmethod
+    def from_text(cls, text: str) -> "ExceptionSnapshot":
+        """Parse a formatted traceback, e.g. from a log file, into a snapshot."""
+        chain: List[Tuple[ExceptionSnapshot, Optional[str]]] = []
+        link = None
+        for block in text.split(_TRACEBACK_START):
+            frames: List[Frame] = []
+            exc_type, message_lines = "", []
+            for line in block.splitlines():
+                stripped = line.strip()
+                if stripped in _LINKS:
+                    link = _LINKS[stripped]
+                    continue
+                if line.startswith("  File \""):
+                    filename, _, rest = line[8:].partition('", line ')
+                    lineno, _, name = rest.partition(", in ")
+                    frames.append((filename, int(lineno) if lineno.isdigit() else 0, name.strip(), ""))
+                elif exc_type:
+                    if stripped:
+                        message_lines.append(line)
+                elif line.startswith("    ") and frames and not frames[-1][3] and stripped.strip("^~ "):
+                    filename, lineno, name, _ = frames[-1]
+                    frames[-1] = (filename, lineno, name, stripped)
+                elif stripped and not line[0].isspace() and (frames or not chain):
+                    exc_type, _, message = line.partition(":")
+                    if not all(part.isidentifier() for part in exc_type.split(".")):
+                        # Not a traceback at all: keep the text as the message
+                        exc_type, message = "", line
+                    message_lines.append(message.strip())
+            if frames or exc_type or message_lines:
+                chain.append((cls(exc_type, "\n".join(message_lines), frames, ""), link))
+                link = None
+        if not chain:
+            return cls("", text.strip(), [], fingerprint_traceback_text(text))
+        # Tracebacks print the oldest exception first; the snapshot starts from the newest
+        snapshot = chain[0][0]
+        for (newer, _), (older, link) in zip(chain[1:], chain):
+            newer.cause, newer.link = older, link or "context"
+            snapshot = newer
+        snapshot.fingerprint = fingerprint_traceback_text(text)
+        return snapshot
+
+    @property
+    def summary(self) -> str:
+        """Get the last line of the formatted traceback, e.g. "KeyError: 'user'"."""
+        if not self.exc_type:
+            return self.message
+        return f"{self.exc_type}: {self.message}" if self.message else self.exc_type
+
+    def chain(self) -> List["ExceptionSnapshot"]:
+        """Get this exception and the ones it was chained to, newest first."""
+        chain = []
+        current = self
+        while current is not None:
+            chain.append(current)
+            current = current.cause
+        return chain
+
+    def format(self) -> str:
+        """Format the snapshot like traceback.format_exception formats the live exception."""
+        parts = []
+        chain = self.chain()
+        for index in range(len(chain) - 1, -1, -1):
+            snapshot = chain[index]
+            if snapshot.frames:
+                parts.append(_TRACEBACK_START + "\n")
+                for filename, lineno, name, line in snapshot.frames:
+                    parts.append(f'  File "{filename}", line {lineno}, in {name}\n')
+                    if line:
+                        parts.append(f"    {line.strip()}\n")
+            parts.append(snapshot.summary + "\n")
+            if index > 0:
+                parts.append(CAUSE_MESSAGE if chain[index - 1].link == "cause" else CONTEXT_MESSAGE)
+        return "".join(parts)
+
+    def to_dict(self) -> Dict[str, object]:
+        """Get the snapshot as a JSON-serializable dict."""
+        return {
+            "exc_type": self.exc_type,
+            "message": self.message,
+            "frames": [list(frame) for frame in self.frames],
+            "fingerprint": self.fingerprint,
+            "locals": self.locals,
+            "cause": self.cause.to_dict() if self.cause is not None else None,
+            "link": self.link,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "ExceptionSnapshot":
+        """Rebuild a snapshot from to_dict output."""
+        cause = data.get("cause")
+        return cls(
+            data["exc_type"],
+            data["message"],
+            [tuple(frame) for frame in data["frames"]],
+            data["fingerprint"],
+            data.get("locals"),
+            cls.from_dict(cause) if cause else None,
+            data.get("link"),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, payload: str) -> "ExceptionSnapshot":
+        return cls.from_dict(json.loads(payload))
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        restored = self.from_dict(state)
+        for name in self.__slots__:
+            setattr(self, name, getattr(restored, name))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ExceptionSnapshot):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"ExceptionSnapshot({self.summary!r}, frames={len(self.frames)})"
@@ -0,0 +1,176 @@
+"""Source code around the frames of a traceback, read through a process-wide cache of files and line offsets."""
+from array import array
+from collections import OrderedDict
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from .compaction import is_library_path
+from .snapshot import ExceptionSnapshot
+
+_cache: Optional["SourceCache"] = None
+_cache_lock = threading.Lock()
+
+
+class _SourceFile:
+    __slots__ = ("mtime", "size", "data", "offsets")
+
+    def __init__(self, mtime: int, size: int, data: bytes):
+        self.mtime = mtime
+        self.size = size
+        self.data = data
+        # Start of each line; line n (1-based) is data[offsets[n - 1]:offsets[n]]
+        offsets = array("Q", [0])
+        position = data.find(b"\n")
+        while position >= 0:
+            offsets.append(position + 1)
+            position = data.find(b"\n", position + 1)
+        if offsets[-1] != len(data):
+            offsets.append(len(data))
+        self.offsets = offsets
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+    def lines(self, first: int, last: int) -> List[str]:
+        """Get lines first to last (1-based, inclusive), clamped to the file."""
+        first = max(first, 1)
+        last = min(last, len(self.offsets) - 1)
+        if first > last:
+            return []
+        text = self.data[self.offsets[first - 1]:self.offsets[last]].decode("utf-8", errors="replace")
+        return text.splitlines()
+
+
+class SourceCache:
+    """Source files kept in memory with their line offsets, least recently used dropped first.
+
+    Each lookup checks the file's modification time and size, so edited files
+    are read again. Files larger than a quarter of the budget are read but
+    not kept.
+
+    Args:
+        max_bytes: Memory budget for file contents and line offsets
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, _SourceFile]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lines(self, filename: str, first: int, last: int) -> List[str]:
+        """Get lines first to last (1-based, inclusive) of a file, or [] if it can't be read."""
+        try:
+            stat = os.stat(filename)
+        except (OSError, ValueError):
+            return []
+        with self._lock:
+            source = self._files.get(filename)
+            if source is not None and (source.mtime, source.size) == (stat.st_mtime_ns, stat.st_size):
+                self._files.move_to_end(filename)
+                self.hits += 1
+                return source.lines(first, last)
+            self.misses += 1
+        try:
+            with open(filename, "rb") as f:
+                source = _SourceFile(stat.st_mtime_ns, stat.st_size, f.read())
+        except OSError:
+            return []
+        self._store(filename, source)
+        return source.lines(first, last)
+
+    def _store(self, filename: str, source: _SourceFile):
+        with self._lock:
+            old = self._files.pop(filename, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if source.nbytes > self.max_bytes // 4:
+                return
+            self._files[filename] = source
+            self._bytes += source.nbytes
+            while self._bytes > self.max_bytes and self._files:
+                _, evicted = self._files.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+def get_source_cache(max_bytes: int) -> SourceCache:
+    """Get the process-wide source cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SourceCache(max_bytes)
+        _cache.max_bytes = max_bytes
+        return _cache
+
+
+def _frames(error: BaseException | ExceptionSnapshot, max_chain_depth: int) -> Iterator[Tuple[str, int, str]]:
+    """Yield (filename, line number, function) for each frame, innermost first, newest exception first."""
+    max_chain_depth = max(1, max_chain_depth)
+    if isinstance(error, ExceptionSnapshot):
+        for snapshot in error.chain()[:max_chain_depth]:
+            for filename, lineno, name, _ in reversed(snapshot.frames):
+                yield filename, lineno, name
+        return
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and len(seen) < max_chain_depth and id(current) not in seen:
+        seen.add(id(current))
+        tb = current.__traceback__
+        frames = []
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno, tb.tb_frame.f_code.co_name))
+            tb = tb.tb_next
+        yield from reversed(frames)
+        if current.__cause__ is not None:
+            current = current.__cause__
+        elif not current.__suppress_context__:
+            current = current.__context__
+        else:
+            current = None
+
+
+def source_context(error: BaseException | ExceptionSnapshot, cache: SourceCache, lines: int = 5,
+                   max_frames: int = 3, max_chain_depth: int = 3, max_line: int = 200) -> str:
+    """Format the source around the innermost project frames of an error, skipping library frames.
+
+    Args:
+        error: The exception or snapshot
+        cache: Where source files are read from
+        lines: Lines shown before and after each frame's line
+        max_frames: Frames shown, at most
+        max_chain_depth: Chained exceptions looked at, counting this one (at least 1)
+        max_line: Characters kept of each source line
+    """
+    sections = []
+    shown = set()
+    for filename, lineno, name in _frames(error, max_chain_depth):
+        if len(sections) >= max_frames:
+            break
+        if (filename, lineno) in shown or filename.startswith("<") or is_library_path(filename):
+            continue
+        first = max(lineno - lines, 1)
+        source = cache.lines(filename, first, lineno + lines)
+        if not source:
+            continue
+        shown.add((filename, lineno))
+        width = len(str(first + len(source) - 1))
+        body = "".join(
+            f"{'>' if number == lineno else ' '} {number:>{width}} | {text[:max_line].rstrip()}\n"
+            for number, text in enumerate(source, start=first)
+        )
+        sections.append(f'File "{os.path.basename(filename)}", line {lineno}, in {name}:\n{body}')
+    if not sections:
+        return ""
+    return "Source code around the failing lines (innermost first):\n" + "\n".join(sections)
@@ -0,0 +1,160 @@
+from loguru import logger
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Compaction trims the store down to this fraction of max_bytes so it doesn't run on every write
+_COMPACT_LOW_WATER = 0.8
+# How many writes between size checks
+_COMPACT_CHECK_INTERVAL = 64
+# Skip refreshing the access time of entries read more recently than this (seconds)
+_TOUCH_INTERVAL = 60.0
+
+
+class SQLiteDiagnosisStore:
+    """Persistent diagnosis store shared across processes and restarts.
+
+    Diagnoses are kept in a SQLite database in WAL mode, so any number of
+    worker processes can read concurrently while one writes. Each thread
+    gets its own connection. When the stored diagnoses grow beyond
+    ``max_bytes`` the least recently used ones are deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, busy_timeout: float = 5.0):
+        """Open (or create) the store.
+
+        Args:
+            path: Location of the SQLite database file
+            max_bytes: Size of stored keys and diagnoses that triggers compaction
+            ttl: Seconds a diagnosis stays valid, or None to keep it until compacted
+            busy_timeout: Seconds to wait for a lock held by another process
+        """
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS diagnoses ("
+                "key TEXT PRIMARY KEY, "
+                "diagnosis TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS diagnoses_accessed_at ON diagnoses (accessed_at)")
+        logger.debug(f"Opened diagnosis store at {self.path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+            # auto_vacuum must be chosen before the first table is created to take effect
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored diagnosis for key, or None on a miss."""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT diagnosis, created_at, accessed_at FROM diagnoses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl is not None and now - row[1] >= self.ttl):
+            with self._lock:
+                self.misses += 1
+            return None
+        if now - row[2] >= _TOUCH_INTERVAL:
+            conn.execute("UPDATE diagnoses SET accessed_at = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, diagnosis: str):
+        """Store a diagnosis, compacting the store if it has grown too large."""
+        now = time.time()
+        size = len(key) + len(diagnosis.encode())
+        self._connection().execute(
+            "INSERT OR REPLACE INTO diagnoses (key, diagnosis, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, diagnosis, size, now, now),
+        )
+        with self._lock:
+            self._writes += 1
+            check = self._writes % _COMPACT_CHECK_INTERVAL == 0
+        if check:
+            self.compact()
+
+    def size(self) -> int:
+        """Get the total size in bytes of stored keys and diagnoses."""
+        row = self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM diagnoses").fetchone()
+        return row[0]
+
+    def compact(self) -> int:
+        """Delete expired and least recently used diagnoses until under the size limit.
+
+        Returns:
+            Number of diagnoses deleted
+        """
+        conn = self._connection()
+        deleted = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if self.ttl is not None:
+                deleted += conn.execute(
+                    "DELETE FROM diagnoses WHERE created_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM diagnoses").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - int(self.max_bytes * _COMPACT_LOW_WATER)
+                rows = conn.execute("SELECT key, size FROM diagnoses ORDER BY accessed_at")
+                victims = []
+                for key, size in rows:
+                    if excess <= 0:
+                        break
+                    victims.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM diagnoses WHERE key = ?", victims)
+                deleted += len(victims)
+        if deleted:
+            conn.execute("PRAGMA incremental_vacuum")
+            logger.debug(f"Compacted diagnosis store, removed {deleted} entries")
+        return deleted
+
+    def clear(self):
+        """Remove all stored diagnoses."""
+        self._connection().execute("DELETE FROM diagnoses")
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters, entry count and total size."""
+        row = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM diagnoses"
+        ).fetchone()
+        return {"entries": row[0], "bytes": row[1], "hits": self.hits, "misses": self.misses}
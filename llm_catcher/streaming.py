@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import AsyncIterator, Iterator
+
+
+def trim_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Strip leading and trailing whitespace from a stream of text chunks.
+
+    Trailing whitespace of each chunk is held back until more text arrives,
+    so the joined output equals ``"".join(chunks).strip()``.
+    """
+    pending = ""
+    started = False
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        text = pending + chunk
+        stripped = text.rstrip()
+        pending = text[len(stripped):]
+        if stripped:
+            yield stripped
+
+
+async def atrim_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Strip leading and trailing whitespace from an async stream of text chunks."""
+    pending = ""
+    started = False
+    async for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        text = pending + chunk
+        stripped = text.rstrip()
+        pending = text[len(stripped):]
+        if stripped:
+            yield stripped
+
+
+def with_deadline(chunks: Iterator[str], timeout: float | None) -> Iterator[str]:
+    """Stop a stream with TimeoutError once the deadline passes (checked between chunks)."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for chunk in chunks:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Diagnosis stream exceeded its deadline")
+        yield chunk
+
+
+async def awith_deadline(chunks: AsyncIterator[str], timeout: float | None) -> AsyncIterator[str]:
+    """Stop an async stream with TimeoutError once the deadline passes, even mid-chunk."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    iterator = chunks.__aiter__()
+    while True:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+        except StopAsyncIteration:
+            return
+        yield chunk
@@ -0,0 +1,78 @@
+from loguru import logger
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class ModelWarmer:
+    """Loads local models before the first diagnosis needs them, and keeps them loaded while idle.
+
+    Runs on a daemon thread, so creating a diagnoser doesn't wait for the
+    model to load. Only backends that can be warmed up (Ollama) are touched.
+
+    Args:
+        providers: The diagnoser's backends
+        interval: Ping a backend not used for this many seconds, to keep its model loaded (None: only warm up once)
+    """
+
+    def __init__(self, providers: List, interval: Optional[float] = None):
+        self.providers = [provider for provider in providers if provider.can_warm_up]
+        self.interval = interval
+        self.warmups = 0
+        self.pings = 0
+        self.failures = 0
+        self.last_load: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ModelWarmer":
+        if self.providers and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="llm-catcher-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop pinging, waiting up to timeout seconds for a request in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        for provider in self.providers:
+            if self._stop.is_set():
+                return
+            self._warm(provider, ping=False)
+        if not self.interval:
+            return
+        while not self._stop.wait(self.interval):
+            for provider in self.providers:
+                # A backend used recently is still loaded; pinging it would only cost a request
+                if time.monotonic() - provider.last_used >= self.interval:
+                    self._warm(provider, ping=True)
+
+    def _warm(self, provider, ping: bool):
+        try:
+            seconds = provider.warm_up()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.warning(f"Could not warm up {provider.name}: {str(e)}")
+            return
+        with self._lock:
+            if ping:
+                self.pings += 1
+            else:
+                self.warmups += 1
+            self.last_load = seconds
+        if not ping:
+            logger.info(f"Warmed up {provider.name} (model loaded in {seconds:.2f}s)")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "warmups": self.warmups,
+                "pings": self.pings,
+                "failures": self.failures,
+                "last_load_seconds": self.last_load,
+            }
@@ -0,0 +1,182 @@
+from functools import update_wrapper
+import inspect
+from typing import Any, Awaitable, Callable, Optional
+
+# Names used inside generated wrappers; functions with parameters using the prefix get the generic wrapper
+_PREFIX = "_llm_catcher_"
+_NAMES = {name: _PREFIX + name for name in ("func", "handle", "error", "gen", "value", "sent", "thrown")}
+
+# Filename of the generated wrappers' frames in tracebacks, which diagnoses leave out
+WRAPPER_FILENAME = "<llm_catcher.catch>"
+
+_SYNC_TEMPLATE = """
+def _make({func}, {handle}):
+    def {name}({params}):
+        try:
+            return {func}({args})
+        except Exception as {error}:
+            {handle}({error})
+            raise
+    return {name}
+"""
+
+_ASYNC_TEMPLATE = """
+def _make({func}, {handle}):
+    async def {name}({params}):
+        try:
+            return await {func}({args})
+        except Exception as {error}:
+            await {handle}({error})
+            raise
+    return {name}
+"""
+
+_GENERATOR_TEMPLATE = """
+def _make({func}, {handle}):
+    def {name}({params}):
+        try:
+            return (yield from {func}({args}))
+        except Exception as {error}:
+            {handle}({error})
+            raise
+    return {name}
+"""
+
+_ASYNC_GENERATOR_TEMPLATE = """
+def _make({func}, {handle}):
+    async def {name}({params}):
+        {gen} = {func}({args})
+        try:
+            {value} = await {gen}.__anext__()
+            while True:
+                try:
+                    {sent} = yield {value}
+                except GeneratorExit:
+                    await {gen}.aclose()
+                    raise
+                except BaseException as {thrown}:
+                    {value} = await {gen}.athrow({thrown})
+                else:
+                    {value} = await ({gen}.__anext__() if {sent} is None else {gen}.asend({sent}))
+        except StopAsyncIteration:
+            return
+        except Exception as {error}:
+            await {handle}({error})
+            raise
+    return {name}
+"""
+
+
+def _signature(func) -> Optional[tuple]:
+    """Get the parameter list and matching call arguments of a plain Python function, or None."""
+    code = getattr(func, "__code__", None)
+    if code is None or not inspect.isfunction(func):
+        return None
+    names = code.co_varnames
+    positional = list(names[:code.co_argcount])
+    keyword_only = list(names[code.co_argcount:code.co_argcount + code.co_kwonlyargcount])
+    index = code.co_argcount + code.co_kwonlyargcount
+    varargs = varkw = None
+    if code.co_flags & inspect.CO_VARARGS:
+        varargs = names[index]
+        index += 1
+    if code.co_flags & inspect.CO_VARKEYWORDS:
+        varkw = names[index]
+    if any(name and name.startswith(_PREFIX) for name in (*positional, *keyword_only, varargs, varkw)):
+        return None
+
+    params = list(positional)
+    if code.co_posonlyargcount:
+        params.insert(code.co_posonlyargcount, "/")
+    args = list(positional)
+    if varargs:
+        params.append(f"*{varargs}")
+        args.append(f"*{varargs}")
+    elif keyword_only:
+        params.append("*")
+    params.extend(keyword_only)
+    args.extend(f"{name}={name}" for name in keyword_only)
+    if varkw:
+        params.append(f"**{varkw}")
+        args.append(f"**{varkw}")
+    return ", ".join(params), ", ".join(args)
+
+
+def _generic(func, handle, kind: str):
+    """Build an *args/**kwargs wrapper for callables whose signature can't be copied."""
+    if kind == "async":
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                await handle(e)
+                raise
+    elif kind == "generator":
+        def wrapper(*args, **kwargs):
+            try:
+                return (yield from func(*args, **kwargs))
+            except Exception as e:
+                handle(e)
+                raise
+    elif kind == "async_generator":
+        return _compile(_ASYNC_GENERATOR_TEMPLATE, "wrapper", "*args, **kwargs", "*args, **kwargs")(func, handle)
+    else:
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                handle(e)
+                raise
+    return wrapper
+
+
+def _compile(template: str, name: str, params: str, args: str) -> Callable:
+    """Compile a wrapper template, returning its factory taking the function and the handler."""
+    namespace: dict = {}
+    code = compile(template.format(name=name, params=params, args=args, **_NAMES), WRAPPER_FILENAME, "exec")
+    exec(code, namespace)
+    return namespace["_make"]
+
+
+_TEMPLATES = {
+    "sync": _SYNC_TEMPLATE,
+    "async": _ASYNC_TEMPLATE,
+    "generator": _GENERATOR_TEMPLATE,
+    "async_generator": _ASYNC_GENERATOR_TEMPLATE,
+}
+
+
+def function_kind(func) -> str:
+    """Classify a callable as 'sync', 'async', 'generator' or 'async_generator'."""
+    if inspect.isasyncgenfunction(func):
+        return "async_generator"
+    if inspect.iscoroutinefunction(func):
+        return "async"
+    if inspect.isgeneratorfunction(func):
+        return "generator"
+    return "sync"
+
+
+def wrap(func: Callable, handle: Callable[[Exception], Any],
+         ahandle: Callable[[Exception], Awaitable[Any]]) -> Callable:
+    """Wrap a function so exceptions escaping it are passed to a handler, then re-raised.
+
+    For plain Python functions the wrapper is generated with the function's own
+    parameter list and passes the arguments straight through. That avoids packing
+    ``*args``/``**kwargs`` on every call, so the success path costs little more
+    than the try block. Coroutine functions and async generators use ``ahandle``.
+    Generators and async generators are wrapped so send/throw/close reach the
+    original.
+    """
+    kind = function_kind(func)
+    handler = ahandle if kind in ("async", "async_generator") else handle
+    signature = _signature(func)
+    if signature is None:
+        wrapper = _generic(func, handler, kind)
+    else:
+        params, args = signature
+        name = func.__name__ if func.__name__.isidentifier() else "wrapper"
+        wrapper = _compile(_TEMPLATES[kind], name, params, args)(func, handler)
+        wrapper.__defaults__ = func.__defaults__
+        wrapper.__kwdefaults__ = dict(func.__kwdefaults__) if func.__kwdefaults__ else None
+    return update_wrapper(wrapper, func)
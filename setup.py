@@ -10,7 +10,7 @@ setup(
     install_requires=[
         "pydantic>=2.0.0",
         "pydantic-settings>=2.0.0",
-        "openai>=1.0.0",
+        "openai>=1.17.0",
         "python-dotenv>=0.19.0",
         "loguru>=0.6.0",
     ],
@@ -20,6 +20,17 @@ setup(
             "uvicorn>=0.15.0",
             "requests>=2.26.0",
         ],
+        "otel": [
+            "opentelemetry-api>=1.20.0",
+        ],
+        "similarity": [
+            "numpy>=1.21.0",
+        ],
+    },
+    entry_points={
+        "console_scripts": [
+            "llm-catcher=llm_catcher.cli:main",
+        ],
     },
     python_requires=">=3.8",
 )
@@ -1,5 +1,7 @@
+import pytest
 import warnings
 import os
+from llm_catcher import limits, providers, resilience, settings, sources
 
 
 def pytest_configure(config):
@@ -18,3 +20,15 @@ def pytest_configure(config):
         message=".*Support for class-based `config` is deprecated.*",
         category=DeprecationWarning
     )
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    """Reset process-wide settings, circuit breakers, rate limit buckets, shared clients and source files."""
+    settings.clear_settings_cache()
+    sources._cache = None
+    resilience._breakers.clear()
+    limits._buckets.clear()
+    providers._clients.clear()
+    providers._async_clients.clear()
+    yield
@@ -0,0 +1,196 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.asgi import DiagnosisMiddleware
+import asyncio
+import httpx
+
+
+class Payload:
+    pass
+
+
+async def app(scope, receive, send):
+    if scope["path"] == "/ok":
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+        return
+    payload = Payload()  # noqa: F841
+    raise KeyError("user_17")
+
+
+def _diagnoser(release: asyncio.Event = None):
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(), global_handler=False)
+    calls = []
+
+    async def astream(prompt, on_usage):
+        calls.append(prompt)
+        yield "Check the "
+        if release is not None:
+            await release.wait()
+        yield "user exists."
+
+    diagnoser.providers[0].astream = astream
+    diagnoser.calls = calls
+    return diagnoser
+
+
+def _client(middleware):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_error_response_is_immediate():
+    """Test that the 500 is sent before the diagnosis finishes, which is then served by id."""
+    release = asyncio.Event()
+    middleware = DiagnosisMiddleware(app, _diagnoser(release), path_prefix="/diagnoses")
+
+    async with _client(middleware) as client:
+        response = await client.get("/boom")
+        assert response.status_code == 500
+        body = response.json()
+        assert body["diagnosis_url"] == f"/diagnoses/{body['diagnosis_id']}"
+        assert response.headers["x-diagnosis-id"] == body["diagnosis_id"]
+
+        await asyncio.sleep(0)
+        pending = (await client.get(body["diagnosis_url"])).json()
+        assert pending["status"] == "pending" and pending["error"] == "KeyError: 'user_17'"
+
+        release.set()
+        assert await middleware.drain(1)
+        done = (await client.get(body["diagnosis_url"])).json()
+        assert done["status"] == "done" and done["diagnosis"] == "Check the user exists."
+
+        assert (await client.get("/ok")).text == "ok"
+        assert (await client.get("/diagnoses/unknown")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_event_stream():
+    """Test that clients accepting server-sent events get the text as it is generated."""
+    release = asyncio.Event()
+    middleware = DiagnosisMiddleware(app, _diagnoser(release), path_prefix="/diagnoses")
+
+    async with _client(middleware) as client:
+        url = (await client.get("/boom")).json()["diagnosis_url"]
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        response = await client.get(url, headers={"accept": "text/event-stream"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == ("event: chunk\ndata: Check the\n\n"
+                             "event: chunk\ndata:  user exists.\n\n"
+                             "event: done\ndata: Check the user exists.\n\n")
+
+
+@pytest.mark.asyncio
+async def test_concurrency_and_release():
+    """Test that queued repeats reuse the first diagnosis and that frames aren't kept for the prompt."""
+    release = asyncio.Event()
+    diagnoser = _diagnoser(release)
+    middleware = DiagnosisMiddleware(app, diagnoser, max_concurrency=1)
+
+    async with _client(middleware) as client:
+        responses = await asyncio.gather(*(client.get("/boom") for _ in range(3)))
+    assert len({r.json()["diagnosis_id"] for r in responses}) == 3
+    await asyncio.sleep(0.01)
+    assert len(diagnoser.calls) == 1
+
+    release.set()
+    assert await middleware.drain(1)
+    assert all(d.text == "Check the user exists." for d in middleware.results.values())
+    assert len(diagnoser.calls) == 1
+    assert "Payload" not in diagnoser.calls[0]
+
+
+@pytest.mark.asyncio
+async def test_endpoint_is_opt_in():
+    """Test that diagnoses aren't served, or linked from the 500, unless a path prefix is given."""
+    middleware = DiagnosisMiddleware(app, _diagnoser())
+
+    async with _client(middleware) as client:
+        body = (await client.get("/boom")).json()
+        assert "diagnosis_url" not in body
+        assert await middleware.drain(1)
+        # Falls through to the app, which fails like any unknown path
+        response = await client.get(f"/diagnoses/{body['diagnosis_id']}")
+
+    assert "diagnosis_url" not in response.json() and "status" not in response.json()
+    assert middleware.results[body["diagnosis_id"]].text == "Check the user exists."
+
+
+@pytest.mark.asyncio
+async def test_authorize():
+    """Test that the endpoint only answers requests the authorize callback accepts."""
+    async def authorize(scope):
+        return (b"authorization", b"Bearer admin") in scope["headers"]
+
+    middleware = DiagnosisMiddleware(app, _diagnoser(), path_prefix="/diagnoses", authorize=authorize)
+
+    async with _client(middleware) as client:
+        url = (await client.get("/boom")).json()["diagnosis_url"]
+        assert await middleware.drain(1)
+        assert (await client.get(url)).status_code == 403
+        allowed = await client.get(url, headers={"authorization": "Bearer admin"})
+
+    assert allowed.json()["diagnosis"] == "Check the user exists."
+
+
+@pytest.mark.asyncio
+async def test_concurrent_repeats_share_stream():
+    """Test that identical errors diagnosed concurrently share one LLM stream."""
+    release = asyncio.Event()
+    diagnoser = _diagnoser(release)
+    middleware = DiagnosisMiddleware(app, diagnoser, max_concurrency=4)
+
+    async with _client(middleware) as client:
+        await asyncio.gather(*(client.get("/boom") for _ in range(4)))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await middleware.drain(1)
+
+    assert len(diagnoser.calls) == 1
+    assert [d.text for d in middleware.results.values()] == ["Check the user exists."] * 4
+    assert diagnoser.inflight.stats()["coalesced"] == 3
+
+
+@pytest.mark.asyncio
+async def test_provider_outage():
+    """Test that a diagnosis the LLM can't be reached for is marked failed, not done with the error text."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(max_retries=0), global_handler=False)
+
+    async def astream(prompt, on_usage):
+        raise ConnectionError("connection refused")
+        yield
+
+    diagnoser.providers[0].astream = astream
+    middleware = DiagnosisMiddleware(app, diagnoser, path_prefix="/diagnoses")
+
+    async with _client(middleware) as client:
+        url = (await client.get("/boom")).json()["diagnosis_url"]
+        assert await middleware.drain(1)
+        failed = (await client.get(url)).json()
+        events = (await client.get(url, headers={"accept": "text/event-stream"})).text
+
+    assert failed["status"] == "failed" and failed["reason"] == "connection refused"
+    assert failed["diagnosis"] is None and failed["partial"] is None
+    assert events == "event: failed\ndata: connection refused\n\n"
+    assert len(diagnoser.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_fastapi_lifespan():
+    """Test the middleware added to a FastAPI app, with its lifespan."""
+    fastapi = pytest.importorskip("fastapi")
+    diagnoser = _diagnoser()
+    api = fastapi.FastAPI()
+    api.add_middleware(DiagnosisMiddleware, diagnoser=diagnoser, path_prefix="/_errors")
+
+    @api.get("/boom")
+    async def boom():
+        raise KeyError("user_17")
+
+    async with api.router.lifespan_context(api):
+        async with _client(api) as client:
+            body = (await client.get("/boom")).json()
+            assert body["diagnosis_url"].startswith("/_errors/")
+            await asyncio.sleep(0.01)
+            assert (await client.get(body["diagnosis_url"])).json()["diagnosis"] == "Check the user exists."
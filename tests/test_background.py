@@ -0,0 +1,158 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.background import DiagnosisJob, DiagnosisQueue, FileSink, summarize_locals
+from unittest.mock import MagicMock
+import json
+import threading
+
+
+def _background_diagnoser(sink, **overrides):
+    settings = Settings(background=True, cache_enabled=False, **overrides)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False, sink=sink)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(message=MagicMock(content="Background diagnosis"))
+    return diagnoser
+
+
+def test_catch_does_not_wait_for_diagnosis():
+    """Test that the decorator re-raises before the diagnosis is made."""
+    delivered = []
+    diagnoser = _background_diagnoser(lambda job, diagnosis: delivered.append((job, diagnosis)))
+    release = threading.Event()
+    diagnoser.sync_client.chat.side_effect = lambda **kwargs: (
+        release.wait(), MagicMock(message=MagicMock(content="Background diagnosis"))
+    )[1]
+
+    @diagnoser.catch
+    def failing_function():
+        return 1/0
+
+    with pytest.raises(ZeroDivisionError):
+        failing_function()
+    assert delivered == []
+
+    release.set()
+    assert diagnoser.background.flush(timeout=5)
+    job, diagnosis = delivered[0]
+    assert job.summary == "ZeroDivisionError: division by zero"
+    assert "Background diagnosis" in diagnosis
+    assert diagnoser.background.stats()["completed"] == 1
+
+
+def test_failed_diagnosis_reaches_sink():
+    """Test that a job whose diagnosis fails is still delivered, with the failure."""
+    delivered = []
+    diagnoser = _background_diagnoser(lambda job, diagnosis: delivered.append((job, diagnosis)), max_retries=0)
+    diagnoser.sync_client.chat.side_effect = ConnectionError("connection refused")
+
+    try:
+        {}["user_17"]
+    except KeyError as e:
+        assert diagnoser.submit(e)
+    assert diagnoser.background.flush(timeout=5)
+
+    job, diagnosis = delivered[0]
+    assert diagnosis == "Failed to contact LLM for diagnosis. Error: connection refused\n\nKeyError: 'user_17'"
+    assert diagnoser.background.stats()["failed"] == 1
+
+
+@pytest.mark.parametrize("include_locals", [True, False])
+def test_job_prompt_includes_locals(include_locals):
+    """Test that the snapshot includes a summary of the failing frame's locals only when enabled."""
+    diagnoser = _background_diagnoser(lambda job, diagnosis: None, include_locals=include_locals)
+    captured = []
+    diagnoser.background.submit = captured.append
+
+    def failing_function(user_id):
+        return {}[user_id]
+
+    try:
+        failing_function(42)
+    except KeyError as e:
+        diagnoser.submit(e)
+
+    assert ("user_id = 42" in captured[0].prompt) is include_locals
+
+
+def test_summarize_locals_truncates_reprs():
+    """Test that long local variable reprs are truncated."""
+    def failing_function():
+        payload = "x" * 500  # noqa: F841
+        raise ValueError("bad payload")
+
+    try:
+        failing_function()
+    except ValueError as e:
+        summary = summarize_locals(e.__traceback__, max_repr=20)
+
+    assert summary == "  payload = 'xxxxxxxxxxxxxxxx..."
+
+
+def test_summarize_locals_bounds_containers():
+    """Test that large containers are shortened while formatted rather than rendered in full."""
+    def failing_function():
+        rows = [{"id": n} for n in range(100_000)]  # noqa: F841
+        raise ValueError("bad rows")
+
+    try:
+        failing_function()
+    except ValueError as e:
+        summary = summarize_locals(e.__traceback__, max_repr=80)
+
+    assert summary == "  rows = [{'id': 0}, {'id': 1}, {'id': 2}, {'id': 3}, {'id': 4}, {'id': 5}, ...]"
+
+
+@pytest.mark.parametrize("policy,expected", [("drop_new", ["a", "b"]), ("drop_old", ["b", "c"])])
+def test_drop_policy(policy, expected):
+    """Test which jobs survive a full queue under each drop policy."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def diagnose_prompt(key, build_prompt, similarity_text=None):
+        if key == "blocker":
+            started.set()
+            release.wait()
+        return build_prompt()
+
+    diagnoser = MagicMock()
+    diagnoser._diagnose_prompt.side_effect = diagnose_prompt
+    diagnoser._format_diagnosis.side_effect = lambda diagnosis, formatted: diagnosis
+    delivered = []
+    background = DiagnosisQueue(diagnoser, sink=lambda job, diagnosis: delivered.append(diagnosis),
+                                maxsize=2, workers=1, drop_policy=policy)
+
+    background.submit(DiagnosisJob(key="blocker", summary="", prompt="blocker"))
+    started.wait(timeout=5)
+    for prompt in ("a", "b", "c"):
+        background.submit(DiagnosisJob(key=prompt, summary=prompt, prompt=prompt))
+    release.set()
+
+    assert background.flush(timeout=5)
+    assert delivered == ["blocker"] + expected
+    assert background.stats()["dropped"] == 1
+
+
+def test_flush_respects_deadline():
+    """Test that flushing gives up once the deadline passes."""
+    release = threading.Event()
+    diagnoser = MagicMock()
+    diagnoser._diagnose_prompt.side_effect = lambda key, build_prompt, similarity_text=None: release.wait()
+    background = DiagnosisQueue(diagnoser, sink=lambda job, diagnosis: None, workers=1)
+
+    background.submit(DiagnosisJob(key="a", summary="a", prompt="a"))
+
+    assert background.flush(timeout=0.05) is False
+    release.set()
+    assert background.flush(timeout=5) is True
+
+
+def test_file_sink(tmp_path):
+    """Test that the file sink appends one JSON record per diagnosis."""
+    path = tmp_path / "diagnoses.jsonl"
+    sink = FileSink(str(path))
+
+    sink(DiagnosisJob(key="k", summary="ValueError: bad", prompt="p"), "diagnosis")
+
+    record = json.loads(path.read_text())
+    assert record["exception"] == "ValueError: bad"
+    assert record["diagnosis"] == "diagnosis"
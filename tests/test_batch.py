@@ -0,0 +1,113 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.prompts import build_batch_prompt, estimate_tokens, pack_batches, parse_batch_response
+from unittest.mock import MagicMock
+import re
+
+
+def _raise(exc_type, message):
+    try:
+        raise exc_type(message)
+    except exc_type as e:
+        return e
+
+
+def _errors():
+    return [
+        _raise(KeyError, "a"),
+        _raise(ValueError, "bad value 1"),
+        _raise(ValueError, "bad value 2"),  # same fingerprint as the previous error
+        _raise(TypeError, "wrong type"),
+    ]
+
+
+def _reply(*sections):
+    return MagicMock(message=MagicMock(content="\n\n".join(
+        f"### ERROR {i}\n{text}" for i, text in sections
+    )))
+
+
+def test_parse_batch_response():
+    """Test that answers are matched to items by number and missing ones are None."""
+    text = "Intro\n### ERROR 2\nSecond answer\n\n### ERROR 1:\nFirst answer\n"
+    assert parse_batch_response(text, 3) == ["First answer", "Second answer", None]
+
+
+def test_pack_batches_respects_limits():
+    """Test that batches stay within the token budget and item limit."""
+    items = [(str(i), "x" * 400) for i in range(5)]
+    budget = estimate_tokens(build_batch_prompt([])) + 250
+    assert [len(batch) for batch in pack_batches(items, max_tokens=budget, max_items=10)] == [2, 2, 1]
+    assert [len(batch) for batch in pack_batches(items, max_tokens=100000, max_items=3)] == [3, 2]
+
+
+def test_diagnose_many_dedupes_and_keeps_order():
+    """Test that duplicate fingerprints share one answer and results follow input order."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = _reply((1, "key"), (2, "value"), (3, "type"))
+
+    results = diagnoser.diagnose_many(_errors(), formatted=False)
+
+    assert results == ["key", "value", "value", "type"]
+    assert diagnoser.sync_client.chat.call_count == 1
+    prompt = diagnoser.sync_client.chat.call_args.kwargs["messages"][0]["content"]
+    assert re.findall(r"^### ERROR (\d+)$", prompt, re.MULTILINE) == ["1", "2", "3"]
+
+
+def test_diagnose_many_scales_token_limit():
+    """Test that a batch gets the token limit once per error, and single diagnoses once."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False, max_tokens=100), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.side_effect = [
+        _reply((1, "key"), (2, "value")),
+        MagicMock(message=MagicMock(content="type on its own")),
+    ]
+
+    diagnoser.diagnose_many(_errors(), formatted=False)
+
+    limits = [call.kwargs["options"]["num_predict"] for call in diagnoser.sync_client.chat.call_args_list]
+    assert limits == [300, 100]
+
+
+def test_diagnose_many_falls_back_for_missing_answers():
+    """Test that an item the model skipped is diagnosed on its own."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.side_effect = [
+        _reply((1, "key"), (2, "value")),
+        MagicMock(message=MagicMock(content="type on its own")),
+    ]
+
+    results = diagnoser.diagnose_many(_errors(), formatted=False)
+
+    assert results == ["key", "value", "value", "type on its own"]
+
+
+def test_diagnose_many_runs_batches_concurrently():
+    """Test that several batches are each sent as their own request."""
+    settings = Settings(cache_enabled=False, batch_max_items=1, batch_concurrency=2)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(message=MagicMock(content="single"))
+
+    assert diagnoser.diagnose_many(_errors(), formatted=False) == ["single"] * 4
+    assert diagnoser.sync_client.chat.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_adiagnose_many_uses_cache():
+    """Test that cached errors are answered without being sent again."""
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    diagnoser.async_client = MagicMock()
+
+    async def chat(**kwargs):
+        return _reply((1, "key"), (2, "value"), (3, "type"))
+
+    diagnoser.async_client.chat = MagicMock(side_effect=chat)
+
+    first = await diagnoser.adiagnose_many(_errors(), formatted=False)
+    second = await diagnoser.adiagnose_many(_errors(), formatted=False)
+
+    assert first == second == ["key", "value", "value", "type"]
+    assert diagnoser.async_client.chat.call_count == 1
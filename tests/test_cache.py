@@ -0,0 +1,98 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser
+from llm_catcher.cache import DiagnosisCache, make_cache_key
+from llm_catcher.fingerprint import fingerprint_exception, normalize_message
+from unittest.mock import MagicMock, patch
+
+
+def _raise_key_error(key):
+    try:
+        {}[key]
+    except KeyError as e:
+        return e
+
+
+def test_normalize_message_strips_volatile_parts():
+    """Test that addresses, ids and numbers are removed from messages."""
+    message = "object at 0x7f3a2b1c not found for user 1234 (request 9f8e7d6c-1a2b-3c4d-5e6f-0123456789ab)"
+    assert normalize_message(message) == "object at <addr> not found for user <n> (request <uuid>)"
+
+
+def test_fingerprint_ignores_volatile_values():
+    """Test that the same error with different values shares a fingerprint."""
+    first = _raise_key_error("user_1")
+    second = _raise_key_error("user_2")
+    assert fingerprint_exception(first) == fingerprint_exception(second)
+
+
+def test_fingerprint_differs_by_type():
+    """Test that different exception types get different fingerprints."""
+    try:
+        1/0
+    except ZeroDivisionError as e:
+        zero_division = e
+    assert fingerprint_exception(zero_division) != fingerprint_exception(_raise_key_error("a"))
+
+
+def test_cache_key_covers_provider_model_and_prompt_version():
+    """Test that the cache key changes with provider, model and prompt version."""
+    keys = {
+        make_cache_key("fp", "ollama", "qwen2.5-coder", 1),
+        make_cache_key("fp", "openai", "qwen2.5-coder", 1),
+        make_cache_key("fp", "ollama", "llama3", 1),
+        make_cache_key("fp", "ollama", "qwen2.5-coder", 2),
+    }
+    assert len(keys) == 4
+
+
+def test_cache_lru_eviction():
+    """Test that the least recently used entry is evicted when full."""
+    cache = DiagnosisCache(max_size=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats() == {"size": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_cache_ttl_expiry():
+    """Test that entries expire after the TTL."""
+    cache = DiagnosisCache(max_size=2, ttl=10)
+    with patch("llm_catcher.cache.time.monotonic", return_value=100.0):
+        cache.set("a", "A")
+    with patch("llm_catcher.cache.time.monotonic", return_value=105.0):
+        assert cache.get("a") == "A"
+    with patch("llm_catcher.cache.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_diagnose_uses_cache_for_repeated_errors():
+    """Test that a repeated error is served from the cache without an LLM call."""
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(
+        message=MagicMock(content="Test diagnosis")
+    )
+
+    first = diagnoser.diagnose(_raise_key_error("user_1"), formatted=False)
+    second = diagnoser.diagnose(_raise_key_error("user_2"), formatted=False)
+
+    assert first == second == "Test diagnosis"
+    assert diagnoser.sync_client.chat.call_count == 1
+    assert diagnoser.cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_diagnose_does_not_cache_failures():
+    """Test that failed LLM calls are not cached."""
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat.side_effect = ConnectionError("down")
+
+    result = await diagnoser.async_diagnose(_raise_key_error("a"))
+
+    assert result.startswith("Failed to contact LLM")
+    assert len(diagnoser.cache) == 0
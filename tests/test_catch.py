@@ -0,0 +1,181 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.compaction import compact_traceback
+from llm_catcher.fingerprint import fingerprint_exception
+from functools import partial
+import inspect
+import traceback
+
+
+@pytest.fixture
+def diagnoser():
+    """A diagnoser that records what it reports instead of calling an LLM."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    diagnoser.reported = []
+    diagnoser.diagnose = lambda error, formatted=True: diagnoser.reported.append(error) or "diagnosis"
+
+    async def async_diagnose(error, formatted=True):
+        diagnoser.reported.append(error)
+        return "diagnosis"
+
+    diagnoser.async_diagnose = async_diagnose
+    return diagnoser
+
+
+def test_wrapper_keeps_signature_and_defaults(diagnoser):
+    """Test that the generated wrapper accepts exactly what the function accepts."""
+    @diagnoser.catch
+    def handler(a, b=2, /, c=3, *args, d, e=5, **kwargs):
+        return a, b, c, args, d, e, kwargs
+
+    assert handler(1, d=4) == (1, 2, 3, (), 4, 5, {})
+    assert handler(1, 9, 8, 7, d=4, e=6, f=0) == (1, 9, 8, (7,), 4, 6, {"f": 0})
+    assert str(inspect.signature(handler)) == "(a, b=2, /, c=3, *args, d, e=5, **kwargs)"
+    assert handler.__name__ == "handler"
+    with pytest.raises(TypeError):
+        handler(1)
+    assert diagnoser.reported == []
+
+
+def test_methods(diagnoser):
+    """Test that methods, classmethods and staticmethods are wrapped."""
+    class Service:
+        @diagnoser.catch
+        def method(self, x):
+            return 1 / x
+
+        @diagnoser.catch
+        @classmethod
+        def create(cls, x):
+            return cls, 1 / x
+
+        @diagnoser.catch
+        @staticmethod
+        def helper(x):
+            return 1 / x
+
+    service = Service()
+    assert service.method(2) == 0.5
+    assert Service.create(2) == (Service, 0.5)
+    assert Service.helper(4) == 0.25
+    for call in (lambda: service.method(0), lambda: Service.create(0), lambda: Service.helper(0)):
+        with pytest.raises(ZeroDivisionError):
+            call()
+    assert len(diagnoser.reported) == 3
+
+
+def test_generator(diagnoser):
+    """Test that generators keep working with send and report errors raised while iterating."""
+    @diagnoser.catch
+    def accumulate():
+        total = 0
+        while True:
+            value = yield total
+            if value is None:
+                raise ValueError("no value")
+            total += value
+
+    generator = accumulate()
+    assert next(generator) == 0
+    assert generator.send(5) == 5
+    with pytest.raises(ValueError):
+        next(generator)
+    assert [str(e) for e in diagnoser.reported] == ["no value"]
+
+
+@pytest.mark.asyncio
+async def test_async_function_and_generator(diagnoser):
+    """Test that coroutine functions and async generators are wrapped."""
+    @diagnoser.catch
+    async def fetch(x):
+        return 1 / x
+
+    @diagnoser.catch
+    async def stream(n):
+        for i in range(n):
+            received = yield i
+            if received == "stop":
+                raise RuntimeError("stopped")
+
+    assert await fetch(2) == 0.5
+    with pytest.raises(ZeroDivisionError):
+        await fetch(0)
+
+    assert [i async for i in stream(3)] == [0, 1, 2]
+    generator = stream(3)
+    assert await generator.__anext__() == 0
+    with pytest.raises(RuntimeError):
+        await generator.asend("stop")
+    assert [type(e) for e in diagnoser.reported] == [ZeroDivisionError, RuntimeError]
+
+
+def test_wrapper_frame_is_left_out(diagnoser):
+    """Test that the generated wrapper's frame is named, and left out of prompts and fingerprints."""
+    def lookup(key):
+        return {}[key]
+
+    errors = []
+    for function in (diagnoser.catch(lookup), lookup):
+        try:
+            function("user_17")
+        except KeyError as e:
+            errors.append(e)
+
+    caught, plain = errors
+    assert [frame.filename for frame in traceback.extract_tb(caught.__traceback__)][1] == "<llm_catcher.catch>"
+    assert "<llm_catcher.catch>" not in compact_traceback(caught)
+    assert fingerprint_exception(caught) == fingerprint_exception(plain)
+
+
+def test_nested_catch_reports_once(diagnoser):
+    """Test that an exception passing through several wrappers is diagnosed once."""
+    @diagnoser.catch
+    def inner():
+        raise KeyError("x")
+
+    @diagnoser.catch
+    def outer():
+        inner()
+
+    with pytest.raises(KeyError):
+        outer()
+    assert len(diagnoser.reported) == 1
+
+
+def test_callable_objects_use_generic_wrapper(diagnoser):
+    """Test that callables without a copyable signature are still wrapped."""
+    divide = diagnoser.catch(partial(lambda a, b: a / b, 1))
+
+    assert divide(2) == 0.5
+    with pytest.raises(ZeroDivisionError):
+        divide(0)
+    assert len(diagnoser.reported) == 1
+
+
+def test_guard(diagnoser):
+    """Test that guard diagnoses and re-raises errors from its block."""
+    with diagnoser.guard():
+        pass
+    with pytest.raises(IndexError):
+        with diagnoser.guard():
+            [][0]
+    assert [type(e) for e in diagnoser.reported] == [IndexError]
+
+
+@pytest.mark.asyncio
+async def test_async_guard(diagnoser):
+    """Test that guard works with async with."""
+    with pytest.raises(IndexError):
+        async with diagnoser.guard():
+            [][0]
+    assert [type(e) for e in diagnoser.reported] == [IndexError]
+
+
+def test_decorated_call_is_cheap(diagnoser):
+    """Test that the success path of a decorated function avoids the *args/**kwargs wrapper."""
+    def handler(request, *, user=None):
+        return request
+
+    wrapped = diagnoser.catch(handler)
+    assert "args" not in inspect.getclosurevars(wrapped).nonlocals
+    assert wrapped.__code__.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS) == 0
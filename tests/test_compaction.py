@@ -0,0 +1,81 @@
+from llm_catcher import ExceptionSnapshot, LLMExceptionDiagnoser, Settings
+from llm_catcher.compaction import compact_snapshot, compact_traceback, is_library_path
+from llm_catcher.prompts import estimate_tokens
+import json
+import os
+
+
+def _recurse(n):
+    if n == 0:
+        json.loads("{not json")
+    return _recurse(n - 1)
+
+
+def _chained_error():
+    try:
+        try:
+            _recurse(50)
+        except ValueError as e:
+            raise RuntimeError("could not load config " + "x" * 1000) from e
+    except RuntimeError as e:
+        return e
+
+
+def test_is_library_path():
+    """Test that stdlib and site-packages frames are recognised as library code."""
+    assert is_library_path(json.__file__)
+    assert is_library_path("/usr/lib/python3/site-packages/starlette/routing.py")
+    assert not is_library_path(__file__)
+    assert not is_library_path("<stdin>")
+
+
+def test_compaction_collapses_library_and_recursive_frames():
+    """Test that library frames and recursion are collapsed but the raising frame is kept."""
+    text = compact_traceback(_chained_error())
+
+    assert "library frame(s) omitted: json" in text
+    assert "[Previous 1 frame(s) repeated" in text
+    assert text.count("in _recurse") == 2
+    assert os.path.basename(json.decoder.__file__) in text
+    assert "The above exception was the direct cause of the following exception" in text
+    assert "characters truncated]" in text
+
+
+def test_compaction_caps_chain_depth():
+    """Test that only the newest chained exceptions are kept."""
+    text = compact_traceback(_chained_error(), max_chain_depth=1)
+
+    assert "JSONDecodeError" not in text
+    assert "earlier chained exceptions omitted" in text
+    assert "RuntimeError" in text
+
+
+def test_compaction_always_keeps_main_exception():
+    """Test that a chain depth of zero still keeps the exception itself, dropping only its causes."""
+    error = _chained_error()
+    text = compact_traceback(error, max_chain_depth=0)
+
+    assert "RuntimeError" in text and "JSONDecodeError" not in text
+    assert compact_snapshot(ExceptionSnapshot.capture(error), max_chain_depth=0) == text
+
+
+def test_compaction_enforces_token_budget():
+    """Test that the compacted traceback fits the token budget and keeps the innermost part."""
+    text = compact_traceback(_chained_error(), collapse_library=False, max_tokens=100)
+
+    assert estimate_tokens(text) <= 120
+    assert "characters truncated ...]" in text
+    assert text.endswith("characters truncated]\n")
+
+
+def test_diagnoser_records_tokens_saved():
+    """Test that the diagnoser reports how many tokens compaction saved."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(max_prompt_tokens=200), global_handler=False)
+
+    prompt = diagnoser._get_prompt(_chained_error())
+
+    stats = diagnoser.compaction.stats()
+    assert stats["prompts"] == 1
+    assert stats["tokens_saved"] > 0
+    assert stats["tokens_after"] < stats["tokens_before"]
+    assert "Stack Trace:" in prompt
@@ -0,0 +1,62 @@
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.forwarding import parse_address
+from unittest.mock import MagicMock
+import time
+
+
+def _error(message):
+    try:
+        raise ValueError(message)
+    except ValueError as e:
+        return e
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_parse_address():
+    """Test that host:port addresses are TCP and everything else is a socket path."""
+    assert parse_address("127.0.0.1:9000") == ("127.0.0.1", 9000)
+    assert parse_address("/tmp/llm_catcher.sock") == "/tmp/llm_catcher.sock"
+
+
+def test_workers_forward_to_one_diagnosing_process(tmp_path):
+    """Test that forwarded snapshots are diagnosed by the serving diagnoser only."""
+    delivered = []
+    server_diagnoser = LLMExceptionDiagnoser(
+        settings=Settings(cache_enabled=True),
+        global_handler=False,
+        sink=lambda job, diagnosis: delivered.append((job, diagnosis)),
+    )
+    server_diagnoser.sync_client = MagicMock()
+    server_diagnoser.sync_client.chat.return_value = MagicMock(message=MagicMock(content="Central diagnosis"))
+    server = server_diagnoser.serve(str(tmp_path / "diagnoser.sock"))
+    try:
+        workers = [
+            LLMExceptionDiagnoser(settings=Settings(forward_address=server.address), global_handler=False)
+            for _ in range(2)
+        ]
+        for worker in workers:
+            assert worker.submit(_error("bad input"))
+
+        _wait_for(lambda: len(delivered) == 2)
+        assert [job.summary for job, _ in delivered] == ["ValueError: bad input"] * 2
+        assert "Central diagnosis" in delivered[0][1]
+        # The second worker's duplicate is answered from the diagnosing process's cache
+        assert server_diagnoser.sync_client.chat.call_count == 1
+        assert all(worker.providers[0]._sync_client is None for worker in workers)
+        assert server.stats()["received"] == 2
+    finally:
+        server.close()
+
+
+def test_forwarding_without_server_drops():
+    """Test that a snapshot that can't be delivered is dropped without raising."""
+    worker = LLMExceptionDiagnoser(settings=Settings(forward_address="/nonexistent/llm.sock"), global_handler=False)
+
+    assert not worker.submit(_error("bad input"))
+    assert worker.forwarder.stats() == {"sent": 0, "dropped": 1}
@@ -0,0 +1,94 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import asyncio
+import sys
+import threading
+
+
+@pytest.fixture
+def diagnoser(monkeypatch):
+    """A diagnoser with its global handlers installed, restored after the test."""
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    delivered = []
+    diagnoser = LLMExceptionDiagnoser(
+        settings=Settings(cache_enabled=False),
+        global_handler=True,
+        sink=lambda job, diagnosis: delivered.append((job, diagnosis)),
+    )
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(message=MagicMock(content="Hook diagnosis"))
+    diagnoser.delivered = delivered
+    return diagnoser
+
+
+def _summaries(diagnoser):
+    assert diagnoser._hook_queue.flush(timeout=5)
+    return [job.summary for job, _ in diagnoser.delivered]
+
+
+def test_thread_exceptions_are_diagnosed(diagnoser):
+    """Test that an exception escaping a worker thread is diagnosed on the shared queue."""
+    thread = threading.Thread(target=lambda: {}["missing"])
+    thread.start()
+    thread.join()
+
+    assert _summaries(diagnoser) == ["KeyError: 'missing'"]
+    assert "Hook diagnosis" in diagnoser.delivered[0][1]
+
+
+@pytest.mark.parametrize("include_locals", [False, True])
+def test_thread_locals_are_opt_in(diagnoser, include_locals):
+    """Test that a thread's local variables reach the prompt only when include_locals is set."""
+    diagnoser.settings.include_locals = include_locals
+    prompts = []
+    diagnoser._hook_queue = None
+    diagnoser._dispatch_queue().submit = lambda job: prompts.append(job.prompt) or True
+
+    def worker():
+        api_token = "secret-token"  # noqa: F841
+        raise PermissionError("denied")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert ("secret-token" in prompts[0]) is include_locals
+
+
+def test_watched_futures_are_diagnosed(diagnoser):
+    """Test that failed executor futures are diagnosed and successful ones aren't."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        diagnoser.watch(executor.submit(lambda: 1/0))
+        assert diagnoser.watch(executor.submit(lambda: 42)).result() == 42
+
+    assert _summaries(diagnoser) == ["ZeroDivisionError: division by zero"]
+
+
+def test_event_loop_exceptions_are_diagnosed(diagnoser):
+    """Test that exceptions reported to the loop's handler are diagnosed."""
+    loop = asyncio.new_event_loop()
+    try:
+        diagnoser.install_loop_handler(loop)
+        loop.call_exception_handler({"message": "Task exception was never retrieved",
+                                     "exception": ValueError("lost")})
+    finally:
+        loop.close()
+
+    assert _summaries(diagnoser) == ["ValueError: lost"]
+
+
+@pytest.mark.asyncio
+async def test_watched_tasks_are_diagnosed(diagnoser):
+    """Test that failed asyncio tasks are diagnosed when watched."""
+    async def fail():
+        raise RuntimeError("task failed")
+
+    task = diagnoser.watch(asyncio.ensure_future(fail()))
+    with pytest.raises(RuntimeError):
+        await task
+    await asyncio.sleep(0)
+
+    assert _summaries(diagnoser) == ["RuntimeError: task failed"]
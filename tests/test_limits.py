@@ -0,0 +1,116 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.limits import DailyBudget, DiagnosisSkipped, FingerprintSampler, RateLimiter, TokenBucket, get_bucket
+from unittest.mock import MagicMock, patch
+import asyncio
+
+
+def _error(message="boom"):
+    try:
+        raise RuntimeError(message)
+    except RuntimeError as e:
+        return e
+
+
+def test_token_bucket_refills_over_time():
+    """Test that the bucket allows a burst and then refills at its rate."""
+    with patch("llm_catcher.limits.time.monotonic", return_value=0.0):
+        bucket = TokenBucket(rate=1.0, burst=2)
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+    with patch("llm_catcher.limits.time.monotonic", return_value=1.0):
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+
+
+def test_sampler_first_n_then_one_in_k():
+    """Test that the sampler admits the first N occurrences and then one in K."""
+    sampler = FingerprintSampler(first_n=2, one_in=3)
+    decisions = [sampler.sample("key") for _ in range(8)]
+    assert decisions == [True, True, False, False, True, False, False, True]
+    assert sampler.sample("other")
+
+
+def test_daily_budget_resets_each_day():
+    """Test that the budget is exhausted by usage and resets on a new day."""
+    budget = DailyBudget(max_cost=0.01, cost_per_1k_tokens=0.005)
+    budget.record(2000)
+    assert budget.exhausted()
+    with patch.object(DailyBudget, "_today", return_value=budget._day.replace(year=budget._day.year + 1)):
+        assert not budget.exhausted()
+        assert budget.tokens == 0
+
+
+def test_concurrency_limit_does_not_block():
+    """Test that a full concurrency limit rejects immediately."""
+    limiter = RateLimiter(max_concurrent=1)
+    limiter.acquire("a")
+    with pytest.raises(DiagnosisSkipped, match="too many concurrent"):
+        limiter.acquire("b")
+    limiter.release()
+    limiter.acquire("b")
+    assert limiter.stats()["skipped"] == {"too many concurrent diagnoses": 1}
+
+
+def test_rate_limited_diagnosis_falls_back_to_traceback():
+    """Test that a rate-limited diagnosis returns the raw traceback instead of calling the LLM."""
+    settings = Settings(cache_enabled=False, rate_limit_per_minute=60, rate_limit_burst=1, provider="ollama")
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(message=MagicMock(content="Test diagnosis"))
+
+    assert "Test diagnosis" in diagnoser.diagnose(_error())
+    fallback = diagnoser.diagnose(_error())
+
+    assert fallback.startswith("LLM diagnosis skipped (rate limited)")
+    assert "RuntimeError: boom" in fallback
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+def test_buckets_are_shared_per_limit():
+    """Test that diagnosers with different limits for a provider keep separate buckets."""
+    strict = get_bucket("ollama", 60, 1)
+    assert strict.try_acquire()
+
+    assert get_bucket("ollama", 600, 10) is not strict
+    assert get_bucket("ollama", 60, 1) is strict
+    assert not strict.try_acquire()
+
+
+def test_budget_tracks_provider_usage():
+    """Test that token usage reported by the provider counts against the budget."""
+    settings = Settings(cache_enabled=False, daily_token_budget=100)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(
+        message=MagicMock(content="Test diagnosis"), prompt_eval_count=80, eval_count=30
+    )
+
+    diagnoser.diagnose(_error())
+    fallback = diagnoser.diagnose(_error())
+
+    assert fallback.startswith("LLM diagnosis skipped (daily budget exhausted)")
+    assert diagnoser.limiter.stats()["tokens_today"] == 110
+
+
+@pytest.mark.asyncio
+async def test_async_concurrency_limit():
+    """Test that concurrent async diagnoses beyond the limit get the fallback."""
+    settings = Settings(cache_enabled=False, max_concurrent_requests=1)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+
+    async def chat(**kwargs):
+        await asyncio.sleep(0.05)
+        return MagicMock(message=MagicMock(content="Test diagnosis"))
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = chat
+
+    results = await asyncio.gather(
+        diagnoser.async_diagnose(_error("first"), formatted=False),
+        diagnoser.async_diagnose(_error("second"), formatted=False),
+    )
+
+    assert results[0] == "Test diagnosis"
+    assert results[1].startswith("LLM diagnosis skipped (too many concurrent diagnoses)")
@@ -0,0 +1,174 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.cli import main
+from llm_catcher.fingerprint import fingerprint_exception, fingerprint_traceback_text
+from llm_catcher.logscan import LogScanner, extract_tracebacks, read_lines
+from unittest.mock import MagicMock
+import gzip
+import json
+import traceback
+
+LOG = """\
+2024-05-01 12:00:00 INFO app: started
+2024-05-01 12:00:01 ERROR app: Traceback (most recent call last):
+  File "/srv/app/views.py", line 10, in get_user
+    return users[user_id]
+KeyError: 'user_17'
+2024-05-01 12:00:02 INFO app: still running
+2024-05-01 12:00:03 ERROR app: Traceback (most recent call last):
+  File "/srv/app/db.py", line 5, in connect
+    raise OSError("refused")
+OSError: refused
+
+The above exception was the direct cause of the following exception:
+
+Traceback (most recent call last):
+  File "/srv/app/views.py", line 20, in handler
+    connect()
+app.errors.DatabaseError: could not connect
+  after 3 attempts
+2024-05-01 12:00:04 ERROR app: Traceback (most recent call last):
+  File "/srv/app/views.py", line 10, in get_user
+    return users[user_id]
+KeyError: 'user_42'
+"""
+
+
+def _lines(text):
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        offset += len(line.encode())
+        yield offset, line.rstrip("\n")
+
+
+def _diagnoser():
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    diagnoser.providers[0].complete = MagicMock(return_value=("Check the key exists.", (10, 5)))
+    return diagnoser
+
+
+def test_extract_tracebacks():
+    """Test that tracebacks are cut out of log records, with chains and multi-line messages."""
+    found = list(extract_tracebacks(_lines(LOG)))
+
+    assert [t.line for t in found] == [2, 7, 19]
+    assert found[0].text == ('Traceback (most recent call last):\n  File "/srv/app/views.py", line 10, in get_user\n'
+                             "    return users[user_id]\nKeyError: 'user_17'\n")
+    assert "The above exception was the direct cause" in found[1].text
+    assert found[1].text.endswith("app.errors.DatabaseError: could not connect\n  after 3 attempts\n")
+    assert found[2].end == len(LOG.encode())
+
+
+def test_incomplete_traceback_is_skipped():
+    """Test that a traceback cut off before its exception line isn't reported."""
+    log = 'Traceback (most recent call last):\n  File "a.py", line 1, in f\nINFO next record\n'
+    assert list(extract_tracebacks(_lines(log))) == []
+
+
+def test_text_fingerprint_matches_live_exception():
+    """Test that a logged traceback gets the fingerprint of the exception it was printed from."""
+    try:
+        {}["key"]
+    except KeyError as e:
+        error = e
+    text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    assert fingerprint_traceback_text(text) == fingerprint_exception(error)
+
+
+def test_text_fingerprint_matches_module_exception():
+    """Test that exception types printed with their module, like json's decode error, fingerprint the same."""
+    try:
+        json.loads("{")
+    except json.JSONDecodeError as e:
+        error = e
+    text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    assert "json.decoder.JSONDecodeError: " in text
+    assert fingerprint_traceback_text(text) == fingerprint_exception(error)
+
+
+@pytest.mark.parametrize("mmap_threshold", [0, 1 << 30])
+def test_read_lines_resumes_at_offset(tmp_path, mmap_threshold):
+    """Test reading plain (buffered and memory-mapped) files from an offset."""
+    path = tmp_path / "app.log"
+    path.write_text("first\nsecond\nthird\n")
+
+    assert list(read_lines(str(path), mmap_threshold=mmap_threshold)) == [(6, "first"), (13, "second"),
+                                                                          (19, "third")]
+    assert list(read_lines(str(path), 6, mmap_threshold=mmap_threshold)) == [(13, "second"), (19, "third")]
+
+
+def test_scan_groups_and_diagnoses_once(tmp_path):
+    """Test that repeats are grouped and each group is diagnosed once, gzip files included."""
+    plain = tmp_path / "app.log"
+    plain.write_text(LOG)
+    with gzip.open(tmp_path / "app.log.1.gz", "wt") as f:
+        f.write(LOG)
+    diagnoser = _diagnoser()
+
+    groups = LogScanner(diagnoser, workers=2).scan([str(plain), str(tmp_path / "app.log.1.gz")])
+
+    assert [(g.count, g.summary) for g in groups] == [
+        (4, "KeyError: 'user_17'"),
+        (2, "app.errors.DatabaseError: could not connect"),
+    ]
+    assert groups[0].first_seen == f"{plain}:2"
+    assert groups[0].last_seen == f"{tmp_path / 'app.log.1.gz'}:19"
+    assert all(g.diagnosis == "Check the key exists." for g in groups)
+    assert diagnoser.providers[0].complete.call_count == 2
+
+
+def test_checkpoint_resumes(tmp_path):
+    """Test that a re-run only reads what was appended and doesn't diagnose known groups again."""
+    log = tmp_path / "app.log"
+    log.write_text(LOG)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    diagnoser = _diagnoser()
+    LogScanner(diagnoser, checkpoint_path=checkpoint).scan([str(log)])
+
+    with open(log, "a") as f:
+        f.write("2024-05-01 12:00:05 ERROR app: Traceback (most recent call last):\n"
+                '  File "/srv/app/views.py", line 10, in get_user\n'
+                "    return users[user_id]\n"
+                "KeyError: 'user_99'\n"
+                "2024-05-01 12:00:06 ERROR app: Traceback (most recent call last):\n"
+                '  File "/srv/app/jobs.py", line 3, in run\n')
+    scanner = LogScanner(diagnoser, checkpoint_path=checkpoint)
+    groups = scanner.scan([str(log)])
+
+    assert [g.count for g in groups] == [3, 1]
+    assert groups[0].last_seen == f"{log}:23"
+    assert diagnoser.providers[0].complete.call_count == 2
+    # The unfinished traceback at the end is read again next time
+    assert scanner.files[str(log)]["line"] == 27
+
+
+def test_failed_groups_are_retried(tmp_path):
+    """Test that groups whose diagnosis failed are diagnosed on the next run."""
+    log = tmp_path / "app.log"
+    log.write_text(LOG)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    diagnoser = _diagnoser()
+    diagnoser.providers[0].complete.side_effect = ValueError("down")
+    groups = LogScanner(diagnoser, checkpoint_path=checkpoint).scan([str(log)])
+    assert all(g.diagnosis is None and "down" in g.error for g in groups)
+
+    diagnoser.providers[0].complete.side_effect = None
+    groups = LogScanner(diagnoser, checkpoint_path=checkpoint).scan([str(log)])
+    assert all(g.diagnosis == "Check the key exists." and g.error is None for g in groups)
+    assert [g.count for g in groups] == [2, 1]
+
+
+def test_cli_writes_reports(tmp_path, monkeypatch, capsys):
+    """Test the console entry point without LLM calls, in both report formats."""
+    monkeypatch.chdir(tmp_path)
+    log = tmp_path / "app.log"
+    log.write_text(LOG)
+
+    assert main([str(log), "--no-diagnose", "-o", "report.jsonl"]) == 0
+    rows = [json.loads(line) for line in (tmp_path / "report.jsonl").read_text().splitlines()]
+    assert [(row["count"], row["diagnosis"]) for row in rows] == [(2, None), (1, None)]
+    assert "3 tracebacks, 2 distinct" in capsys.readouterr().err
+
+    assert main([str(log), "--no-diagnose", "-o", "report.html"]) == 0
+    page = (tmp_path / "report.html").read_text()
+    assert "<td>2</td>" in page and "KeyError: &#x27;user_17&#x27;" in page
@@ -0,0 +1,105 @@
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.metrics import Histogram, Metrics
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+import re
+
+
+def _error():
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError as e:
+        return e
+
+
+def _diagnoser(**overrides):
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(max_retries=0, **overrides), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = MagicMock(
+        message=MagicMock(content="Test diagnosis"), prompt_eval_count=120, eval_count=30
+    )
+    return diagnoser
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that bucket counts are cumulative and include the overflow bucket."""
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(seconds)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 1, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == 6.05
+
+
+def test_stats_snapshot():
+    """Test that latencies, token usage and cache hit rates are recorded."""
+    diagnoser = _diagnoser()
+    error = _error()
+    diagnoser.diagnose(error)
+    diagnoser.diagnose(error)
+
+    stats = diagnoser.stats()
+    counters = stats["counters"]
+    assert counters["diagnoses"] == 2
+    assert counters["provider_requests"] == 1
+    assert counters["prompt_tokens"] == 120
+    assert counters["completion_tokens"] == 30
+    assert stats["cache_hit_rate"] == 0.5
+    assert stats["latency"]["provider"]["count"] == 1
+    assert stats["latency"]["prompt_build"]["count"] == 1
+    assert stats["latency"]["diagnosis"]["count"] == 2
+
+
+def test_errors_and_timeouts_are_counted():
+    """Test that failed provider attempts are counted, with timeouts separately."""
+    diagnoser = _diagnoser(cache_enabled=False)
+    diagnoser.sync_client.chat.side_effect = [TimeoutError("slow"), ValueError("bad")]
+    diagnoser.diagnose(_error())
+    diagnoser.diagnose(_error())
+
+    counters = diagnoser.stats()["counters"]
+    assert counters["provider_errors"] == 2
+    assert counters["provider_timeouts"] == 1
+
+
+def test_prometheus_text():
+    """Test that the Prometheus exposition includes histograms, counters and gauges."""
+    diagnoser = _diagnoser()
+    diagnoser.diagnose(_error())
+
+    text = diagnoser.prometheus_metrics()
+    assert "# TYPE llm_catcher_provider_seconds histogram" in text
+    assert re.search(r'^llm_catcher_provider_seconds_bucket\{le="\+Inf"\} 1$', text, re.MULTILINE)
+    assert re.search(r"^llm_catcher_prompt_tokens_total 120$", text, re.MULTILINE)
+    assert re.search(r"^llm_catcher_cache_entries 1$", text, re.MULTILINE)
+
+
+def test_disabled_metrics_record_nothing():
+    """Test that nothing is recorded when metrics are disabled."""
+    diagnoser = _diagnoser(metrics_enabled=False)
+    diagnoser.diagnose(_error())
+
+    stats = diagnoser.stats()
+    assert not any(stats["counters"].values())
+    assert stats["latency"]["provider"]["count"] == 0
+
+
+def test_spans_are_sent_to_tracer():
+    """Test that diagnoses and provider calls are traced when a tracer is set."""
+    spans = []
+
+    class Tracer:
+        @contextmanager
+        def start_as_current_span(self, name):
+            span = MagicMock()
+            spans.append((name, span))
+            yield span
+
+    diagnoser = _diagnoser()
+    diagnoser.metrics = Metrics(tracer=Tracer())
+    diagnoser.diagnose(_error())
+
+    assert [name for name, _ in spans] == ["llm_catcher.diagnose", "llm_catcher.provider"]
+    spans[1][1].set_attribute.assert_any_call("llm_catcher.provider", "ollama/qwen2.5-coder")
@@ -0,0 +1,79 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_server import REPLY, MockLLMServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer() as server:
+        yield server
+
+
+def _settings(provider, server, **overrides):
+    if provider == "openai":
+        return Settings(provider="openai", llm_model="gpt-4o-mini", openai_api_key="mock",
+                        base_url=server.url + "/v1", **overrides)
+    return Settings(provider="ollama", base_url=server.url, **overrides)
+
+
+def _error():
+    try:
+        1/0
+    except ZeroDivisionError as e:
+        return e
+
+
+@pytest.mark.parametrize("provider", ["ollama", "openai"])
+def test_real_clients_against_mock_server(provider, server):
+    """Test sync and streaming diagnoses through the real provider SDKs."""
+    diagnoser = LLMExceptionDiagnoser(settings=_settings(provider, server, cache_enabled=False),
+                                      global_handler=False)
+
+    assert diagnoser.diagnose(_error(), formatted=False) == REPLY
+    assert "".join(diagnoser.stream_diagnose(_error(), formatted=False)) == REPLY
+    counters = diagnoser.stats()["counters"]
+    assert counters["prompt_tokens"] > 0
+    assert counters["completion_tokens"] == 2 * len(REPLY.split(" "))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("provider", ["ollama", "openai"])
+async def test_real_async_clients_against_mock_server(provider, server):
+    """Test async diagnoses through the real provider SDKs."""
+    diagnoser = LLMExceptionDiagnoser(settings=_settings(provider, server, cache_enabled=False),
+                                      global_handler=False)
+
+    assert await diagnoser.async_diagnose(_error(), formatted=False) == REPLY
+    assert "".join([chunk async for chunk in diagnoser.astream_diagnose(_error(), formatted=False)]) == REPLY
+
+
+def test_injected_failures_are_retried():
+    """Test that 503s from the server are retried as transient errors."""
+    with MockLLMServer(failure_rate=1.0) as server:
+        diagnoser = LLMExceptionDiagnoser(
+            settings=_settings("ollama", server, max_retries=2, retry_backoff=0.001), global_handler=False
+        )
+        result = diagnoser.diagnose(_error())
+
+    assert result.startswith("Failed to contact LLM for diagnosis")
+    assert server.requests == 3
+
+
+def test_sync_retry_respects_deadline():
+    """Test that a retry after a quick failure only gets the time left before the deadline."""
+    with MockLLMServer(latency=3.0, fail_first=1, failure_latency=0.5) as server:
+        diagnoser = LLMExceptionDiagnoser(
+            settings=_settings("ollama", server, timeout=1.5, retry_backoff=0.001), global_handler=False
+        )
+        started = time.monotonic()
+        result = diagnoser.diagnose(_error(), formatted=False)
+        elapsed = time.monotonic() - started
+
+    assert result.startswith("Failed to contact LLM for diagnosis")
+    assert server.requests == 2
+    assert elapsed < 1.8
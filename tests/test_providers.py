@@ -0,0 +1,145 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings, providers
+from llm_catcher.providers import Backend, LatencyTracker
+from unittest.mock import MagicMock, patch
+import asyncio
+import time
+
+
+def _error():
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError as e:
+        return e
+
+
+def _openai_reply(text):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=text))])
+
+
+def _diagnoser(**overrides):
+    backends = [Backend(provider="openai", llm_model="gpt-4o-mini", openai_api_key="test-key")]
+    settings = Settings(cache_enabled=False, max_retries=0, backends=backends, **overrides)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.providers[1].sync_client = MagicMock()
+    diagnoser.providers[1].sync_client.chat.completions.create.return_value = _openai_reply("from openai")
+    return diagnoser
+
+
+def test_backends_from_environment(monkeypatch):
+    """Test that extra backends can be configured as JSON in the environment."""
+    monkeypatch.setenv(
+        "LLM_CATCHER_BACKENDS",
+        '[{"provider": "openai", "llm_model": "gpt-4o-mini", "openai_api_key": "test-key"}]',
+    )
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    assert [p.name for p in diagnoser.providers] == ["ollama/qwen2.5-coder", "openai/gpt-4o-mini"]
+
+
+def test_clients_are_shared_with_pool_limits():
+    """Test that diagnosers using the same backend share one client and its connection pool."""
+    settings = Settings(max_connections=7, max_keepalive_connections=3)
+    first = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    second = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+
+    assert first.sync_client is second.sync_client
+    pool = first.sync_client._client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 3
+
+
+@pytest.mark.asyncio
+async def test_async_clients_are_per_event_loop():
+    """Test that async clients are not reused across event loops."""
+    with patch.object(providers, "_create_client", side_effect=lambda *args: MagicMock()):
+        diagnoser = LLMExceptionDiagnoser(global_handler=False)
+        client = diagnoser.async_client
+        assert diagnoser.async_client is client
+
+        other_loop = await asyncio.to_thread(lambda: asyncio.run(_get_async_client(diagnoser)))
+        assert other_loop is not client
+
+
+async def _get_async_client(diagnoser):
+    return diagnoser.async_client
+
+
+def test_failover_to_next_backend():
+    """Test that a failing backend falls over to the next one."""
+    diagnoser = _diagnoser()
+    diagnoser.sync_client.chat.side_effect = ConnectionError("refused")
+
+    assert diagnoser.diagnose(_error(), formatted=False) == "from openai"
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+def test_open_circuit_skips_backend():
+    """Test that a backend whose circuit is open isn't called at all."""
+    diagnoser = _diagnoser(breaker_failure_threshold=1)
+    diagnoser.sync_client.chat.side_effect = ConnectionError("refused")
+    diagnoser.diagnose(_error())
+
+    assert diagnoser.diagnose(_error(), formatted=False) == "from openai"
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+def test_all_backends_failing_reports_last_error():
+    """Test that the last backend's error is reported when every backend fails."""
+    diagnoser = _diagnoser()
+    diagnoser.sync_client.chat.side_effect = ConnectionError("refused")
+    diagnoser.providers[1].sync_client.chat.completions.create.side_effect = RuntimeError("quota")
+
+    assert "quota" in diagnoser.diagnose(_error())
+
+
+def test_latency_percentile():
+    """Test that percentiles need enough samples and pick the right one."""
+    tracker = LatencyTracker()
+    for seconds in range(1, 11):
+        tracker.record(seconds)
+    assert tracker.percentile(90) == 9
+    assert tracker.percentile(50) == 5
+    assert tracker.percentile(90, min_samples=20) is None
+
+
+def test_hedged_request_uses_faster_backend():
+    """Test that a slow backend is hedged with the next one after its latency percentile."""
+    diagnoser = _diagnoser(hedge_percentile=95, hedge_min_samples=1)
+    diagnoser.providers[0].latency.record(0.01)
+
+    def slow_chat(**kwargs):
+        time.sleep(0.5)
+        return MagicMock(message=MagicMock(content="from ollama"))
+
+    diagnoser.sync_client.chat.side_effect = slow_chat
+
+    started = time.monotonic()
+    assert diagnoser.diagnose(_error(), formatted=False) == "from openai"
+    assert time.monotonic() - started < 0.4
+
+
+@pytest.mark.asyncio
+async def test_async_hedged_request_cancels_slower_backend():
+    """Test that the async hedge takes the first answer and cancels the other request."""
+    diagnoser = _diagnoser(hedge_percentile=95, hedge_min_samples=1)
+    diagnoser.providers[0].latency.record(0.01)
+    cancelled = asyncio.Event()
+
+    async def slow_chat(**kwargs):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def fast_create(**kwargs):
+        return _openai_reply("from openai")
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = MagicMock(side_effect=slow_chat)
+    diagnoser.providers[1].async_client = MagicMock()
+    diagnoser.providers[1].async_client.chat.completions.create = MagicMock(side_effect=fast_create)
+
+    assert await diagnoser.async_diagnose(_error(), formatted=False) == "from openai"
+    await asyncio.wait_for(cancelled.wait(), 1)
@@ -0,0 +1,116 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.resilience import CircuitBreaker, backoff_delays, is_transient
+from unittest.mock import MagicMock, patch
+import asyncio
+import itertools
+import time
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def _error():
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError as e:
+        return e
+
+
+def _diagnoser(**overrides):
+    settings = Settings(cache_enabled=False, retry_backoff=0.001, **overrides)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    return diagnoser
+
+
+def test_is_transient():
+    """Test which provider errors are considered worth retrying."""
+    assert is_transient(ConnectionError())
+    assert is_transient(TimeoutError())
+    assert is_transient(_StatusError(503))
+    assert is_transient(_StatusError(429))
+    assert not is_transient(_StatusError(401))
+    assert not is_transient(ValueError())
+
+
+def test_backoff_delays_are_capped():
+    """Test that jittered delays grow exponentially up to the cap."""
+    with patch("llm_catcher.resilience.random.uniform", side_effect=lambda low, high: high):
+        assert list(itertools.islice(backoff_delays(0.5, 3.0), 5)) == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """Test that the breaker opens after N failures and closes after a successful probe."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    with patch("llm_catcher.resilience.time.monotonic", return_value=0.0):
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+    with patch("llm_catcher.resilience.time.monotonic", return_value=11.0):
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_transient_errors_are_retried():
+    """Test that a transient error is retried and the retry's diagnosis returned."""
+    diagnoser = _diagnoser(max_retries=2)
+    diagnoser.sync_client.chat.side_effect = [
+        ConnectionError("reset"),
+        MagicMock(message=MagicMock(content="Test diagnosis")),
+    ]
+
+    assert diagnoser.diagnose(_error(), formatted=False) == "Test diagnosis"
+    assert diagnoser.sync_client.chat.call_count == 2
+
+
+def test_non_transient_errors_are_not_retried():
+    """Test that a permanent error fails without retrying."""
+    diagnoser = _diagnoser(max_retries=2)
+    diagnoser.sync_client.chat.side_effect = _StatusError(401)
+
+    assert diagnoser.diagnose(_error()).startswith("Failed to contact LLM")
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+def test_open_breaker_short_circuits_to_traceback():
+    """Test that an open breaker returns the traceback without calling the provider."""
+    diagnoser = _diagnoser(max_retries=0, breaker_failure_threshold=2)
+    diagnoser.sync_client.chat.side_effect = ConnectionError("refused")
+
+    diagnoser.diagnose(_error())
+    diagnoser.diagnose(_error())
+    start = time.perf_counter()
+    fallback = diagnoser.diagnose(_error())
+    elapsed = time.perf_counter() - start
+
+    assert fallback.startswith("LLM diagnosis skipped (circuit open)")
+    assert "RuntimeError: boom" in fallback
+    assert diagnoser.sync_client.chat.call_count == 2
+    assert elapsed < 0.1
+
+
+@pytest.mark.asyncio
+async def test_async_deadline():
+    """Test that a slow async provider call is abandoned at the deadline."""
+    diagnoser = _diagnoser(timeout=0.05)
+
+    async def chat(**kwargs):
+        await asyncio.sleep(5)
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = chat
+
+    start = time.perf_counter()
+    result = await diagnoser.async_diagnose(_error())
+
+    assert result.startswith("Failed to contact LLM")
+    assert time.perf_counter() - start < 1
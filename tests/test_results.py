@@ -0,0 +1,125 @@
+import pytest
+from llm_catcher import DiagnosisResult, LLMExceptionDiagnoser, Settings
+from unittest.mock import AsyncMock, MagicMock
+import httpx
+import json
+
+ANSWER = json.dumps({"file": "views.py", "line": "12", "explanation": "The user id is missing.",
+                     "fix": "Check the id first."})
+
+
+def _error():
+    try:
+        {}["user_17"]
+    except KeyError as e:
+        return e
+
+
+def _ollama_response(content):
+    return MagicMock(message=MagicMock(content=content), prompt_eval_count=10, eval_count=5)
+
+
+def test_parse_json_and_free_text():
+    """Test reading JSON answers, fenced or not, and falling back to free text."""
+    result = DiagnosisResult.parse(f"```json\n{ANSWER}\n```", "KeyError: 'user_17'")
+    assert (result.file, result.line, result.fix) == ("views.py", 12, "Check the id first.")
+    assert result.text == "In views.py (line 12): The user id is missing. Fix: Check the id first."
+
+    result = DiagnosisResult.parse('The error is in File "app.py", line 7: the key is missing.', "KeyError")
+    assert (result.file, result.line, result.fix) == ("app.py", 7, None)
+    assert result.explanation.startswith("The error is in")
+
+
+def test_diagnose_result_requests_json_and_caches():
+    """Test that structured diagnoses use JSON mode and the limits, and are cached apart from text ones."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(max_tokens=200, stop=["\n\n\n"]), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = _ollama_response(ANSWER)
+
+    first = diagnoser.diagnose_result(_error())
+    second = diagnoser.diagnose_result(_error())
+
+    request = diagnoser.sync_client.chat.call_args.kwargs
+    assert request["format"] == "json"
+    assert request["options"] == {"num_predict": 200, "stop": ["\n\n\n"]}
+    assert "JSON object" in request["messages"][0]["content"]
+    assert (first.error, first.file, first.line, first.source) == ("KeyError: 'user_17'", "views.py", 12, "llm")
+    assert second.source == "cache" and second.as_dict()["explanation"] == "The user id is missing."
+
+    diagnoser.sync_client.chat.return_value = _ollama_response("Check the id first.")
+    assert diagnoser.diagnose(_error(), formatted=False) == "Check the id first."
+    assert "format" not in diagnoser.sync_client.chat.call_args.kwargs
+    assert diagnoser.sync_client.chat.call_count == 2
+
+
+@pytest.mark.parametrize("model, reasoning_max_tokens, limits", [
+    ("gpt-4o", None, {"max_tokens": 300}),
+    ("o1-mini", None, {}),
+    ("o3", 4000, {"max_completion_tokens": 4000}),
+])
+def test_openai_request_options(model, reasoning_max_tokens, limits):
+    """Test that reasoning models don't get the answer-sized token limit, which reasoning would use up."""
+    settings = Settings(provider="openai", openai_api_key="sk-test", llm_model=model, max_tokens=300,
+                        reasoning_max_tokens=reasoning_max_tokens)
+    provider = LLMExceptionDiagnoser(settings=settings, global_handler=False).providers[0]
+
+    request = provider._request("prompt", json_mode=True)
+
+    assert {name: request[name] for name in ("max_tokens", "max_completion_tokens") if name in request} == limits
+    assert request["response_format"] == {"type": "json_object"}
+    assert "stop" not in request
+
+
+def _bad_request(openai, message):
+    return openai.BadRequestError(
+        message,
+        response=httpx.Response(400, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")),
+        body={"message": message, "type": "invalid_request_error"},
+    )
+
+
+def test_openai_json_mode_rejected():
+    """Test that a model rejecting JSON mode is asked again without it, and not asked with it after."""
+    openai = pytest.importorskip("openai")
+    settings = Settings(provider="openai", openai_api_key="sk-test", llm_model="gpt-4")
+    provider = LLMExceptionDiagnoser(settings=settings, global_handler=False).providers[0]
+    rejected = _bad_request(openai, "'response_format' of type 'json_object' is not supported with this model.")
+    answer = MagicMock(choices=[MagicMock(message=MagicMock(content=ANSWER))], usage=None)
+    provider.sync_client = MagicMock()
+    provider.sync_client.chat.completions.create.side_effect = [rejected, answer, answer]
+
+    assert provider.complete("prompt", timeout=10, json_mode=True)[0] == ANSWER
+    assert provider.complete("prompt", json_mode=True)[0] == ANSWER
+
+    requests = [call.kwargs for call in provider.sync_client.chat.completions.create.call_args_list]
+    assert "response_format" in requests[0]
+    assert "response_format" not in requests[1] and 0 < requests[1]["timeout"] <= 10
+    assert "response_format" not in requests[2]
+
+
+def test_openai_other_bad_request_keeps_json_mode():
+    """Test that a bad request unrelated to JSON mode is raised as is, without a second request."""
+    openai = pytest.importorskip("openai")
+    settings = Settings(provider="openai", openai_api_key="sk-test", llm_model="gpt-4o")
+    provider = LLMExceptionDiagnoser(settings=settings, global_handler=False).providers[0]
+    provider.sync_client = MagicMock()
+    provider.sync_client.chat.completions.create.side_effect = _bad_request(
+        openai, "This model's maximum context length is 128000 tokens.")
+
+    with pytest.raises(openai.BadRequestError):
+        provider.complete("prompt", json_mode=True)
+
+    assert provider.sync_client.chat.completions.create.call_count == 1
+    assert provider.json_mode is True
+
+
+@pytest.mark.asyncio
+async def test_async_diagnose_result_failure():
+    """Test that a failed diagnosis is reported in the result instead of raised."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(max_retries=0), global_handler=False)
+    diagnoser.providers[0].acomplete = AsyncMock(side_effect=ValueError("model not found"))
+
+    result = await diagnoser.async_diagnose_result(_error())
+
+    assert result.source == "failed" and "model not found" in result.explanation
+    assert result.file is None and result.elapsed >= 0
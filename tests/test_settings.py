@@ -0,0 +1,69 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser
+from llm_catcher.settings import clear_settings_cache, get_settings, load_config_file, reload_settings
+import json
+import os
+import time
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Run in an empty directory with an empty home, returning a writer for the local config file."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    path = tmp_path / "llm_catcher_config.json"
+
+    def write(**values):
+        path.write_text(json.dumps(values))
+        # Make sure the change is visible even on filesystems with coarse timestamps
+        mtime = time.time() + len(values) + len(path.read_text())
+        os.utime(path, (mtime, mtime))
+    yield write
+    clear_settings_cache()
+
+
+def test_settings_are_loaded_once(config):
+    """Test that callers share one Settings object until it is explicitly reloaded."""
+    config(llm_model="codellama")
+    settings = get_settings()
+    config(llm_model="qwen2.5-coder:14b")
+
+    assert get_settings() is settings and settings.llm_model == "codellama"
+    assert load_config_file() == {"llm_model": "qwen2.5-coder:14b"}
+    assert reload_settings()
+    assert get_settings() is settings and settings.llm_model == "qwen2.5-coder:14b"
+    assert not reload_settings()
+
+
+def test_invalid_config_file_is_skipped(config, tmp_path):
+    """Test that a config file that fails validation falls through to the next one."""
+    (tmp_path / "config.json").write_text(json.dumps({"llm_model": "codellama"}))
+    config(provider="openai")
+
+    assert get_settings().llm_model == "codellama"
+
+
+def test_diagnosers_follow_reloads(config):
+    """Test that diagnosers using the shared settings see reloaded values unless they changed their own."""
+    config(llm_model="codellama")
+    shared = LLMExceptionDiagnoser(global_handler=False)
+    own = LLMExceptionDiagnoser(global_handler=False)
+    own.llm_model = "mistral"
+
+    config(llm_model="qwen2.5-coder:14b")
+    reload_settings()
+
+    assert shared.providers[0].name == "ollama/qwen2.5-coder:14b"
+    assert own.providers[0].name == "ollama/mistral"
+
+
+def test_config_files_are_watched(config):
+    """Test that changed config files are applied automatically with config_reload_interval set."""
+    config(llm_model="codellama", config_reload_interval=0.01)
+    settings = get_settings()
+    config(llm_model="mistral", config_reload_interval=0.01, temperature=0.5)
+
+    deadline = time.monotonic() + 2
+    while settings.llm_model != "mistral" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert settings.llm_model == "mistral"
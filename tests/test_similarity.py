@@ -0,0 +1,148 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.similarity import MinHashEmbedder, SimilarityIndex, similarity_text
+from unittest.mock import AsyncMock, MagicMock
+import itertools
+import threading
+
+np = pytest.importorskip("numpy")
+
+
+def _lookup(key):
+    return {}[key]
+
+
+def _load(key):
+    return _lookup(key)
+
+
+def _profile(key):
+    return _load(key)
+
+
+def _error(key):
+    try:
+        _profile(key)
+    except KeyError as e:
+        return e
+
+
+def _other_error():
+    try:
+        int("not a number")
+    except ValueError as e:
+        return e
+
+
+def test_similarity_text_ignores_volatile_details():
+    """Test that messages are normalized and line numbers and directories left out."""
+    text = similarity_text(_error("user_12345"))
+
+    assert text.startswith("KeyError: ")
+    assert "12345" not in text
+    assert "KeyError@test_similarity.py:_lookup" in text
+    assert "/" not in text
+
+
+def test_minhash_estimates_jaccard():
+    """Test that identical texts agree fully and errors of another type don't agree."""
+    embedder = MinHashEmbedder()
+    a = embedder.embed(similarity_text(_error("a")))
+
+    assert (a == embedder.embed(similarity_text(_error("a")))).mean() == 1.0
+    assert (a == embedder.embed(similarity_text(_other_error()))).mean() < 0.1
+
+
+def test_index_top_k_and_threshold():
+    """Test that lookups return the closest entry only when it clears the threshold."""
+    index = SimilarityIndex(MinHashEmbedder(), max_entries=10)
+    index.add(similarity_text(_error("a")), "missing key")
+    index.add(similarity_text(_other_error()), "bad int")
+
+    matches = index.query(similarity_text(_error("b")), k=2)
+    assert [m.diagnosis for m in matches] == ["missing key", "bad int"]
+    assert matches[0].score > matches[1].score
+    assert index.lookup(similarity_text(_error("b"))).diagnosis == "missing key"
+    assert index.lookup("RuntimeError: something else entirely\nserver.py handle") is None
+    assert index.stats() == {"size": 2, "hits": 1, "misses": 1}
+
+
+def test_index_overwrites_oldest_when_full():
+    """Test that the index stays within max_entries."""
+    index = SimilarityIndex(MinHashEmbedder(), max_entries=3)
+    for i in range(5):
+        index.add(f"Error{i}: message {i}", f"diagnosis {i}")
+
+    assert len(index) == 3
+    assert index.query("Error4: message 4")[0].diagnosis == "diagnosis 4"
+    assert index.query("Error0: message 0")[0].score < 1.0
+
+
+def test_diagnoser_reuses_similar_diagnosis():
+    """Test that a near-duplicate error reuses the stored diagnosis, marked as reused."""
+    settings = Settings(similarity_enabled=True, cache_enabled=False)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.providers[0].complete = MagicMock(return_value=("Add the key before reading it.", (10, 5)))
+
+    first = diagnoser.diagnose(_error("a"), formatted=False)
+    # A different key gives a different fingerprint, so the exact cache can't answer it
+    second = diagnoser.diagnose(_error("b"), formatted=False)
+    other = diagnoser.diagnose(_other_error(), formatted=False)
+
+    assert first == "Add the key before reading it."
+    assert second.startswith("[Reused diagnosis of a similar error (similarity ")
+    assert second.endswith(first)
+    assert other == first
+    assert diagnoser.providers[0].complete.call_count == 2
+    assert diagnoser.stats()["counters"]["similar_hits"] == 1
+
+
+def test_ollama_embeddings():
+    """Test that the ollama method compares normalized embedding vectors."""
+    vectors = {"a": [1.0, 0.0], "b": [0.9, 0.1], "c": [0.0, 1.0]}
+    client = MagicMock()
+    client.embed.side_effect = lambda model, input: MagicMock(embeddings=[vectors[input]])
+    settings = Settings(similarity_enabled=True, similarity_method="ollama", similarity_threshold=0.9)
+    index = SimilarityIndex.from_settings(settings, lambda: client)
+
+    index.add("a", "diagnosis a")
+    assert index.lookup("b").diagnosis == "diagnosis a"
+    assert index.lookup("c") is None
+    assert client.embed.call_args.kwargs["model"] == "nomic-embed-text"
+
+
+@pytest.mark.asyncio
+async def test_async_model_embeddings_leave_event_loop():
+    """Test that async diagnoses embed with a model in worker threads, not on the event loop."""
+    settings = Settings(similarity_enabled=True, similarity_method="ollama", similarity_threshold=0.9)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.providers[0].acomplete = AsyncMock(return_value=("## ERROR 1\nFirst\n## ERROR 2\nSecond", (10, 5)))
+
+    async def astream(prompt, on_usage):
+        yield "Streamed diagnosis"
+
+    diagnoser.providers[0].astream = astream
+    axes = itertools.count()
+    threads = []
+
+    def embed(text):
+        # Every text gets its own axis, so nothing is similar enough to reuse
+        threads.append(threading.get_ident())
+        return np.eye(16, dtype=np.float32)[next(axes)]
+
+    diagnoser.similarity.embedder.embed = embed
+
+    await diagnoser.async_diagnose(_error("a"), formatted=False)
+    [chunk async for chunk in diagnoser.astream_diagnose(_other_error(), formatted=False)]
+    await diagnoser.adiagnose_many([_error("b"), ZeroDivisionError("c")], formatted=False)
+
+    # A lookup and an add for each of the four errors
+    assert len(threads) == 8
+    assert threading.get_ident() not in threads
+
+
+def test_disabled_by_default():
+    """Test that no index is built unless enabled."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(), global_handler=False)
+    assert diagnoser.similarity is None
+    assert diagnoser.stats()["similarity"] is None
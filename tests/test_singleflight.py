@@ -0,0 +1,124 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.singleflight import SingleFlight
+from unittest.mock import MagicMock
+import asyncio
+import threading
+import time
+
+
+def _error():
+    try:
+        raise ConnectionError("upstream refused connection")
+    except ConnectionError as e:
+        return e
+
+
+@pytest.mark.asyncio
+async def test_concurrent_async_diagnoses_are_coalesced():
+    """Test that concurrent identical async diagnoses share one LLM request."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    calls = 0
+
+    async def chat(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return MagicMock(message=MagicMock(content="Shared diagnosis"))
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = chat
+
+    results = await asyncio.gather(*(diagnoser.async_diagnose(_error(), formatted=False) for _ in range(20)))
+
+    assert results == ["Shared diagnosis"] * 20
+    assert calls == 1
+    assert diagnoser.inflight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 19}
+
+
+def test_concurrent_threads_are_coalesced():
+    """Test that sync threads wait for the in-flight call instead of starting their own."""
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = 0
+
+    def slow():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results == ["result"] * 6
+    assert calls == 1
+    assert flight.coalesced == 5
+
+
+@pytest.mark.asyncio
+async def test_async_followers_receive_leader_exception():
+    """Test that a failing leader call fails all coalesced callers."""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    results = await asyncio.gather(*(flight.ado("key", failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_sync_thread_joins_async_leader():
+    """Test that a sync thread can wait on a call led by an async task."""
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.1)
+        return "result"
+
+    leader = asyncio.create_task(flight.ado("key", slow))
+    await started.wait()
+    follower = await asyncio.to_thread(flight.do, "key", lambda: "duplicate")
+
+    assert follower == "result"
+    assert await leader == "result"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_over_to_follower():
+    """Test that cancelling the leader doesn't cancel its followers, which run the call themselves."""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        started.set()
+        await asyncio.sleep(0.05)
+        return "result"
+
+    leader = asyncio.create_task(flight.ado("key", slow))
+    await started.wait()
+    followers = [asyncio.create_task(flight.ado("key", slow)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await asyncio.gather(*followers) == ["result"] * 3
+    assert leader.cancelled()
+    assert calls == 2
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,136 @@
+import pytest
+from llm_catcher import ExceptionSnapshot, LLMExceptionDiagnoser, Settings
+from llm_catcher.fingerprint import fingerprint_exception
+from unittest.mock import AsyncMock, MagicMock
+import gc
+import pickle
+import traceback
+import weakref
+
+
+class Payload:
+    pass
+
+
+class LookupFailed(Exception):
+    """Printed in tracebacks with its module, unlike builtin exceptions."""
+
+
+def _load(payload):
+    raise KeyError("user_17")
+
+
+def _chained_error(payload=None):
+    try:
+        try:
+            _load(payload)
+        except KeyError as e:
+            raise RuntimeError("lookup failed") from e
+    except RuntimeError as e:
+        return e
+
+
+def test_capture_chain():
+    """Test that the chain, frames, source lines and fingerprint are captured."""
+    error = _chained_error()
+    snapshot = ExceptionSnapshot.capture(error)
+
+    assert snapshot.summary == "RuntimeError: lookup failed"
+    assert snapshot.link == "cause"
+    assert snapshot.cause.summary == "KeyError: 'user_17'"
+    assert snapshot.cause.frames[-1][2:] == ("_load", 'raise KeyError("user_17")')
+    assert snapshot.fingerprint == fingerprint_exception(error)
+    assert "The above exception was the direct cause" in snapshot.format()
+
+
+def test_serialization_round_trips():
+    """Test that snapshots survive JSON and pickle."""
+    snapshot = ExceptionSnapshot.capture(_chained_error(), include_locals=True)
+
+    assert ExceptionSnapshot.from_json(snapshot.to_json()) == snapshot
+    assert pickle.loads(pickle.dumps(snapshot)) == snapshot
+    assert "payload = None" in snapshot.locals
+
+
+def test_release_frees_frames():
+    """Test that release drops the traceback and the objects its frames referenced."""
+    payload = Payload()
+    ref = weakref.ref(payload)
+    error = _chained_error(payload)
+    del payload
+
+    snapshot = ExceptionSnapshot.capture(error, include_locals=True, release=True)
+    gc.collect()
+
+    assert ref() is None
+    assert error.__traceback__ is None
+    assert "Payload object" in snapshot.locals
+
+
+def test_from_text_matches_live_exception():
+    """Test that parsing a formatted traceback recovers the chain and the live fingerprint."""
+    error = _chained_error()
+    text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    snapshot = ExceptionSnapshot.from_text(text)
+
+    assert snapshot.fingerprint == fingerprint_exception(error)
+    assert snapshot.summary == "RuntimeError: lookup failed"
+    assert snapshot.link == "cause"
+    assert snapshot.cause.frames[-1][2:] == ("_load", 'raise KeyError("user_17")')
+    assert ExceptionSnapshot.from_text(snapshot.format()) == snapshot
+
+
+def test_from_text_without_traceback():
+    """Test that text that isn't a traceback is kept as the message."""
+    snapshot = ExceptionSnapshot.from_text("worker crashed: out of memory (pid 7)")
+    assert snapshot.summary == "worker crashed: out of memory (pid 7)"
+    assert snapshot.frames == []
+
+
+@pytest.fixture
+def diagnoser():
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(), global_handler=False)
+    diagnoser.providers[0].complete = MagicMock(return_value=("Check the user exists.", (10, 5)))
+    diagnoser.providers[0].acomplete = AsyncMock(return_value=("Check the user exists.", (10, 5)))
+    return diagnoser
+
+
+def test_diagnose_accepts_snapshots_and_text(diagnoser):
+    """Test that a live exception, its snapshot and its text share one diagnosis."""
+    error = _chained_error()
+    text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    snapshot = ExceptionSnapshot.from_json(ExceptionSnapshot.capture(error).to_json())
+
+    results = [diagnoser.diagnose(item, formatted=False) for item in (snapshot, text, error)]
+
+    assert results == ["Check the user exists."] * 3
+    assert diagnoser.providers[0].complete.call_count == 1
+    prompt = diagnoser.providers[0].complete.call_args.args[0]
+    assert "KeyError: 'user_17'" in prompt and "RuntimeError: lookup failed" in prompt
+
+
+def test_module_exception_types_share_diagnosis(diagnoser):
+    """Test that an exception type defined outside builtins gets one fingerprint in all three forms."""
+    try:
+        _load(None)
+    except KeyError as e:
+        try:
+            raise LookupFailed("user 17 not found") from e
+        except LookupFailed as e:
+            error = e
+    text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    assert f"{__name__}.LookupFailed: user 17 not found" in text
+
+    assert ExceptionSnapshot.capture(error).fingerprint == ExceptionSnapshot.from_text(text).fingerprint
+    assert [diagnoser.diagnose(item, formatted=False) for item in (error, text)] == ["Check the user exists."] * 2
+    assert diagnoser.providers[0].complete.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_diagnose_includes_snapshot_locals(diagnoser):
+    """Test that locals captured in a snapshot reach the prompt."""
+    snapshot = ExceptionSnapshot.capture(_chained_error("token-123"), include_locals=True)
+
+    assert await diagnoser.async_diagnose(snapshot, formatted=False) == "Check the user exists."
+    prompt = diagnoser.providers[0].acomplete.call_args.args[0]
+    assert "Local variables in the failing frame" in prompt and "'token-123'" in prompt
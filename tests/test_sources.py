@@ -0,0 +1,100 @@
+from llm_catcher import ExceptionSnapshot, LLMExceptionDiagnoser, Settings
+from llm_catcher.sources import SourceCache, source_context
+from unittest.mock import MagicMock
+import os
+
+MODULE = """\
+import json
+
+
+def load(raw):
+    config = json.loads(raw)
+    return config["name"]
+
+
+def handler(raw):
+    # Called for every request
+    return load(raw)
+"""
+
+
+def _error(tmp_path, raw="{bad"):
+    path = tmp_path / "app.py"
+    path.write_text(MODULE)
+    namespace = {}
+    exec(compile(MODULE, str(path), "exec"), namespace)
+    try:
+        namespace["handler"](raw)
+    except Exception as e:
+        return e
+
+
+def test_cache_reads_lines_and_follows_edits(tmp_path):
+    """Test line lookups, including a last line without a newline, and re-reading edited files."""
+    path = tmp_path / "module.py"
+    path.write_text("one\ntwo\nthree")
+    cache = SourceCache()
+
+    assert cache.lines(str(path), 2, 5) == ["two", "three"]
+    assert cache.lines(str(path), 1, 1) == ["one"]
+    assert cache.stats()["hits"] == 1
+
+    path.write_text("uno\ndos\n")
+    os.utime(path, ns=(1, 1))
+    assert cache.lines(str(path), 1, 3) == ["uno", "dos"]
+    assert cache.lines(str(tmp_path / "missing.py"), 1, 3) == []
+
+
+def test_cache_stays_within_budget(tmp_path):
+    """Test that least recently used files are dropped once the budget is used up."""
+    cache = SourceCache(max_bytes=600)
+    for name in "abcde":
+        (tmp_path / f"{name}.py").write_text("x = 1\n" * 10)
+        cache.lines(str(tmp_path / f"{name}.py"), 1, 1)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 600 and stats["files"] == 4
+    (tmp_path / "big.py").write_text("x = 1\n" * 100)
+    assert cache.lines(str(tmp_path / "big.py"), 100, 100) == ["x = 1"]
+    assert cache.stats()["files"] == 4
+
+
+def test_source_context_skips_library_frames(tmp_path):
+    """Test that only project frames get context, innermost first, for exceptions and snapshots."""
+    error = _error(tmp_path)
+    context = source_context(error, SourceCache(), lines=1)
+
+    assert context.startswith("Source code around the failing lines")
+    assert 'File "app.py", line 5, in load:\n  4 | def load(raw):\n> 5 |     config = json.loads(raw)\n' in context
+    assert context.index("in load") < context.index("in handler")
+    assert "decoder.py" not in context
+    assert source_context(ExceptionSnapshot.capture(error), SourceCache(), lines=1) == context
+    innermost = source_context(error, SourceCache(), lines=1, max_frames=1)
+    assert "in load" in innermost and "in handler" not in innermost
+
+
+def test_prompt_includes_source_context(tmp_path):
+    """Test that enabling source_context adds the surrounding code to the prompt."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(source_context=True, source_context_lines=2),
+                                      global_handler=False)
+    diagnoser.providers[0].complete = MagicMock(return_value=("Fix the JSON.", (10, 5)))
+
+    diagnoser.diagnose(_error(tmp_path), formatted=False)
+
+    prompt = diagnoser.providers[0].complete.call_args.args[0]
+    assert '> 11 |     return load(raw)' in prompt and "# Called for every request" in prompt
+    assert diagnoser.stats()["sources"]["files"] >= 1
+
+
+def test_batch_prompt_includes_source_context_and_locals(tmp_path):
+    """Test that batched errors get the same source context and snapshot locals as single prompts."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(source_context=True, source_context_lines=2,
+                                                        cache_enabled=False), global_handler=False)
+    diagnoser.providers[0].complete = MagicMock(return_value=("### ERROR 1\nBad JSON.\n### ERROR 2\nNo name.", (10, 5)))
+    snapshot = ExceptionSnapshot.capture(_error(tmp_path, raw="{}"), include_locals=True)
+
+    diagnoser.diagnose_many([_error(tmp_path), snapshot], formatted=False)
+
+    prompt = diagnoser.providers[0].complete.call_args.args[0]
+    assert prompt.count("> 11 |     return load(raw)") == 2
+    assert "Local variables in the failing frame:" in prompt and "config = {}" in prompt
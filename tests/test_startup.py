@@ -0,0 +1,41 @@
+from llm_catcher import LLMExceptionDiagnoser, providers
+from unittest.mock import MagicMock, patch
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_modules(code, modules):
+    check = f"import sys; {code}; print(sorted(m for m in {modules!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_import_is_lazy():
+    """Test that importing the package doesn't load the provider SDKs or settings."""
+    assert _loaded_modules("import llm_catcher", ("openai", "ollama", "pydantic_settings")) == "[]"
+
+
+def test_construction_does_not_load_provider_sdks():
+    """Test that constructing a diagnoser doesn't load the provider SDKs."""
+    code = "from llm_catcher import LLMExceptionDiagnoser; LLMExceptionDiagnoser(global_handler=False)"
+    assert _loaded_modules(code, ("openai", "ollama")) == "[]"
+
+
+def test_only_the_used_client_is_created():
+    """Test that a sync diagnosis creates only the sync client."""
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    client = MagicMock()
+    client.chat.return_value = MagicMock(message=MagicMock(content="Test diagnosis"))
+
+    with patch.object(providers, "_create_client", return_value=client) as create_client:
+        try:
+            1/0
+        except ZeroDivisionError as e:
+            diagnoser.diagnose(e)
+            diagnoser.diagnose(e)
+
+    create_client.assert_called_once()
+    assert create_client.call_args.args[-1] is False
@@ -0,0 +1,111 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.store import SQLiteDiagnosisStore
+from unittest.mock import AsyncMock, MagicMock, patch
+import multiprocessing
+import threading
+
+
+def _write_entries(path, start, count):
+    store = SQLiteDiagnosisStore(path)
+    for i in range(start, start + count):
+        store.set(f"key-{i}", f"diagnosis {i}")
+    store.close()
+
+
+def test_store_roundtrip(tmp_path):
+    """Test that diagnoses survive reopening the store."""
+    path = str(tmp_path / "diagnoses.db")
+    store = SQLiteDiagnosisStore(path)
+    store.set("key", "diagnosis")
+    store.close()
+
+    reopened = SQLiteDiagnosisStore(path)
+    assert reopened.get("key") == "diagnosis"
+    assert reopened.get("missing") is None
+    assert reopened.stats()["hits"] == 1
+    assert reopened.stats()["misses"] == 1
+
+
+def test_store_concurrent_writers(tmp_path):
+    """Test that several processes can write to the same store."""
+    path = str(tmp_path / "diagnoses.db")
+    SQLiteDiagnosisStore(path).close()
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_write_entries, args=(path, i * 50, 50)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    store = SQLiteDiagnosisStore(path)
+    assert store.stats()["entries"] == 200
+    assert store.get("key-199") == "diagnosis 199"
+
+
+def test_store_compaction_drops_least_recently_used(tmp_path):
+    """Test that compaction removes the oldest entries until under the size limit."""
+    store = SQLiteDiagnosisStore(str(tmp_path / "diagnoses.db"), max_bytes=1000)
+    for i in range(20):
+        with patch("llm_catcher.store.time.time", return_value=1000.0 + i):
+            store.set(f"key-{i:02d}", "x" * 94)
+
+    deleted = store.compact()
+
+    assert deleted > 0
+    assert store.size() <= 800
+    assert store.get("key-00") is None
+    assert store.get("key-19") == "x" * 94
+
+
+def test_store_ttl(tmp_path):
+    """Test that expired diagnoses are not returned."""
+    store = SQLiteDiagnosisStore(str(tmp_path / "diagnoses.db"), ttl=10)
+    with patch("llm_catcher.store.time.time", return_value=1000.0):
+        store.set("key", "diagnosis")
+    with patch("llm_catcher.store.time.time", return_value=1011.0):
+        assert store.get("key") is None
+
+
+def test_diagnosers_share_store(tmp_path):
+    """Test that one diagnoser's result serves another diagnoser through the store."""
+    settings = Settings(store_path=str(tmp_path / "diagnoses.db"))
+    first = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    first.sync_client = MagicMock()
+    first.sync_client.chat.return_value = MagicMock(message=MagicMock(content="Stored diagnosis"))
+    second = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    second.sync_client = MagicMock()
+
+    def fail():
+        return 1/0
+
+    for diagnoser in (first, second):
+        try:
+            fail()
+        except ZeroDivisionError as e:
+            assert diagnoser.diagnose(e, formatted=False) == "Stored diagnosis"
+
+    second.sync_client.chat.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_store_access_leaves_event_loop(tmp_path):
+    """Test that async diagnoses read and write the store from worker threads, not the event loop."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(store_path=str(tmp_path / "diagnoses.db")),
+                                      global_handler=False)
+    diagnoser.providers[0].acomplete = AsyncMock(return_value=("Stored diagnosis", (10, 5)))
+    threads = []
+    for name in ("get", "set"):
+        original = getattr(diagnoser.store, name)
+        setattr(diagnoser.store, name, lambda *args, _original=original: (
+            threads.append(threading.get_ident()), _original(*args))[1])
+
+    try:
+        {}["user_17"]
+    except KeyError as e:
+        assert await diagnoser.async_diagnose(e, formatted=False) == "Stored diagnosis"
+        assert [d async for d in diagnoser.astream_diagnose(e, formatted=False)] == ["Stored diagnosis"]
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
@@ -0,0 +1,220 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings
+from llm_catcher.providers import Backend
+from llm_catcher.streaming import trim_stream
+from unittest.mock import MagicMock
+import asyncio
+import sys
+import threading
+import time
+
+
+def _error():
+    try:
+        1/0
+    except ZeroDivisionError as e:
+        return e
+
+
+def _ollama_parts(*texts):
+    return [MagicMock(message=MagicMock(content=text)) for text in texts]
+
+
+def _openai_chunk(text):
+    return MagicMock(choices=[MagicMock(delta=MagicMock(content=text))], usage=None)
+
+
+def test_trim_stream_matches_strip():
+    """Test that trimming a stream matches stripping the joined text."""
+    chunks = ["  \n", " Divide", " by ", "zero. ", " \n"]
+    assert "".join(trim_stream(iter(chunks))) == "".join(chunks).strip()
+
+
+def test_stream_diagnose_yields_tokens_in_envelope():
+    """Test that streamed chunks join into the same text diagnose() returns."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = iter(_ollama_parts("Division ", "by zero", "\n"))
+
+    chunks = list(diagnoser.stream_diagnose(_error()))
+
+    assert len(chunks) == 4
+    assert "".join(chunks) == diagnoser._format_diagnosis("Division by zero", True)
+    assert diagnoser.sync_client.chat.call_args.kwargs["stream"] is True
+
+
+def test_stream_diagnose_caches_result():
+    """Test that a completed stream is cached and served whole next time."""
+    diagnoser = LLMExceptionDiagnoser(global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.return_value = iter(_ollama_parts("Division ", "by zero"))
+
+    list(diagnoser.stream_diagnose(_error()))
+
+    assert list(diagnoser.stream_diagnose(_error(), formatted=False)) == ["Division by zero"]
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_astream_diagnose_openai():
+    """Test streaming from the OpenAI async client."""
+    settings = Settings(provider="openai", openai_api_key="sk-test", cache_enabled=False)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+
+    async def stream():
+        for text in ("Division ", "by zero"):
+            yield _openai_chunk(text)
+
+    async def create(**kwargs):
+        return stream()
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat.completions.create = create
+
+    chunks = [chunk async for chunk in diagnoser.astream_diagnose(_error(), formatted=False)]
+
+    assert chunks == ["Division", " by zero"]
+
+
+@pytest.mark.asyncio
+async def test_astream_diagnose_reports_failure():
+    """Test that a stream that times out yields the failure message."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(timeout=0.05), global_handler=False)
+
+    async def stream():
+        yield MagicMock(message=MagicMock(content="Division"))
+        await asyncio.sleep(5)
+
+    async def chat(**kwargs):
+        return stream()
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = chat
+
+    chunks = [chunk async for chunk in diagnoser.astream_diagnose(_error(), formatted=False)]
+
+    assert chunks[0] == "Division"
+    assert chunks[1].startswith("\nFailed to contact LLM")
+    assert len(diagnoser.cache) == 0
+
+
+def test_stream_retries_and_fails_over():
+    """Test that a stream failing before its first chunk is retried, then sent to the next backend."""
+    backends = [Backend(provider="openai", llm_model="gpt-4o-mini", openai_api_key="test-key")]
+    settings = Settings(cache_enabled=False, max_retries=1, retry_backoff=0.001, backends=backends)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.side_effect = ConnectionError("refused")
+    diagnoser.providers[1].sync_client = MagicMock()
+    diagnoser.providers[1].sync_client.chat.completions.create.return_value = iter(
+        [_openai_chunk("Division "), _openai_chunk("by zero")]
+    )
+
+    assert "".join(diagnoser.stream_diagnose(_error(), formatted=False)) == "Division by zero"
+    assert diagnoser.sync_client.chat.call_count == 2
+    assert diagnoser.stats()["counters"]["provider_requests"] == 3
+    assert diagnoser.providers[0].latency.percentile(50) is None
+    assert diagnoser.providers[1].latency.percentile(50) is not None
+
+
+@pytest.mark.asyncio
+async def test_astream_retries_before_first_chunk():
+    """Test that a transient error before the first chunk is retried on the same backend."""
+    settings = Settings(cache_enabled=False, max_retries=1, retry_backoff=0.001)
+    diagnoser = LLMExceptionDiagnoser(settings=settings, global_handler=False)
+    calls = 0
+
+    async def stream():
+        yield MagicMock(message=MagicMock(content="Division by zero"))
+
+    async def chat(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise TimeoutError("slow")
+        return stream()
+
+    diagnoser.async_client = MagicMock()
+    diagnoser.async_client.chat = chat
+
+    chunks = [chunk async for chunk in diagnoser.astream_diagnose(_error(), formatted=False)]
+
+    assert chunks == ["Division by zero"]
+    assert calls == 2
+
+
+def test_concurrent_streams_are_coalesced():
+    """Test that threads streaming the same error share one LLM stream, the followers getting it whole."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    started, release = threading.Event(), threading.Event()
+
+    def parts():
+        yield from _ollama_parts("Division ")
+        started.set()
+        release.wait()
+        yield from _ollama_parts("by zero")
+
+    diagnoser.sync_client = MagicMock()
+    diagnoser.sync_client.chat.side_effect = lambda **kwargs: parts()
+    results = []
+
+    def consume():
+        results.append(list(diagnoser.stream_diagnose(_error(), formatted=False)))
+
+    leader = threading.Thread(target=consume)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=consume) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while diagnoser.inflight.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results[0] == ["Division", " by zero"]
+    assert results[1:] == [["Division by zero"]] * 3
+    assert diagnoser.sync_client.chat.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_diagnose_joins_stream():
+    """Test that a diagnosis requested while the same error is streaming waits for the stream."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    calls = 0
+
+    async def astream(prompt, on_usage):
+        nonlocal calls
+        calls += 1
+        yield "Division "
+        await asyncio.sleep(0.05)
+        yield "by zero"
+
+    diagnoser.providers[0].astream = astream
+
+    async def stream():
+        return [chunk async for chunk in diagnoser.astream_diagnose(_error(), formatted=False)]
+
+    streamed, diagnosed = await asyncio.gather(stream(), diagnoser.async_diagnose(_error(), formatted=False))
+
+    assert streamed == ["Division", " by zero"]
+    assert diagnosed == "Division by zero"
+    assert calls == 1
+
+
+def test_global_handler_streams_to_stderr(capsys):
+    """Test that the global handler writes streamed chunks to stderr."""
+    original_excepthook = sys.excepthook
+    try:
+        diagnoser = LLMExceptionDiagnoser(settings=Settings(stream_to_stderr=True, cache_enabled=False))
+        diagnoser.sync_client = MagicMock()
+        diagnoser.sync_client.chat.return_value = iter(_ollama_parts("Division ", "by zero"))
+
+        error = _error()
+        sys.excepthook(type(error), error, error.__traceback__)
+    finally:
+        sys.excepthook = original_excepthook
+
+    assert "Division by zero" in capsys.readouterr().err
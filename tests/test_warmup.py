@@ -0,0 +1,74 @@
+import pytest
+from llm_catcher import LLMExceptionDiagnoser, Settings, providers
+from unittest.mock import MagicMock, patch
+import time
+
+
+def _error():
+    try:
+        1/0
+    except ZeroDivisionError as e:
+        return e
+
+
+def _response(load_seconds):
+    return MagicMock(message=MagicMock(content="Divide by something else."), load_duration=int(load_seconds * 1e9))
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.chat.return_value = _response(0.01)
+    with patch.object(providers, "_create_client", return_value=client):
+        yield client
+
+
+def test_warmup_loads_model_in_background(client):
+    """Test that creating a diagnoser with warmup loads the model off-thread, with keep_alive."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(warmup=True, keep_alive="30m"), global_handler=False)
+
+    assert _wait_for(lambda: diagnoser.stats()["warmup"]["warmups"] == 1)
+    assert client.chat.call_args.kwargs == {"model": "qwen2.5-coder", "messages": [], "keep_alive": "30m"}
+
+    diagnoser.diagnose(_error())
+    assert client.chat.call_args.kwargs["keep_alive"] == "30m"
+
+
+def test_idle_backends_are_pinged(client):
+    """Test that pings keep an idle model loaded, but skip a model that is in use."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(warmup_interval=0.05), global_handler=False)
+    warmer = diagnoser.warmer
+    try:
+        assert _wait_for(lambda: warmer.stats()["warmups"] == 1)
+        busy_until = time.monotonic() + 0.2
+        while time.monotonic() < busy_until:
+            diagnoser.providers[0].last_used = time.monotonic()
+            time.sleep(0.002)
+        assert warmer.stats()["pings"] == 0
+
+        assert _wait_for(lambda: warmer.stats()["pings"] >= 2)
+    finally:
+        warmer.stop(1)
+
+
+def test_cold_and_warm_requests_are_counted(client):
+    """Test that the model load time Ollama reports marks requests cold or warm."""
+    diagnoser = LLMExceptionDiagnoser(settings=Settings(cache_enabled=False), global_handler=False)
+    client.chat.return_value = _response(12.0)
+    diagnoser.diagnose(_error())
+    client.chat.return_value = _response(0.01)
+    diagnoser.diagnose(_error())
+
+    stats = diagnoser.stats()
+    assert stats["counters"]["cold_model_requests"] == 1
+    assert stats["counters"]["warm_model_requests"] == 1
+    assert stats["latency"]["model_load"]["sum"] == pytest.approx(12.01)
+    assert stats["warmup"] is None
+    assert "llm_catcher_cold_model_requests_total 1" in diagnoser.prometheus_metrics()